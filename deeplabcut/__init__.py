@@ -44,7 +44,10 @@ else:
 #Direct import for convenience
 from deeplabcut.pose_estimation_tensorflow import train_network
 from deeplabcut.pose_estimation_tensorflow import evaluate_network
+from deeplabcut.pose_estimation_tensorflow import export_model, tune_inference, benchmark_session_options, analysis_report, cache_info
 from deeplabcut.pose_estimation_tensorflow import analyze_videos, analyze_time_lapse_frames
+from deeplabcut.pose_estimation_tensorflow import serve, analyze_videos_remote, predict_frames_remote, server_status, shutdown_server
+from deeplabcut.pose_estimation_tensorflow import PoseStream, stream_video
 
 from deeplabcut.utils import create_labeled_video,plot_trajectories, auxiliaryfunctions, convertcsv2h5, analyze_videos_converth5_to_csv
 from deeplabcut.version import __version__, VERSION
@@ -266,6 +266,43 @@ def analyze_videos(_, *args,**kwargs):
     #     predict.predict_video(config, video,**kwargs)
 ###########################################################################################################################
 
+@main.command(context_settings=CONTEXT_SETTINGS)
+@click.argument('config')
+@click.option('-num', '--shuffle', 'shuffles',
+              multiple=True, type=int, default=[1],
+              help='Shuffle index of a network to load (can be given several times). Default is 1.')
+@click.option('--port',
+              default=8765,
+              help='Port of the server (on localhost). Default is 8765.')
+@click.option('--host',
+              default='127.0.0.1',
+              help='Address the server listens on. Default is 127.0.0.1.')
+@click.option('--gputouse',
+              type=int, default=None,
+              help='Number of the GPU to use (see nvidia-smi).')
+@click.option('--maxbatchsize',
+              type=int, default=None,
+              help='Maximal number of frames per network evaluation. Default is the batch_size in config.yaml.')
+@click.option('--maxwait',
+              type=float, default=0.01,
+              help='Seconds to wait for further frame requests to fill a batch. Default is 0.01.')
+@click.pass_context
+def serve(_,config,shuffles,**kwargs):
+
+    """Loads the networks once and serves pose predictions for videos and frame batches.\n
+        CONFIG: Full path of the "config.yaml" file of a project.\n
+
+    Example\n
+    ----------
+
+    python3 dlc.py serve /home/project/reaching/config.yaml --shuffle 1 --shuffle 2 --port 8765
+
+    """
+    from deeplabcut.pose_estimation_tensorflow import server
+    server.serve(config,shuffles=list(shuffles),**kwargs)
+
+###########################################################################################################################
+
 @main.command(context_settings=CONTEXT_SETTINGS)
 @click.argument('config')
 @click.argument('video')
@@ -165,6 +165,8 @@ def create_new_project(project, experimenter, videos, working_directory=None, co
     cfg_file['y1']=277
     cfg_file['y2']=624
     cfg_file['batch_size']=4 #batch size during inference (video - analysis); see https://www.biorxiv.org/content/early/2018/10/30/457242
+    cfg_file['video_backend']='cv2' #video reader for analysis: cv2 or ffmpeg (see deeplabcut/utils/videoreader.py)
+    cfg_file['analysis_cache_size_GB']=10 #maximal size of the analysis cache (see analyze_videos with use_cache=True)
     cfg_file['corner2move2']=(50,50)
     cfg_file['move2corner']=True
     cfg_file['pcutoff']=0.1
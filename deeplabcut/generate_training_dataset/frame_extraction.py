@@ -123,6 +123,7 @@ def extract_frames(config,mode='automatic',algo='kmeans',crop=False,checkcroppin
         videos = cfg['video_sets'].keys()
         if opencv:
             import cv2
+            from deeplabcut.utils.videoreader import OpenVideo
         else:
             from moviepy.editor import VideoFileClip
         for vindex,video in enumerate(videos):
@@ -138,7 +139,7 @@ def extract_frames(config,mode='automatic',algo='kmeans',crop=False,checkcroppin
             if askuser=='y' or askuser=='yes' or askuser=='Ja' or askuser=='ha': # multilanguage support :)
                 #indexlength = int(np.ceil(np.log10(clip.duration * clip.fps)))
                 if opencv:
-                    cap=cv2.VideoCapture(video)
+                    cap=OpenVideo(video,cfg.get('video_backend','cv2'))
                     fps = cap.get(5) #https://docs.opencv.org/2.4/modules/highgui/doc/reading_and_writing_images_and_video.html#videocapture-get
                     nframes = int(cap.get(7))
                     duration=nframes*1./fps
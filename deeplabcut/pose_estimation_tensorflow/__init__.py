@@ -17,10 +17,15 @@ from deeplabcut.pose_estimation_tensorflow.models import *
 from deeplabcut.pose_estimation_tensorflow.nnet import *
 from deeplabcut.pose_estimation_tensorflow.util import *
 
+from deeplabcut.pose_estimation_tensorflow.benchmark import *
+from deeplabcut.pose_estimation_tensorflow.cache import *
 from deeplabcut.pose_estimation_tensorflow.config import *
 from deeplabcut.pose_estimation_tensorflow.default_config import *
 from deeplabcut.pose_estimation_tensorflow.evaluate import *
+from deeplabcut.pose_estimation_tensorflow.export import *
 from deeplabcut.pose_estimation_tensorflow.predict_videos import *
+from deeplabcut.pose_estimation_tensorflow.server import *
+from deeplabcut.pose_estimation_tensorflow.stream import *
 from deeplabcut.pose_estimation_tensorflow.test import *
 from deeplabcut.pose_estimation_tensorflow.train import *
 from deeplabcut.pose_estimation_tensorflow.training import *
@@ -0,0 +1,307 @@
+"""
+DeepLabCut2.0 Toolbox
+https://github.com/AlexEMG/DeepLabCut
+A Mathis, alexander.mathis@bethgelab.org
+T Nath, nath@rowland.harvard.edu
+M Mathis, mackenzie@post.harvard.edu
+
+"""
+
+import os
+import time
+import numpy as np
+import pandas as pd
+
+from deeplabcut.utils import auxiliaryfunctions
+
+
+def PeakMemoryMB():
+    ''' Peak resident set size of this process in MB (None if it cannot be determined, e.g. on Windows). '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    import sys
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin': #bytes on macOS, kilobytes on linux
+        return peak/1024.**2
+    return peak/1024.
+
+def ReadFrames(video,cfg,nframes,startframe=0):
+    ''' Reads nframes (RGB) frames of the video starting at startframe, cropped according to config.yaml. '''
+    from deeplabcut.pose_estimation_tensorflow.predict_videos import GetVideoReader
+    cap=GetVideoReader(video,cfg)
+    if startframe>0:
+        cap.set(1,startframe) # CAP_PROP_POS_FRAMES
+    frames=[]
+    while len(frames)<nframes:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    if len(frames)==0:
+        raise ValueError("Could not read any frames from %s" %video)
+    return np.array(frames)
+
+def TimeInference(frames,dlc_cfg,sess,inputs,outputs,batchsize):
+    ''' Runs the network (incl. pose extraction) over all frames with the given batch size and returns the number of frames per second.
+    One batch is processed before timing (warm-up, e.g. for cuDNN autotuning). '''
+    from deeplabcut.pose_estimation_tensorflow.nnet import predict
+    predict.getposeNP(frames[:batchsize],dlc_cfg,sess,inputs,outputs)
+    start=time.time()
+    for i in range(0,len(frames),batchsize):
+        predict.getposeNP(frames[i:i+batchsize],dlc_cfg,sess,inputs,outputs)
+    return len(frames)/(time.time()-start)
+
+def tune_inference(config,video,shuffle=1,trainingsetindex=0,batchsizes=[1,2,4,8,16,32,64],scales=[1.],nframes=256,startframe=0,gputouse=None,write_config=False):
+    """
+    Times the inference on a short segment of a video for several batch sizes and input resolutions, to find the fastest settings for your hardware.
+    For each setting the achieved frames per second and the peak memory (resident set size of the process and, for GPUs, the peak memory allocated by tensorflow) are reported.
+
+    The batch sizes are tested in increasing order. As the peak resident set size is the maximum since the start of the process, the value reported
+    for a batch size is the peak up to (and including) that batch size.
+
+    Parameters
+    ----------
+    config : string
+        Full path of the config.yaml file as a string.
+
+    video : string
+        Full path of the video used for timing.
+
+    shuffle: int, optional
+        An integer specifying the shuffle index of the training dataset used for training the network. The default is 1.
+
+    trainingsetindex: int, optional
+        Integer specifying which TrainingsetFraction to use. By default the first (note that TrainingFraction is a list in config.yaml).
+
+    batchsizes: list of int, optional
+        Batch sizes to test. The default is [1,2,4,8,16,32,64]
+
+    scales: list of float, optional
+        Factors by which the (cropped) frames are resized before inference. The default is [1.], i.e. full resolution.
+
+    nframes: int, optional
+        Number of frames used for timing. The default is 256.
+
+    startframe: int, optional
+        First frame of the segment. The default is 0.
+
+    gputouse: int, optional. Natural number indicating the number of your GPU (see number in nvidia-smi). If you do not have a GPU put None.
+
+    write_config: bool, optional
+        If True, the fastest batch size (at the first scale in scales) is written to the config.yaml file. The default is ``False``
+
+    Returns a pandas DataFrame with the results.
+
+    Examples
+    --------
+    >>> deeplabcut.tune_inference('/analysis/project/reaching-task/config.yaml','/analysis/project/videos/reachingvideo1.avi')
+    --------
+
+    >>> deeplabcut.tune_inference('/analysis/project/reaching-task/config.yaml','/analysis/project/videos/reachingvideo1.avi',scales=[1.,.5],write_config=True)
+    --------
+
+    """
+    import cv2
+    import tensorflow as tf
+    from deeplabcut.pose_estimation_tensorflow.nnet import predict
+    from deeplabcut.pose_estimation_tensorflow.predict_videos import LoadModelConfig
+
+    if gputouse is not None: #gpu selectinon
+        os.environ['CUDA_VISIBLE_DEVICES'] = str(gputouse)
+
+    cfg = auxiliaryfunctions.read_config(config)
+    trainFraction = cfg['TrainingFraction'][trainingsetindex]
+    dlc_cfg, DLCscorer = LoadModelConfig(cfg,shuffle,trainFraction)
+    sess, inputs, outputs = predict.setup_pose_prediction(dlc_cfg)
+    try:
+        from tensorflow.contrib.memory_stats import MaxBytesInUse
+        with sess.graph.as_default():
+            maxbytes=MaxBytesInUse()
+    except Exception: #not available or no GPU
+        maxbytes=None
+
+    frames=ReadFrames(video,cfg,nframes,startframe)
+    ny,nx=frames.shape[1:3]
+    print("Timing inference on %s frames of size %s x %s" %(len(frames),nx,ny))
+
+    results=[]
+    for scale in scales:
+        if scale!=1:
+            scaledframes=np.array([cv2.resize(frame,(int(round(nx*scale)),int(round(ny*scale))),interpolation=cv2.INTER_AREA) for frame in frames])
+        else:
+            scaledframes=frames
+        for batchsize in sorted(batchsizes):
+            try:
+                fps=TimeInference(scaledframes,dlc_cfg,sess,inputs,outputs,batchsize)
+            except tf.errors.ResourceExhaustedError:
+                print("Scale %s, batch size %s: out of memory!" %(scale,batchsize))
+                break
+            gpupeak=sess.run(maxbytes)/1024.**2 if maxbytes is not None else None
+            results.append([scale,batchsize,fps,PeakMemoryMB(),gpupeak])
+            print("Scale %s, batch size %s: %.1f frames/s" %(scale,batchsize,fps))
+    sess.close()
+
+    results=pd.DataFrame(results,columns=['scale','batch_size','fps','peak_rss_MB','peak_gpu_MB'])
+    print(results.to_string(index=False))
+
+    if write_config and len(results)>0:
+        candidates=results[results['scale']==scales[0]]
+        if len(candidates)>0:
+            best=int(candidates.loc[candidates['fps'].idxmax(),'batch_size'])
+            cfg['batch_size']=best
+            auxiliaryfunctions.write_config(config,cfg)
+            print("The batch size in %s was set to %s." %(config,best))
+    return results
+
+def benchmark_session_options(config,video,shuffle=1,trainingsetindex=0,options=[{},{'xla':True}],batchsize=None,nframes=256,startframe=0,gputouse=None):
+    """
+    Times the inference on a short segment of a video for several options of the tensorflow session (see session_options in ``analyze_videos``),
+    e.g. with and without XLA compilation or for different numbers of threads. For each option a new session is created and the achieved frames per second,
+    the speed-up relative to the first option, the duration of the first batch (incl. the XLA compilation) and the largest deviation of the poses of the first
+    batch from those of the first option (in pixels) are reported.
+
+    Parameters
+    ----------
+    config : string
+        Full path of the config.yaml file as a string.
+
+    video : string
+        Full path of the video used for timing.
+
+    shuffle: int, optional
+        An integer specifying the shuffle index of the training dataset used for training the network. The default is 1.
+
+    trainingsetindex: int, optional
+        Integer specifying which TrainingsetFraction to use. By default the first (note that TrainingFraction is a list in config.yaml).
+
+    options: list of dictionaries, optional
+        Session options to compare (keys: xla, intra_op_parallelism_threads, inter_op_parallelism_threads, gpu_allow_growth, gpu_memory_fraction); the first
+        option is the reference. The default is [{}, {'xla':True}], i.e. the options in the test pose_cfg.yaml file with and without XLA.
+
+    batchsize: int, optional
+        Batch size used for timing. The default is ``None``, i.e. the batch size in the config.yaml file.
+
+    nframes: int, optional
+        Number of frames used for timing (rounded down to a multiple of the batch size, so that XLA compiles the network only once). The default is 256.
+
+    startframe: int, optional
+        First frame of the segment. The default is 0.
+
+    gputouse: int, optional. Natural number indicating the number of your GPU (see number in nvidia-smi). If you do not have a GPU put None.
+
+    Returns a pandas DataFrame with the results.
+
+    Examples
+    --------
+    >>> deeplabcut.benchmark_session_options('/analysis/project/reaching-task/config.yaml','/analysis/project/videos/reachingvideo1.avi')
+    --------
+
+    >>> deeplabcut.benchmark_session_options('/analysis/project/reaching-task/config.yaml','/analysis/project/videos/reachingvideo1.avi',
+    >>>     options=[{},{'xla':True},{'xla':True,'intra_op_parallelism_threads':4,'inter_op_parallelism_threads':1}])
+    --------
+
+    """
+    import copy
+    from deeplabcut.pose_estimation_tensorflow.nnet import predict
+    from deeplabcut.pose_estimation_tensorflow.predict_videos import LoadModelConfig, SetSessionOptions
+
+    if gputouse is not None: #gpu selectinon
+        os.environ['CUDA_VISIBLE_DEVICES'] = str(gputouse)
+
+    cfg = auxiliaryfunctions.read_config(config)
+    trainFraction = cfg['TrainingFraction'][trainingsetindex]
+    dlc_cfg, DLCscorer = LoadModelConfig(cfg,shuffle,trainFraction)
+    dlc_cfg['batch_size']=int(cfg['batch_size'] if batchsize is None else batchsize)
+    batchsize=dlc_cfg['batch_size']
+    optcfgs=[]
+    for option in options:
+        optcfg=copy.deepcopy(dlc_cfg)
+        SetSessionOptions(optcfg,option)
+        predict.session_config_from_cfg(optcfg) # tensorflow reads the XLA flags only once, thus they are set before the first session is created
+        optcfgs.append(optcfg)
+
+    frames=ReadFrames(video,cfg,nframes,startframe)
+    frames=frames[:max(1,len(frames)//batchsize)*batchsize]
+    ny,nx=frames.shape[1:3]
+    print("Timing inference on %s frames of size %s x %s with batch size %s" %(len(frames),nx,ny,batchsize))
+
+    results=[]
+    reference=None
+    for option,optcfg in zip(options,optcfgs):
+        sess, inputs, outputs = predict.setup_pose_prediction(optcfg)
+        start=time.time()
+        pose=predict.getposeNP(frames[:batchsize],optcfg,sess,inputs,outputs)
+        firstbatch=time.time()-start
+        fps=TimeInference(frames,optcfg,sess,inputs,outputs,batchsize)
+        sess.close()
+        if reference is None:
+            reference=(fps,pose)
+        deviation=np.max(np.abs(pose.reshape(len(pose),-1,3)[:,:,:2]-reference[1].reshape(len(pose),-1,3)[:,:,:2])) # x, y (not the likelihood)
+        results.append([str(option),fps,fps/reference[0],firstbatch,deviation,PeakMemoryMB()])
+        print("%s: %.1f frames/s (first batch %.2f s)" %(option,fps,firstbatch))
+
+    results=pd.DataFrame(results,columns=['options','fps','speedup','first_batch_s','max_deviation_px','peak_rss_MB'])
+    print(results.to_string(index=False))
+    return results
+
+def analysis_report(folder,recursive=False):
+    """
+    Summarizes the run time of the analyses in a folder (or a folder tree if recursive is True), based on the metadata stored with the results of
+    ``analyze_videos`` and ``analyze_time_lapse_frames``. For every result the number of frames, the frames per second, the peak memory and the total
+    time of each stage (decode, crop_resize, network, postprocess, write; for videos, decode includes the color conversion, cropping and resizing, which are done while the frame is written into the batch) are listed. The time of all stages over all results and
+    the slowest stage are printed.
+
+    Parameters
+    ----------
+    folder : string
+        Full path of the folder with the results (the .h5 and ...includingmetadata.pickle files).
+
+    recursive: bool, optional
+        If True, the subfolders are searched, too. The default is ``False``
+
+    Returns a pandas DataFrame with one row per result.
+
+    Examples
+    --------
+    >>> deeplabcut.analysis_report('/analysis/project/videos')
+    --------
+
+    """
+    import pickle
+    if recursive:
+        filenames=[os.path.join(root,fn) for root,_,fns in os.walk(folder) for fn in fns]
+    else:
+        filenames=[os.path.join(folder,fn) for fn in os.listdir(folder)]
+    filenames=sorted(fn for fn in filenames if fn.endswith('includingmetadata.pickle'))
+
+    rows=[]
+    for filename in filenames:
+        with open(filename,'rb') as f:
+            metadata=pickle.load(f)['data']
+        row={'result':os.path.basename(filename).split('includingmetadata.pickle')[0],
+             'scorer':metadata.get('Scorer'),
+             'nframes':metadata.get('nframes'),
+             'run_duration':metadata.get('run_duration'),
+             'analysis_fps':metadata.get('analysis_fps'),
+             'peak_rss_MB':metadata.get('peak_rss_MB')}
+        for stage,stats in metadata.get('timing',{}).items():
+            row[stage+'_s']=stats['total_s']
+        rows.append(row)
+
+    if len(rows)==0:
+        print("No analysis results found in %s" %folder)
+        return pd.DataFrame()
+    report=pd.DataFrame(rows).set_index('result')
+    print(report.to_string())
+
+    stages=[column for column in report.columns if column.endswith('_s')]
+    if len(stages)>0:
+        totals=report[stages].sum()
+        print("\nTotal time per stage [s] (%s results):" %len(report))
+        for stage,total in totals.items():
+            print("  %-18s %10.3f (%.0f%%)" %(stage[:-2],total,100.*total/totals.sum()))
+        print("The slowest stage is '%s'." %totals.idxmax()[:-2])
+    return report
@@ -0,0 +1,151 @@
+"""
+DeepLabCut2.0 Toolbox
+https://github.com/AlexEMG/DeepLabCut
+A Mathis, alexander.mathis@bethgelab.org
+T Nath, nath@rowland.harvard.edu
+M Mathis, mackenzie@post.harvard.edu
+
+Content-addressed cache of analysis results (see analyze_videos with use_cache=True). The results are stored in the subfolder 'analysis-cache' of the
+project, keyed by a fingerprint of the video content and the identity of the model (weights, test configuration, cropping and analysis options).
+Renamed or linked copies of a video thus reuse the results instead of being analyzed again. The least recently used entries are removed when the cache
+exceeds analysis_cache_size_GB (config.yaml, default 10 GB).
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+from pathlib import Path
+import pandas as pd
+
+from deeplabcut.utils import auxiliaryfunctions
+
+DEFAULT_CACHE_SIZE_GB = 10
+# settings of the test configuration that do not change the poses
+IGNORED_SETTINGS = ('init_weights','batch_size','intra_op_parallelism_threads','inter_op_parallelism_threads','gpu_allow_growth','gpu_memory_fraction')
+
+
+def GetCacheFolder(cfg):
+    return Path(cfg['project_path']) / 'analysis-cache'
+
+def VideoFingerprint(video,blocksize=1<<20,nblocks=8):
+    ''' Fast fingerprint of the content of a video file: the file size and the hash of nblocks blocks of blocksize bytes spread over the file. '''
+    filesize=os.path.getsize(video)
+    sha=hashlib.sha1(str(filesize).encode())
+    with open(video,'rb') as f:
+        if filesize<=blocksize*nblocks:
+            sha.update(f.read())
+        else:
+            for i in range(nblocks):
+                f.seek((filesize-blocksize)*i//(nblocks-1))
+                sha.update(f.read(blocksize))
+    return sha.hexdigest()
+
+def ModelIdentity(dlc_cfg,cfg):
+    ''' Hash of everything that determines the poses of a video besides its content: the weights (the checkpoint index, which contains checksums
+    of all tensors, or the exported graph), the test configuration (incl. inference options) and the cropping. '''
+    sha=hashlib.sha1()
+    weights=str(dlc_cfg['init_weights'])
+    weightfile=weights if weights.endswith('.pb') else weights+'.index'
+    with open(weightfile,'rb') as f:
+        for block in iter(lambda: f.read(1<<20), b''):
+            sha.update(block)
+    settings=sorted((str(key),repr(value)) for key,value in dlc_cfg.items() if key not in IGNORED_SETTINGS)
+    sha.update(repr(settings).encode())
+    cropping=[cfg['cropping']]+([cfg['x1'],cfg['x2'],cfg['y1'],cfg['y2']] if cfg['cropping'] else [])
+    sha.update(repr(cropping).encode())
+    return sha.hexdigest()
+
+def CacheKey(video,dlc_cfg,cfg,DLCscorer,frameranges=None):
+    ''' Key of the results of video (the analyzed frame ranges are part of the key, if given). '''
+    key=VideoFingerprint(video)+ModelIdentity(dlc_cfg,cfg)+DLCscorer
+    if frameranges is not None:
+        key+=repr(frameranges)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def LoadFromCache(cfg,key,dataname,save_as_csv=False):
+    ''' Creates the result files dataname (.h5, metadata and score map statistics, if stored) from the cache entry key. Returns False if there is no such entry. '''
+    entry=GetCacheFolder(cfg) / key
+    if not (entry / 'result.h5').is_file():
+        return False
+    shutil.copyfile(str(entry / 'result.h5'),dataname)
+    shutil.copyfile(str(entry / 'resultincludingmetadata.pickle'),dataname.split('.h5')[0] + 'includingmetadata.pickle')
+    if (entry / 'result_uncertainty.h5').is_file():
+        shutil.copyfile(str(entry / 'result_uncertainty.h5'),auxiliaryfunctions.GetUncertaintyFilename(dataname))
+    if save_as_csv:
+        pd.read_hdf(dataname,'df_with_missing').to_csv(dataname.split('.h5')[0]+'.csv')
+    os.utime(str(entry / 'info.json')) # last use (for the eviction)
+    return True
+
+def StoreInCache(cfg,key,dataname,video,DLCscorer):
+    ''' Adds the result files dataname (.h5 and metadata) to the cache and removes the least recently used entries if the cache is too large. '''
+    entry=GetCacheFolder(cfg) / key
+    auxiliaryfunctions.attempttomakefolder(str(entry),recursive=True)
+    shutil.copyfile(dataname,str(entry / 'result.h5'))
+    shutil.copyfile(dataname.split('.h5')[0] + 'includingmetadata.pickle',str(entry / 'resultincludingmetadata.pickle'))
+    if os.path.isfile(auxiliaryfunctions.GetUncertaintyFilename(dataname)):
+        shutil.copyfile(auxiliaryfunctions.GetUncertaintyFilename(dataname),str(entry / 'result_uncertainty.h5'))
+    with open(str(entry / 'info.json'),'w') as f:
+        json.dump({'video':os.path.abspath(video),'scorer':DLCscorer,'created':time.time()},f)
+    EvictCache(cfg,cfg.get('analysis_cache_size_GB',DEFAULT_CACHE_SIZE_GB))
+
+def CacheEntries(cfg):
+    ''' Returns a list of dictionaries (key, video, scorer, created, last_used, size in bytes) for all cache entries. '''
+    folder=GetCacheFolder(cfg)
+    entries=[]
+    if not folder.is_dir():
+        return entries
+    for entry in folder.iterdir():
+        infofile=entry / 'info.json'
+        if not infofile.is_file():
+            continue
+        with open(str(infofile)) as f:
+            info=json.load(f)
+        info['key']=entry.name
+        info['last_used']=infofile.stat().st_mtime
+        info['size']=sum(fn.stat().st_size for fn in entry.iterdir())
+        entries.append(info)
+    return entries
+
+def EvictCache(cfg,maxsizeGB):
+    ''' Removes the least recently used entries until the cache is at most maxsizeGB large. '''
+    entries=sorted(CacheEntries(cfg),key=lambda info: info['last_used'])
+    total=sum(info['size'] for info in entries)
+    while len(entries)>0 and total>maxsizeGB*1024.**3:
+        info=entries.pop(0)
+        shutil.rmtree(str(GetCacheFolder(cfg) / info['key']))
+        total-=info['size']
+
+def cache_info(config):
+    """
+    Lists the entries of the analysis cache of a project (see analyze_videos with use_cache=True): the video for which the result was computed,
+    the scorer, the size and when it was created and last used. The entries are copies of the (small) result files, not of the videos.
+
+    Parameters
+    ----------
+    config : string
+        Full path of the config.yaml file as a string.
+
+    Returns a pandas DataFrame with one row per entry.
+
+    Examples
+    --------
+    >>> deeplabcut.cache_info('/analysis/project/reaching-task/config.yaml')
+    --------
+
+    """
+    cfg = auxiliaryfunctions.read_config(config)
+    entries=CacheEntries(cfg)
+    maxsize=cfg.get('analysis_cache_size_GB',DEFAULT_CACHE_SIZE_GB)
+    if len(entries)==0:
+        print("The analysis cache in %s is empty (maximal size %s GB)." %(GetCacheFolder(cfg),maxsize))
+        return pd.DataFrame()
+    info=pd.DataFrame(entries).set_index('key')[['video','scorer','size','created','last_used']].sort_values('last_used',ascending=False)
+    info['size']=info['size']/1024.**2
+    info=info.rename(columns={'size':'size_MB'})
+    for column in ('created','last_used'):
+        info[column]=pd.to_datetime(info[column],unit='s')
+    print(info.to_string())
+    print("%s entries, %.1f MB in total (maximal size %s GB)." %(len(info),info['size_MB'].sum(),maxsize))
+    return info
@@ -36,6 +36,18 @@ cfg.batch_size = 1
 cfg.video = False
 cfg.video_batch = False
 
+# Inference: compute the peak locations (argmax, location refinement) inside the tensorflow graph, so that only the poses
+# (not the score maps) are copied out of the graph (see nnet/predict.py).
+cfg.pose_in_graph = False
+
+# Inference: options of the tensorflow session (see session_config_from_cfg in nnet/predict.py). xla: compile the graph with XLA
+# (True or the jit level 1 or 2), the sizes of the thread pools (0: one thread per core) and the GPU memory allocation.
+cfg.xla = False
+cfg.intra_op_parallelism_threads = 0
+cfg.inter_op_parallelism_threads = 0
+cfg.gpu_allow_growth = False
+cfg.gpu_memory_fraction = 1.0
+
 # Parameters for augmentation with regard to cropping
 cfg.crop = False
 cfg.cropratio= 0.25 #what is the fraction of training samples with cropping?
@@ -70,7 +70,7 @@ def evaluate_network(config,Shuffles=[1],plotting = None,show_errors = True,comp
 
     from deeplabcut.pose_estimation_tensorflow.nnet import predict as ptf_predict
     from deeplabcut.pose_estimation_tensorflow.config import load_config
-    from deeplabcut.pose_estimation_tensorflow.dataset.pose_dataset import data_to_input
+    from skimage.util import img_as_ubyte
     from deeplabcut.utils import auxiliaryfunctions, visualization
     import tensorflow as tf
     
@@ -162,7 +162,7 @@ def evaluate_network(config,Shuffles=[1],plotting = None,show_errors = True,comp
                     for imageindex, imagename in tqdm(enumerate(Data.index)):
                         image = io.imread(os.path.join(cfg['project_path'],imagename),mode='RGB')
                         image = skimage.color.gray2rgb(image)
-                        image_batch = data_to_input(image)
+                        image_batch = np.expand_dims(img_as_ubyte(image), axis=0) #the network takes uint8 images
                         
                         # Compute prediction with the CNN
                         outputs_np = sess.run(outputs, feed_dict={inputs: image_batch})
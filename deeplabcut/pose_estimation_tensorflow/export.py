@@ -0,0 +1,103 @@
+"""
+DeepLabCut2.0 Toolbox
+https://github.com/AlexEMG/DeepLabCut
+A Mathis, alexander.mathis@bethgelab.org
+T Nath, nath@rowland.harvard.edu
+M Mathis, mackenzie@post.harvard.edu
+
+"""
+
+import os
+from pathlib import Path
+
+from deeplabcut.utils import auxiliaryfunctions
+
+
+def GetExportFolder(trainFraction,shuffle,cfg):
+    ''' Folder (relative to the project path) for exported models of a particular shuffle and training fraction. '''
+    Task = cfg['Task']
+    date = cfg['date']
+    iterate = 'iteration-'+str(cfg['iteration'])
+    return Path('exported-models/'+ iterate+'/'+Task + date + '-trainset' + str(int(trainFraction * 100)) + 'shuffle' + str(shuffle))
+
+def GetExportedModelFilename(cfg,trainFraction,shuffle,snapshot):
+    ''' Full path of the frozen graph for a snapshot (e.g. 'snapshot-103000'). '''
+    return os.path.join(cfg["project_path"],str(GetExportFolder(trainFraction,shuffle,cfg)),snapshot+'.pb')
+
+def GetExportedConfigFilename(exportname):
+    ''' Test configuration (pose_cfg.yaml) bundled with the frozen graph exportname. '''
+    return exportname[:-len('.pb')]+'_pose_cfg.yaml'
+
+def export_model(config,shuffle=1,trainingsetindex=0,snapshotindex=None,optimize=True):
+    """
+    Exports a trained network as a frozen inference graph (a single .pb file). The weights are stored as constants, training-only operations are removed and
+    (if optimize is True) batch normalization is folded into the convolutions and constant expressions are pre-computed. The test pose_cfg.yaml is stored
+    next to the graph (with init_weights pointing to the .pb file) and used instead of the model's test pose_cfg.yaml when the exported model is loaded
+(e.g. by ``analyze_videos`` with use_exported_model=True), so that the graph and its configuration stay together.
+
+    The exported models are stored in the subdirectory 'exported-models' of the project and are used by ``analyze_videos`` with use_exported_model=True.
+
+    Parameters
+    ----------
+    config : string
+        Full path of the config.yaml file as a string.
+
+    shuffle: int, optional
+        An integer specifying the shuffle index of the training dataset used for training the network. The default is 1.
+
+    trainingsetindex: int, optional
+        Integer specifying which TrainingsetFraction to use. By default the first (note that TrainingFraction is a list in config.yaml).
+
+    snapshotindex: int, optional
+        Index of the snapshot to export (sorted by training iterations). The default is ``None``, i.e. the snapshotindex in the config.yaml file is used.
+
+    optimize: bool, optional
+        Fold batch normalization and constants with tensorflow's graph transform tool. The default is ``True``
+
+    Examples
+    --------
+    >>> deeplabcut.export_model('/analysis/project/reaching-task/config.yaml',shuffle=1)
+    --------
+
+    """
+    import tensorflow as tf
+    from deeplabcut.pose_estimation_tensorflow.nnet import predict
+    from deeplabcut.pose_estimation_tensorflow.predict_videos import LoadModelConfig
+
+    cfg = auxiliaryfunctions.read_config(config)
+    trainFraction = cfg['TrainingFraction'][trainingsetindex]
+    modelfolder=os.path.join(cfg["project_path"],str(auxiliaryfunctions.GetModelFolder(trainFraction,shuffle,cfg)))
+    path_test_config = Path(modelfolder) / 'test' / 'pose_cfg.yaml'
+    dlc_cfg, DLCscorer = LoadModelConfig(cfg,shuffle,trainFraction,snapshotindex)
+    snapshot = os.path.basename(dlc_cfg['init_weights'])
+    print("Exporting %s" % snapshot, "for model", modelfolder)
+
+    dlc_cfg['pose_in_graph'] = False # the pose head is added when the frozen graph is loaded (if requested)
+    sess, inputs, outputs = predict.setup_pose_prediction(dlc_cfg)
+    output_names = [t.op.name for t in outputs]
+
+    graph_def = tf.graph_util.convert_variables_to_constants(sess, sess.graph.as_graph_def(), output_names)
+    graph_def = tf.graph_util.remove_training_nodes(graph_def, protected_nodes=output_names)
+    sess.close()
+    if optimize:
+        try:
+            from tensorflow.tools.graph_transforms import TransformGraph
+            graph_def = TransformGraph(graph_def, [inputs.op.name], output_names,
+                                       ['remove_nodes(op=Identity, op=CheckNumerics)', 'fold_constants(ignore_errors=true)',
+                                        'fold_batch_norms', 'fold_old_batch_norms'])
+        except ImportError:
+            print("The graph transform tool is not available in your tensorflow version, the graph is exported without folding batch normalization.")
+
+    exportname = GetExportedModelFilename(cfg,trainFraction,shuffle,snapshot)
+    auxiliaryfunctions.attempttomakefolder(str(Path(exportname).parent),recursive=True)
+    with tf.gfile.GFile(exportname, 'wb') as f:
+        f.write(graph_def.SerializeToString())
+
+    # bundle the test configuration with the model
+    test_cfg = auxiliaryfunctions.read_plainconfig(str(path_test_config))
+    test_cfg['init_weights'] = exportname
+    auxiliaryfunctions.write_plainconfig(GetExportedConfigFilename(exportname),test_cfg)
+    tf.reset_default_graph()
+
+    print("The model was exported to %s" % exportname)
+    return exportname
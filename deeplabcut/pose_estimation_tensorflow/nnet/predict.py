@@ -6,20 +6,67 @@ Source: DeeperCut by Eldar Insafutdinov
 https://github.com/eldar/pose-tensorflow
 '''
 
+import os
 import numpy as np
 import tensorflow as tf
 from deeplabcut.pose_estimation_tensorflow.nnet.net_factory import pose_net
 
-def setup_pose_prediction(cfg):
-    tf.reset_default_graph()
-    inputs = tf.placeholder(tf.float32, shape=[cfg.batch_size   , None, None, 3])
-    net_heads = pose_net(cfg).test(inputs)
-    outputs = [net_heads['part_prob']]
+def build_inference_graph(cfg):
+    ''' Builds the test graph of the network in the default graph; returns the input placeholder and the list of outputs (score maps and, if used, location refinement).
+    The tensors are named 'inputs', 'part_prob' and 'locref', so that they can be found again in an exported (frozen) graph. '''
+    # Images are fed as uint8 (a quarter of the size of float64); the conversion to float and the mean subtraction
+    # (in PoseNet.extract_features) happen inside the graph.
+    # The batch dimension is dynamic, i.e. incomplete batches (e.g. at the end of a video) do not have to be padded.
+    inputs = tf.placeholder(tf.uint8, shape=[None, None, None, 3], name='inputs')
+    net_heads = pose_net(cfg).test(tf.cast(inputs, tf.float32))
+    outputs = [tf.identity(net_heads['part_prob'], name='part_prob')]
     if cfg.location_refinement:
-        outputs.append(net_heads['locref'])
+        outputs.append(tf.identity(net_heads['locref'], name='locref'))
+    return inputs, outputs
+
+# keys of the test configuration that set up the session (see session_config_from_cfg); they do not change the network
+SESSION_OPTIONS = ('xla','intra_op_parallelism_threads','inter_op_parallelism_threads','gpu_allow_growth','gpu_memory_fraction')
+
+def session_config_from_cfg(cfg):
+    ''' Creates the tf.ConfigProto for the inference session from the test configuration (pose_cfg.yaml or the session_options of analyze_videos):
+
+    xla: if True (or the jit level 1 or 2), the graph is compiled with XLA, which fuses the convolutions, batch norms and activations into fewer kernels.
+         On CPUs the auto-clustering additionally has to be enabled with the flag --tf_xla_cpu_global_jit, which is added to the environment
+         variable TF_XLA_FLAGS (tensorflow reads it only once, i.e. XLA has to be enabled for the first session of the process). XLA compiles the graph for every input shape anew.
+    intra_op_parallelism_threads, inter_op_parallelism_threads: sizes of the thread pools (0: one thread per core).
+    gpu_allow_growth: allocate GPU memory as needed (instead of all of it at the start), gpu_memory_fraction: fraction of the GPU memory that may be used. '''
+    config = tf.ConfigProto()
+    config.intra_op_parallelism_threads = int(cfg.get('intra_op_parallelism_threads',0) or 0)
+    config.inter_op_parallelism_threads = int(cfg.get('inter_op_parallelism_threads',0) or 0)
+    config.gpu_options.allow_growth = bool(cfg.get('gpu_allow_growth',False))
+    fraction = cfg.get('gpu_memory_fraction',1.0)
+    if fraction is not None and 0 < fraction < 1:
+        config.gpu_options.per_process_gpu_memory_fraction = fraction
+    xla = cfg.get('xla',False)
+    if xla:
+        config.graph_options.optimizer_options.global_jit_level = tf.OptimizerOptions.ON_2 if xla == 2 else tf.OptimizerOptions.ON_1
+        flags = os.environ.get('TF_XLA_FLAGS','')
+        if '--tf_xla_cpu_global_jit' not in flags:
+            os.environ['TF_XLA_FLAGS'] = (flags+' --tf_xla_cpu_global_jit').strip()
+    return config
+
+def setup_pose_prediction(cfg,session_config=None):
+    ''' Builds the inference graph and restores the weights in cfg.init_weights. If init_weights is a frozen graph (.pb file
+    created by deeplabcut.export_model), that graph is loaded directly.
+    If cfg.pose_in_graph is True, the pose (see extract_pose_in_graph) is appended to the outputs.
+    session_config: optional tf.ConfigProto for the session; by default it is created from the session options in cfg (see session_config_from_cfg). '''
+    if session_config is None:
+        session_config = session_config_from_cfg(cfg)
+    if str(cfg.init_weights).endswith('.pb'):
+        return setup_frozen_pose_prediction(cfg,session_config)
+
+    tf.reset_default_graph()
+    inputs, outputs = build_inference_graph(cfg)
+    if cfg.get('pose_in_graph',False):
+        outputs.append(extract_pose_in_graph(outputs, cfg))
 
     restorer = tf.train.Saver()
-    sess = tf.Session()
+    sess = tf.Session(config=session_config)
     sess.run(tf.global_variables_initializer())
     sess.run(tf.local_variables_initializer())
 
@@ -27,7 +74,50 @@ def setup_pose_prediction(cfg):
     restorer.restore(sess, cfg.init_weights)
 
     return sess, inputs, outputs
-    
+
+def setup_frozen_pose_prediction(cfg,session_config=None):
+    ''' Loads a frozen inference graph (see deeplabcut.export_model) from cfg.init_weights. '''
+    tf.reset_default_graph()
+    graph_def = tf.GraphDef()
+    with tf.gfile.GFile(cfg.init_weights, 'rb') as f:
+        graph_def.ParseFromString(f.read())
+    tf.import_graph_def(graph_def, name='')
+
+    graph = tf.get_default_graph()
+    inputs = graph.get_tensor_by_name('inputs:0')
+    outputs = [graph.get_tensor_by_name('part_prob:0')]
+    if cfg.location_refinement:
+        outputs.append(graph.get_tensor_by_name('locref:0'))
+    if cfg.get('pose_in_graph',False):
+        outputs.append(extract_pose_in_graph(outputs, cfg))
+    sess = tf.Session(config=session_config)
+    return sess, inputs, outputs
+
+def extract_pose_in_graph(outputs, cfg):
+    ''' Tensorflow version of extract_cnn_outputmulti and argmax_pose_predictmulti: computes the maximum of each score map, gathers the
+    location refinement at the maximum and scales to image coordinates inside the graph. Returns a tensor of shape
+    image batch x # bodyparts x 3 (x, y, likelihood), so that the score maps do not have to be copied out of the graph. '''
+    scmap = outputs[0]
+    shape = tf.shape(scmap)
+    batchsize, nx, num_joints = shape[0], shape[2], cfg.num_joints
+    scmap_flat = tf.reshape(scmap, [batchsize, -1, num_joints])
+    maxloc = tf.cast(tf.argmax(scmap_flat, axis=1), tf.int32) # batch x joints
+    likelihood = tf.reduce_max(scmap_flat, axis=1)
+    xy = tf.cast(tf.stack([maxloc % nx, maxloc // nx], axis=2), tf.float32) * cfg.stride + .5 * cfg.stride
+    if cfg.location_refinement:
+        locref = tf.reshape(outputs[1], [batchsize, -1, num_joints, 2]) * cfg.locref_stdev
+        B = tf.tile(tf.expand_dims(tf.range(batchsize), 1), [1, num_joints])
+        J = tf.tile(tf.expand_dims(tf.range(num_joints), 0), [batchsize, 1])
+        xy = xy + tf.gather_nd(locref, tf.stack([B, maxloc, J], axis=2))
+    return tf.concat([xy, tf.expand_dims(likelihood, 2)], axis=2, name='pose')
+
+def run_network(image, cfg, sess, inputs, outputs, outall=False):
+    ''' Runs the network on an image batch. If the pose is computed in the graph (cfg.pose_in_graph), only the pose is fetched,
+    unless outall is True (then score maps and location refinement are fetched, too). '''
+    if cfg.get('pose_in_graph',False) and not outall:
+        outputs = outputs[-1:]
+    return sess.run(outputs, feed_dict={inputs: image})
+
 def extract_cnn_output(outputs_np, cfg):
     ''' extract locref + scmap from network '''
     scmap = outputs_np[0]
@@ -44,24 +134,33 @@ def extract_cnn_output(outputs_np, cfg):
 
 def argmax_pose_predict(scmap, offmat, stride):
     """Combine scoremat and offsets to the final pose."""
-    num_joints = scmap.shape[2]
-    pose = []
-    for joint_idx in range(num_joints):
-        maxloc = np.unravel_index(np.argmax(scmap[:, :, joint_idx]),
-                                  scmap[:, :, joint_idx].shape)
-        offset = np.array(offmat[maxloc][joint_idx])[::-1]
-        pos_f8 = (np.array(maxloc).astype('float') * stride + 0.5 * stride +
-                  offset)
-        pose.append(np.hstack((pos_f8[::-1],
-                               [scmap[maxloc][joint_idx]])))
-    return np.array(pose)
+    ny,nx,num_joints = scmap.shape
+    joints = np.arange(num_joints)
+    maxloc = np.argmax(scmap.reshape(ny*nx,num_joints),axis=0)
+    Y,X = np.unravel_index(maxloc,(ny,nx))
+    offset = offmat[Y,X,joints] # num_joints x 2 (x,y)
+    pose = np.empty((num_joints,3))
+    pose[:,0] = X.astype('float')*stride+.5*stride+offset[:,0]
+    pose[:,1] = Y.astype('float')*stride+.5*stride+offset[:,1]
+    pose[:,2] = scmap[Y,X,joints]
+    return pose
 
 def getpose(image, cfg, sess, inputs, outputs, outall=False):
     ''' Extract pose '''
-    im=np.expand_dims(image, axis=0).astype(float)
-    outputs_np = sess.run(outputs, feed_dict={inputs: im})
-    scmap, locref = extract_cnn_output(outputs_np, cfg)
-    pose = argmax_pose_predict(scmap, locref, cfg.stride)
+    im=np.expand_dims(image, axis=0)
+    outputs_np = run_network(im, cfg, sess, inputs, outputs, outall)
+    return pose_from_outputs(outputs_np, cfg, outall)
+
+def pose_from_outputs(outputs_np, cfg, outall=False):
+    ''' Post-processing part of getpose, i.e. turns the raw network outputs of a single image into the pose. '''
+    if cfg.get('pose_in_graph',False):
+        pose = outputs_np[-1][0]
+        if not outall:
+            return pose
+        scmap, locref = extract_cnn_output(outputs_np[:-1], cfg)
+    else:
+        scmap, locref = extract_cnn_output(outputs_np, cfg)
+        pose = argmax_pose_predict(scmap, locref, cfg.stride)
     if outall:
         return scmap, locref, pose
     else:
@@ -83,31 +182,90 @@ def extract_cnn_outputmulti(outputs_np, cfg):
     return scmap, locref
 
 
-def getposeNP(image, cfg, sess, inputs, outputs, outall=False):
-    ''' Adapted from DeeperCut, performs numpy-based faster inference on batches'''
-    outputs_np = sess.run(outputs, feed_dict={inputs: image})
-    
-    scmap, locref = extract_cnn_outputmulti(outputs_np, cfg) #processes image batch.
+def argmax_pose_predictmulti(scmap, locref, stride):
+    ''' Combine scoremat and offsets to the final pose for a batch of images.
+    Returns array of shape: image batch x (3 * # bodyparts), with columns x, y, likelihood per bodypart.'''
     batchsize,ny,nx,num_joints = scmap.shape
-    
-    #Combine scoremat and offsets to the final pose.
-    LOCREF=locref.reshape(batchsize,nx*ny,num_joints,2)
     MAXLOC=np.argmax(scmap.reshape(batchsize,nx*ny,num_joints),axis=1)
-    Y,X=np.unravel_index(MAXLOC,dims=(ny,nx))
-    DZ=np.zeros((batchsize,num_joints,3))
-    for l in range(batchsize):
-        for k in range(num_joints):
-            DZ[l,k,:2]=LOCREF[l,MAXLOC[l,k],k,:]
-            DZ[l,k,2]=scmap[l,Y[l,k],X[l,k],k]
-            
-    X=X.astype('float32')*cfg.stride+.5*cfg.stride+DZ[:,:,0]
-    Y=Y.astype('float32')*cfg.stride+.5*cfg.stride+DZ[:,:,1]
-    pose = np.empty((cfg['batch_size'], cfg['num_joints']*3), dtype=X.dtype) 
-    pose[:,0::3] = X
-    pose[:,1::3] = Y
-    pose[:,2::3] = DZ[:,:,2] #P
+    Y,X=np.unravel_index(MAXLOC,(ny,nx))
+    # gather the offsets and scores at the maxima for all images and joints at once (batch x joints)
+    B=np.arange(batchsize)[:,None]
+    J=np.arange(num_joints)[None,:]
+    DZ=locref.reshape(batchsize,ny,nx,num_joints,2)[B,Y,X,J].astype(float)
+
+    pose = np.empty((batchsize, num_joints*3))
+    pose[:,0::3] = X.astype('float32')*stride+.5*stride+DZ[:,:,0]
+    pose[:,1::3] = Y.astype('float32')*stride+.5*stride+DZ[:,:,1]
+    pose[:,2::3] = scmap[B,Y,X,J] #P
+    return pose
+
+def getposeNP(image, cfg, sess, inputs, outputs, outall=False):
+    ''' Adapted from DeeperCut, performs numpy-based faster inference on batches'''
+    outputs_np = run_network(image, cfg, sess, inputs, outputs, outall)
+    return poseNP_from_outputs(outputs_np, cfg, outall)
+
+def poseNP_from_outputs(outputs_np, cfg, outall=False):
+    ''' Post-processing part of getposeNP, i.e. turns the raw network outputs of a batch into poses.
+    Split off so that it can run in a different thread than sess.run (see predict_videos.GetPosePipelined).'''
+    if cfg.get('pose_in_graph',False):
+        pose = outputs_np[-1].reshape(len(outputs_np[-1]), -1)
+        if not outall:
+            return pose
+        scmap, locref = extract_cnn_outputmulti(outputs_np[:-1], cfg)
+    else:
+        scmap, locref = extract_cnn_outputmulti(outputs_np, cfg) #processes image batch.
+        pose = argmax_pose_predictmulti(scmap, locref, cfg.stride)
     if outall:
         return scmap, locref, pose
     else:
         return pose
 
+def scoremap_statisticsNP(scmap, stride, radius=2):
+    ''' Confidence statistics of the score maps of a batch (image batch x ny x nx x # bodyparts), computed from the maps that are evaluated anyway.
+    Returns an array of shape image batch x # bodyparts x 3 with (see auxiliaryfunctions.UNCERTAINTY_MEASURES):
+        second_peak_ratio: highest score outside of the neighborhood (radius cells) of the maximum, relative to the maximum (0-1)
+        entropy: entropy of the normalized score map, relative to the entropy of a uniform map (0-1)
+        spread: standard deviation of the location under the normalized score map (in pixels of the network input)
+    Larger values indicate a less certain prediction for all three. '''
+    batchsize,ny,nx,num_joints = scmap.shape
+    # float32 throughout and at most one temporary of the size of the score maps (which are large for tiled inference);
+    # the sums over the maps are accumulated in float64 (buffered by einsum, without a float64 copy of the maps).
+    S=scmap.reshape(batchsize,ny*nx,num_joints).astype(np.float32,copy=False)
+    MAXLOC=np.argmax(S,axis=1)
+    peak=np.max(S,axis=1)
+    Y,X=np.unravel_index(MAXLOC,(ny,nx))
+
+    buffer=S.copy() # maps with the neighborhood of the maximum set to 0
+    B=np.arange(batchsize)[:,None]
+    J=np.arange(num_joints)[None,:]
+    for dy in range(-radius,radius+1):
+        for dx in range(-radius,radius+1): # cells outside the map are clipped to the border, which lies in the neighborhood as well
+            buffer[B,np.clip(Y+dy,0,ny-1)*nx+np.clip(X+dx,0,nx-1),J]=0
+    second=buffer.max(axis=1)
+
+    def total(weights,values=None): # sum over the map, accumulated in float64
+        if values is None:
+            return np.einsum('bkj->bj',weights,dtype=np.float64)
+        return np.einsum('bkj,k->bj',weights,values,dtype=np.float64,casting='same_kind')
+
+    T=np.maximum(total(S),1e-12)
+    np.maximum(S,1e-12,out=buffer) # S log S (in the reused buffer)
+    np.log(buffer,out=buffer)
+    buffer*=S
+    # entropy of P = S / T: -sum P log P = log T - sum S log S / T
+    entropy=(np.log(T)-total(buffer)/T)/np.log(max(ny*nx,2))
+    yy,xx=np.unravel_index(np.arange(ny*nx),(ny,nx))
+    mx=total(S,xx.astype(np.float32))/T
+    my=total(S,yy.astype(np.float32))/T
+    var=total(S,(xx**2+yy**2).astype(np.float32))/T-mx**2-my**2
+
+    stats=np.empty((batchsize,num_joints,3))
+    stats[:,:,0]=second/np.maximum(peak,1e-12)
+    stats[:,:,1]=entropy
+    stats[:,:,2]=np.sqrt(np.maximum(var,0))*stride
+    return stats
+
+def uncertaintyNP_from_outputs(outputs_np, cfg):
+    ''' Score map statistics (see scoremap_statisticsNP) for the raw network outputs of a batch; requires the score maps, i.e. outputs_np
+    fetched with outall=True if the pose is computed in the graph. '''
+    return scoremap_statisticsNP(outputs_np[0], cfg.stride)
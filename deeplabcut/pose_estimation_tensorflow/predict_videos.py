@@ -14,9 +14,12 @@ M Mathis, mackenzie@post.harvard.edu
 import os.path
 from deeplabcut.pose_estimation_tensorflow.nnet import predict
 from deeplabcut.pose_estimation_tensorflow.config import load_config
-from deeplabcut.pose_estimation_tensorflow.dataset.pose_dataset import data_to_input
+from deeplabcut.pose_estimation_tensorflow.export import GetExportedModelFilename, GetExportedConfigFilename
+from deeplabcut.pose_estimation_tensorflow.benchmark import PeakMemoryMB
+from deeplabcut.pose_estimation_tensorflow import cache
 
 from random import sample
+import copy
 import time
 import pandas as pd
 import numpy as np
@@ -26,6 +29,7 @@ from pathlib import Path
 from tqdm import tqdm
 import tensorflow as tf
 from deeplabcut.utils import auxiliaryfunctions
+from deeplabcut.utils.videoreader import OpenVideo
 import cv2
 from skimage.util import img_as_ubyte
 
@@ -33,11 +37,13 @@ from skimage.util import img_as_ubyte
 # Loading data, and defining model folder
 ####################################################
 
-def analyze_videos(config,videos,shuffle=1,trainingsetindex=0,videotype='avi',gputouse=None,save_as_csv=False, destfolder=None):
+def analyze_videos(config,videos,shuffle=1,trainingsetindex=0,videotype='avi',gputouse=None,save_as_csv=False, destfolder=None,pipelined=False,n_workers=1,chunksize=None,use_exported_model=False,inference_scale=1,dynamic=(False,None,20),sparse=(False,5,4.,10.),models=None,batch_across_videos=False,use_cache=False,frameranges=None,rangeunit='frames',save_uncertainty=False,use_video_sets_crop=False,tiled=(False,512,128),session_options=None):
     """
     Makes prediction based on a trained network. The index of the trained network is specified by parameters in the config file (in particular the variable 'snapshotindex')
     
     You can crop the video (before analysis), by changing 'cropping'=True and setting 'x1','x2','y1','y2' in the config file. The same cropping parameters will then be used for creating the video.
+
+    By setting 'pose_in_graph: true' in the test pose_cfg.yaml of the model, the peak locations are computed inside the tensorflow graph (e.g. on the GPU), and the score maps are not copied to numpy.
     
     Output: The labels are stored as MultiIndex Pandas Array, which contains the name of the network, body part name, (x, y) label position \n
             in pixels, and the likelihood for each frame per body part. These arrays are stored in an efficient Hierarchical Data Format (HDF) \n
@@ -70,6 +76,95 @@ def analyze_videos(config,videos,shuffle=1,trainingsetindex=0,videotype='avi',gp
     destfolder: string, optional
         Specifies the destination folder for analysis data (default is the path of the video)
 
+    pipelined: bool, optional
+        If True (and batch_size > 1), frames are decoded in a separate thread while the network processes the previous batch(es), and the poses are extracted in a third thread.
+        This is faster when decoding takes a similar amount of time as the inference (e.g. large videos on CPU). The results are the same. The default is ``False``
+
+    n_workers: int, optional
+        Number of processes that analyze each video. If larger than 1, every video is split into n_workers contiguous frame ranges, which are analyzed in parallel
+        by processes with their own tensorflow session (sharing the CPU cores), and the results are stitched together. Useful for long videos on machines with many cores (not for GPUs).
+        This requires that frame-accurate seeking works for the video codec. The workers are started with 'spawn' and import the calling script again, thus in a
+        script the call has to be protected by ``if __name__ == '__main__':`` (not needed in interactive sessions/notebooks). The default is 1.
+
+    chunksize: int, optional
+        If set, the poses are written to disk (file ending with _partial.h5) every chunksize frames, so that the frames and score maps held in memory do not
+        depend on the video length (only the poses, a few numbers per frame, are read back at the end) and an interrupted analysis loses at most one chunk.
+        If the analysis is interrupted, calling analyze_videos again continues with the first frame that was not analyzed (and at the end the usual .h5 file is created).
+        The default is ``None`` (results are saved once the video is analyzed). This option takes precedence over n_workers.
+
+    use_exported_model: bool, optional
+        If True, the frozen inference graph of the snapshot created by ``export_model`` is loaded instead of building the network and restoring the checkpoint.
+        This starts faster and the optimized graph is typically faster per frame. The default is ``False``
+
+    inference_scale: float, optional
+        Factor by which the (cropped) frames are resized before they are fed to the network, e.g. 0.5 for half the resolution (about 4 times fewer computations).
+        The predicted coordinates are mapped back to the original pixel coordinates. Only use it if the network tracks well enough at that resolution. The default is 1.
+
+    dynamic: triple containing (state, detectiontreshold, margin)
+        If the state is true, the frames are cropped to a box around the body parts detected in the previous batch (with likelihood >= detectiontreshold, which
+        defaults to pcutoff from the config.yaml file if None), padded by margin pixels. Frames in which fewer body parts are detected in the box are analyzed again on the full frame.
+        This is much faster if the animal covers only a small part of the frame (e.g. open field). The coordinates are mapped back to the full frame. The default is (False, None, 20)
+
+    sparse: tuple containing (state, interval, motionthreshold, maxdisplacement)
+        If the state is true, the network only analyzes keyframes: every interval-th frame and frames that differ from the last keyframe by more than motionthreshold
+        (mean absolute difference of downsampled gray scale frames, 0-255). The poses in between are linearly interpolated, unless a body part moves by more than maxdisplacement
+        pixels or changes its detection state (pcutoff) between the keyframes; then these frames are analyzed as well. The indices of the interpolated frames are stored as
+        'interpolated_frames' in the metadata. Useful for high frame rate videos. Takes precedence over chunksize and n_workers. The default is (False, 5, 4., 10.)
+
+    models: list of (shuffle, snapshotindex) pairs, optional
+        If given, the videos are analyzed with all these networks in a single pass: every frame is decoded once and fed to all networks, and one result file
+        per network (scorer) is written. snapshotindex is the index of a snapshot, 'all' (all snapshots of the shuffle) or None (snapshotindex of the config.yaml file).
+        The shuffle argument is not used then. If the snapshotindex in the config.yaml file is 'all', all snapshots of shuffle are analyzed this way.
+        pipelined, n_workers, chunksize, dynamic, sparse, tiled, save_uncertainty, use_cache and frameranges are not supported in this mode (a ValueError is raised).
+        The default is ``None``
+
+    batch_across_videos: bool, optional
+        If True, the frames of consecutive videos (with the same dimensions) are fed to the network in shared batches, so that only the very last batch is incomplete,
+        and the results (one file per video) are saved by a background thread while the network continues. Useful for many short clips (e.g. trials).
+        pipelined, n_workers, chunksize, dynamic, sparse, tiled, save_uncertainty, use_cache and frameranges are not supported in this mode (a ValueError is raised).
+        The default is ``False``
+
+    use_cache: bool, optional
+        If True, the results are also stored in the analysis cache of the project, which is keyed by the content of the video and the model (see ``cache_info``).
+        If a video with the same content (e.g. a renamed copy) was already analyzed with the same model and settings, the results are copied from the cache
+        instead of analyzing it again. Not supported with models or batch_across_videos. The default is ``False``
+
+    frameranges: list, dictionary or string, optional
+        Only analyze these windows of the videos (e.g. trials), by seeking to each window. Either a list of (start, stop) pairs for all videos, a dictionary
+        that maps videos (full path, file name or name without extension) to such lists, or the full path of a csv file with the columns video, start and stop
+        (one row per window, e.g. trial onsets and offsets). The stop is exclusive, videos without windows are analyzed completely. The output is indexed
+        by the actual frame numbers and the windows are stored as 'frame_ranges' in the metadata. Overlapping windows are merged.
+        sparse, n_workers and chunksize are not used for videos with windows, and frameranges is not supported with models or batch_across_videos (a ValueError is raised). The default is ``None``
+
+    rangeunit: string, optional
+        Unit of start and stop in frameranges: 'frames' or 'seconds' (converted with the frame rate of the video). The default is 'frames'.
+
+    save_uncertainty: bool, optional
+        If True, confidence statistics of the score maps are computed for every frame and body part in the same pass (second_peak_ratio: relative height of the
+        second highest peak, entropy: normalized entropy of the score map, spread: standard deviation of the location in pixels) and saved as float32
+        in <video><scorer>_uncertainty.h5. They can be used by ``extract_outlier_frames`` with outlieralgorithm='heatmap'. Not computed with dynamic, sparse,
+        chunksize, n_workers, models or batch_across_videos. The default is ``False``
+
+    use_video_sets_crop: bool, optional
+        If True, every video is cropped to its own crop box stored under video_sets in the config.yaml file (x1, x2, y1, y2, as set by create_new_project
+        and add_new_videos) instead of the global cropping parameters, e.g. for rigs with different arena positions. The box is checked against the video
+        dimensions and recorded as cropping_parameters in the metadata (the poses are relative to the box, like for the global cropping); videos that are
+        not listed or whose box covers the full frame are analyzed uncropped. Videos are matched by their full path; a video that is only listed under another
+        folder is matched by its file name (with a warning), unless several listed videos have that name (then an error is raised). The default is ``False``
+
+    tiled: triple containing (state, tilesize, overlap)
+        If the state is true, every frame is split into overlapping tiles of tilesize x tilesize pixels (rounded to a multiple of twice the stride), which are
+        evaluated in batches of batch_size tiles; the score maps of the tiles are stitched and the pose is extracted as for the full frame. The memory then depends
+        on tilesize and batch_size instead of the frame size, e.g. for stitched multi-camera views or 8K videos. overlap (pixels) should cover the context the network
+        needs, then the poses equal those of full frame inference. Takes precedence over dynamic; not used with sparse and not supported with models or batch_across_videos. The default is (False, 512, 128)
+
+    session_options: dictionary, optional
+        Options of the tensorflow session, which override those in the test pose_cfg.yaml file of the model: xla (True or the jit level 1 or 2: compile the
+        network with XLA, which fuses its layers into fewer kernels, also on CPUs), intra_op_parallelism_threads and inter_op_parallelism_threads (sizes of the
+        thread pools, 0: one thread per core), gpu_allow_growth and gpu_memory_fraction. XLA compiles the network for every input size, i.e. the first batch
+        (and the last, incomplete batch) of a video take longer. Use ``deeplabcut.benchmark_session_options`` to find the fastest options for your hardware.
+        The default is ``None``, i.e. the options in pose_cfg.yaml (by default none).
+
     Examples
     --------
     If you want to analyze only 1 video
@@ -92,6 +187,18 @@ def analyze_videos(config,videos,shuffle=1,trainingsetindex=0,videotype='avi',gp
     >>> deeplabcut.analyze_videos('/analysis/project/reaching-task/config.yaml',['/analysis/project/videos/reachingvideo1.avi','/analysis/project/videos/reachingvideo2.avi'], shuffle=2,save_as_csv=True)
     --------
 
+    If you want to compare all snapshots of shuffle 1 and the last snapshot of shuffle 2 (decoding the video only once)
+    >>> deeplabcut.analyze_videos('/analysis/project/reaching-task/config.yaml',['/analysis/project/videos/reachingvideo1.avi'], models=[(1,'all'),(2,-1)])
+    --------
+
+    If you want to analyze only the trials listed in a csv file (columns video, start, stop in seconds)
+    >>> deeplabcut.analyze_videos('/analysis/project/reaching-task/config.yaml',['/analysis/project/videos/session1.avi'], frameranges='/analysis/project/trials.csv', rangeunit='seconds')
+    --------
+
+    If you want to analyze on a CPU with the network compiled by XLA and 8 threads
+    >>> deeplabcut.analyze_videos('/analysis/project/reaching-task/config.yaml',['/analysis/project/videos/reachingvideo1.avi'], session_options={'xla':True,'intra_op_parallelism_threads':8})
+    --------
+
     """
     if 'TF_CUDNN_USE_AUTOTUNE' in os.environ:
         del os.environ['TF_CUDNN_USE_AUTOTUNE'] #was potentially set during training
@@ -102,45 +209,29 @@ def analyze_videos(config,videos,shuffle=1,trainingsetindex=0,videotype='avi',gp
     cfg = auxiliaryfunctions.read_config(config)
     trainFraction = cfg['TrainingFraction'][trainingsetindex]
     
-    modelfolder=os.path.join(cfg["project_path"],str(auxiliaryfunctions.GetModelFolder(trainFraction,shuffle,cfg)))
-    path_test_config = Path(modelfolder) / 'test' / 'pose_cfg.yaml'
-    try:
-        dlc_cfg = load_config(str(path_test_config))
-    except FileNotFoundError:
-        raise FileNotFoundError("It seems the model for shuffle %s and trainFraction %s does not exist."%(shuffle,trainFraction))
-
-    # Check which snapshots are available and sort them by # iterations
-    try:
-      Snapshots = np.array([fn.split('.')[0]for fn in os.listdir(os.path.join(modelfolder , 'train'))if "index" in fn])
-    except FileNotFoundError:
-      raise FileNotFoundError("Snapshots not found! It seems the dataset for shuffle %s has not been trained/does not exist.\n Please train it before using it to analyze videos.\n Use the function 'train_network' to train the network for shuffle %s."%(shuffle,shuffle))
-
-    if cfg['snapshotindex'] == 'all':
-        print("Snapshotindex is set to 'all' in the config.yaml file. Running video analysis with all snapshots is very costly! Use the function 'evaluate_network' to choose the best the snapshot. For now, changing snapshot index to -1!")
-        snapshotindex = -1
+    if models is None and cfg['snapshotindex'] == 'all':
+        models=[(shuffle,'all')]
+    requested=RequestedOptions(pipelined,n_workers,chunksize,dynamic,sparse,tiled,save_uncertainty,use_cache,frameranges)
+    if models is not None and (len(requested)>0 or batch_across_videos):
+        raise ValueError("%s cannot be used when analyzing with several models (models=%s or snapshotindex: all in the config.yaml file)."
+                         %(", ".join(requested+(['batch_across_videos'] if batch_across_videos else [])),models))
+    if batch_across_videos and len(requested)>0:
+        raise ValueError("%s cannot be used with batch_across_videos=True." %", ".join(requested))
+    if models is not None:
+        Models = LoadModels(cfg,models,trainFraction,use_exported_model,inference_scale,session_options)
     else:
-        snapshotindex=cfg['snapshotindex']
-        
-    increasing_indices = np.argsort([int(m.split('-')[1]) for m in Snapshots])
-    Snapshots = Snapshots[increasing_indices]
-    
-    print("Using %s" % Snapshots[snapshotindex], "for model", modelfolder)
-
-    ##################################################
-    # Load and setup CNN part detector
-    ##################################################
+        dlc_cfg, DLCscorer = LoadModelConfig(cfg,shuffle,trainFraction,use_exported_model=use_exported_model)
+        #update batchsize (based on parameters in config.yaml)
+        dlc_cfg['batch_size']=cfg['batch_size']
+        dlc_cfg['inference_scale']=inference_scale
+        dlc_cfg['dynamic']=dynamic
+        dlc_cfg['sparse']=sparse
+        dlc_cfg['uncertainty']=save_uncertainty
+        dlc_cfg['tiled']=tiled
+        SetSessionOptions(dlc_cfg,session_options)
 
-    # Check if data already was generated:
-    dlc_cfg['init_weights'] = os.path.join(modelfolder , 'train', Snapshots[snapshotindex])
-    trainingsiterations = (dlc_cfg['init_weights'].split(os.sep)[-1]).split('-')[-1]
-    
-    #update batchsize (based on parameters in config.yaml)
-    dlc_cfg['batch_size']=cfg['batch_size']
-    # Name for scorer:
-    DLCscorer = auxiliaryfunctions.GetScorerName(cfg,shuffle,trainFraction,trainingsiterations=trainingsiterations)
-    
-    sess, inputs, outputs = predict.setup_pose_prediction(dlc_cfg)
-    pdindex = pd.MultiIndex.from_product([[DLCscorer], dlc_cfg['all_joints_names'], ['x', 'y', 'likelihood']],names=['scorer', 'bodyparts', 'coords'])
+        sess, inputs, outputs = predict.setup_pose_prediction(dlc_cfg)
+        pdindex = pd.MultiIndex.from_product([[DLCscorer], dlc_cfg['all_joints_names'], ['x', 'y', 'likelihood']],names=['scorer', 'bodyparts', 'coords'])
 
     if gputouse is not None: #gpu selectinon
             os.environ['CUDA_VISIBLE_DEVICES'] = str(gputouse)
@@ -167,53 +258,255 @@ def analyze_videos(config,videos,shuffle=1,trainingsetindex=0,videotype='avi',gp
         else:
             Videos=[v for v in videos if os.path.isfile(v)]
     
+    if isinstance(frameranges,str):
+        frameranges=ReadFrameRanges(frameranges)
+
     if len(Videos)>0:
-        #looping over videos
-        for video in Videos:
-            AnalyzeVideo(video,DLCscorer,trainFraction,cfg,dlc_cfg,sess,inputs, outputs,pdindex,save_as_csv, destfolder)
+        if models is None and batch_across_videos:
+            AnalyzeVideosBatched(Videos,DLCscorer,trainFraction,cfg,dlc_cfg,sess,inputs, outputs,pdindex,save_as_csv, destfolder,use_video_sets_crop=use_video_sets_crop)
+        else:
+            #looping over videos
+            for video in Videos:
+                vcfg=VideoCropConfig(cfg,video) if use_video_sets_crop else cfg
+                if models is not None:
+                    AnalyzeVideoMulti(video,trainFraction,vcfg,Models,save_as_csv,destfolder)
+                else:
+                    AnalyzeVideo(video,DLCscorer,trainFraction,vcfg,dlc_cfg,sess,inputs, outputs,pdindex,save_as_csv, destfolder,pipelined,n_workers,chunksize,use_cache,
+                                 FrameRangesOfVideo(frameranges,video),rangeunit)
+    if models is not None:
+        for model in Models:
+            model['sess'].close()
     
     os.chdir(str(start_path))
     print("The videos are analyzed. Now your research can truly start! \n You can create labeled videos with 'create_labeled_video'.")
     print("If the tracking is not satisfactory for some videos, consider expanding the training set. You can use the function 'extract_outlier_frames' to extract any outlier frames!")
 
-def GetPoseF(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes,batchsize):
-    ''' Batchwise prediction of pose '''
-    
+def LoadModelConfig(cfg,shuffle,trainFraction,snapshotindex=None,use_exported_model=False):
+    ''' Loads the test configuration (pose_cfg.yaml) of a trained network and sets the weights to the snapshot given by snapshotindex
+    (by default the snapshotindex in config.yaml). If use_exported_model is True, the frozen graph of the snapshot and the test configuration
+    bundled with it (see export_model) are used. Returns the test configuration and the name of the scorer. '''
+    modelfolder=os.path.join(cfg["project_path"],str(auxiliaryfunctions.GetModelFolder(trainFraction,shuffle,cfg)))
+    path_test_config = Path(modelfolder) / 'test' / 'pose_cfg.yaml'
+    try:
+        # load_config merges into (and returns) the same default configuration object, thus a copy is made
+        dlc_cfg = copy.deepcopy(load_config(str(path_test_config)))
+    except FileNotFoundError:
+        raise FileNotFoundError("It seems the model for shuffle %s and trainFraction %s does not exist."%(shuffle,trainFraction))
+
+    # Check which snapshots are available and sort them by # iterations
+    try:
+      Snapshots = np.array([fn.split('.')[0]for fn in os.listdir(os.path.join(modelfolder , 'train'))if "index" in fn])
+    except FileNotFoundError:
+      raise FileNotFoundError("Snapshots not found! It seems the dataset for shuffle %s has not been trained/does not exist.\n Please train it before using it to analyze videos.\n Use the function 'train_network' to train the network for shuffle %s."%(shuffle,shuffle))
+
+    if snapshotindex is None:
+        snapshotindex=cfg['snapshotindex']
+    if snapshotindex == 'all':
+        print("Snapshotindex is set to 'all' in the config.yaml file. Running video analysis with all snapshots is very costly! Use the function 'evaluate_network' to choose the best the snapshot. For now, changing snapshot index to -1!")
+        snapshotindex = -1
+
+    increasing_indices = np.argsort([int(m.split('-')[1]) for m in Snapshots])
+    Snapshots = Snapshots[increasing_indices]
+
+    print("Using %s" % Snapshots[snapshotindex], "for model", modelfolder)
+
+    dlc_cfg['init_weights'] = os.path.join(modelfolder , 'train', Snapshots[snapshotindex])
+    trainingsiterations = (dlc_cfg['init_weights'].split(os.sep)[-1]).split('-')[-1]
+    if use_exported_model:
+        exportname = GetExportedModelFilename(cfg,trainFraction,shuffle,Snapshots[snapshotindex])
+        if not os.path.isfile(exportname):
+            raise FileNotFoundError("No exported model found for %s. Please export it with 'export_model' first." %Snapshots[snapshotindex])
+        if os.path.isfile(GetExportedConfigFilename(exportname)): # the configuration the graph was exported with
+            dlc_cfg = copy.deepcopy(load_config(GetExportedConfigFilename(exportname)))
+        dlc_cfg['init_weights'] = exportname
+        print("Using the exported model", dlc_cfg['init_weights'])
+
+    # Name for scorer:
+    DLCscorer = auxiliaryfunctions.GetScorerName(cfg,shuffle,trainFraction,trainingsiterations=trainingsiterations)
+    return dlc_cfg, DLCscorer
+
+def RequestedOptions(pipelined,n_workers,chunksize,dynamic,sparse,tiled,save_uncertainty,use_cache,frameranges):
+    ''' Names of the options of analyze_videos that are set (differ from their defaults) and that are only supported by AnalyzeVideo,
+    i.e. not with models or batch_across_videos. '''
+    requested=[('pipelined',pipelined),('n_workers',n_workers is not None and n_workers>1),('chunksize',chunksize is not None),('dynamic',dynamic[0]),
+               ('sparse',sparse[0]),('tiled',tiled[0]),('save_uncertainty',save_uncertainty),('use_cache',use_cache),('frameranges',frameranges is not None)]
+    return [name for name,value in requested if value]
+
+def SetSessionOptions(dlc_cfg,session_options):
+    ''' Overrides the session options (see predict.session_config_from_cfg) of the test configuration with the dictionary session_options. '''
+    if session_options is None:
+        return
+    unknown=[key for key in session_options if key not in predict.SESSION_OPTIONS]
+    if len(unknown)>0:
+        raise ValueError("Unknown session options %s, please use %s." %(", ".join(map(str,unknown)),", ".join(predict.SESSION_OPTIONS)))
+    for key,value in session_options.items():
+        dlc_cfg[key]=value
+
+def LoadModels(cfg,models,trainFraction,use_exported_model=False,inference_scale=1,session_options=None):
+    ''' Loads the networks for a list of (shuffle, snapshotindex) pairs (snapshotindex 'all' stands for all snapshots of the shuffle) for AnalyzeVideoMulti.
+    Returns a list of dictionaries with the test configuration, scorer name, session, inputs, outputs and pdindex of each network. '''
+    pairs=[]
+    for shuffle,snapshotindex in models:
+        if snapshotindex == 'all':
+            modelfolder=os.path.join(cfg["project_path"],str(auxiliaryfunctions.GetModelFolder(trainFraction,shuffle,cfg)))
+            try:
+                nsnapshots=len([fn for fn in os.listdir(os.path.join(modelfolder , 'train')) if "index" in fn])
+            except FileNotFoundError:
+                raise FileNotFoundError("Snapshots not found! It seems the dataset for shuffle %s has not been trained/does not exist."%(shuffle))
+            pairs.extend([(shuffle,index) for index in range(nsnapshots)])
+        else:
+            pairs.append((shuffle,snapshotindex))
+
+    Models=[]
+    for shuffle,snapshotindex in pairs:
+        dlc_cfg, DLCscorer = LoadModelConfig(cfg,shuffle,trainFraction,snapshotindex,use_exported_model=use_exported_model)
+        if DLCscorer in [model['scorer'] for model in Models]:
+            continue
+        dlc_cfg['batch_size']=cfg['batch_size']
+        dlc_cfg['inference_scale']=inference_scale
+        SetSessionOptions(dlc_cfg,session_options)
+        # every call builds a new (default) graph; the session keeps its own graph alive
+        sess, inputs, outputs = predict.setup_pose_prediction(dlc_cfg)
+        pdindex = pd.MultiIndex.from_product([[DLCscorer], dlc_cfg['all_joints_names'], ['x', 'y', 'likelihood']],names=['scorer', 'bodyparts', 'coords'])
+        Models.append({'dlc_cfg':dlc_cfg,'scorer':DLCscorer,'sess':sess,'inputs':inputs,'outputs':outputs,'pdindex':pdindex})
+    print("Analyzing with %s networks in one pass." %len(Models))
+    return Models
+
+def GetCroppedSize(cfg,cap,framesize=None,verbose=True):
+    ''' Returns the size (width, height) of the frames of video cap after cropping according to cfg, after checking the cropping parameters
+    against the frame dimensions. framesize: (width, height) of the uncropped frames, if they are not read from cap (e.g. for images). '''
+    nx,ny=framesize if framesize is not None else (int(cap.get(3)),int(cap.get(4)))
+    if not cfg['cropping']:
+        return nx,ny
+    if verbose:
+        print("Cropping based on the x1 = %s x2 = %s y1 = %s y2 = %s. You can adjust the cropping coordinates in the config.yaml file." %(cfg['x1'], cfg['x2'],cfg['y1'], cfg['y2']))
+    if not (cfg['x2']-cfg['x1']>0 and cfg['y2']-cfg['y1']>0):
+        raise Exception('Please check the order of cropping parameter!')
+    if not (cfg['x1']>=0 and cfg['x2']<nx+1 and cfg['y1']>=0 and cfg['y2']<ny+1):
+        raise Exception('Please check the boundary of cropping!')
+    return cfg['x2']-cfg['x1'],cfg['y2']-cfg['y1']
+
+def GetInferenceSize(nx,ny,dlc_cfg):
+    ''' Size (width, height) of the frames that are fed to the network, for (cropped) frames of size nx x ny and dlc_cfg['inference_scale']. '''
+    scale=dlc_cfg.get('inference_scale',1)
+    return int(round(nx*scale)),int(round(ny*scale))
+
+def ResizeFrame(frame,size,dst=None):
+    ''' Resizes the frame to size (width, height), if it does not have that size already. If given, the result is written into dst. '''
+    if (frame.shape[1],frame.shape[0])==size:
+        if dst is None:
+            return frame
+        np.copyto(dst,frame)
+        return dst
+    interpolation=cv2.INTER_AREA if size[0]<frame.shape[1] else cv2.INTER_LINEAR
+    if dst is None:
+        return cv2.resize(frame,size,interpolation=interpolation)
+    return cv2.resize(frame,size,dst=dst,interpolation=interpolation)
+
+def BatchFrameReader(cap,size):
+    ''' Returns a function readinto(out) that reads the next frame of cap (see GetVideoReader) into out, an array of shape (size[1], size[0], 3),
+    e.g. a slot of a batch: decoding, cropping and color conversion write directly into out, without allocating a new frame. If the inference size
+    differs from the frame size, the reader resizes the frames if it can (ffmpeg backend), otherwise they are resized from a reused buffer.
+    readinto returns False at the end of the video. '''
+    cap.setoutputsize(size)
+    if tuple(cap.shape[:2])==(size[1],size[0]):
+        return cap.readinto
+    buffer=np.empty(cap.shape,dtype=np.uint8)
+    def readinto(out):
+        if not cap.readinto(buffer):
+            return False
+        ResizeFrame(buffer,size,out)
+        return True
+    return readinto
+
+def RescalePoses(PredicteData,nx,ny,size):
+    ''' Maps the x, y coordinates predicted on frames of size (width, height) back to (cropped) frames of size nx x ny (in place).
+    Pixel centers are aligned as in cv2.resize. '''
+    if size!=(nx,ny):
+        PredicteData[:,0::3]=(PredicteData[:,0::3]+.5)*nx/size[0]-.5
+        PredicteData[:,1::3]=(PredicteData[:,1::3]+.5)*ny/size[1]-.5
+    return PredicteData
+
+def GetVideoReader(video,cfg):
+    ''' Opens video with the reader backend set in config.yaml (video_backend: cv2 or ffmpeg, default cv2). The reader delivers RGB frames,
+    cropped according to config.yaml; this is the form the GetPose... routines expect. '''
+    if cfg['cropping']:
+        crop=(cfg['x1'],cfg['x2'],cfg['y1'],cfg['y2'])
+    else:
+        crop=None
+    return OpenVideo(video,cfg.get('video_backend','cv2'),rgb=True,crop=crop)
+
+def VideoCropConfig(cfg,video):
+    ''' Returns a copy of cfg with the cropping parameters of video from video_sets (matched by full path; by file name, with a warning, only if
+    that is unique), checked against the
+    dimensions of the video. If the video is not listed, cfg is returned; if its box covers the full frame, cropping is turned off. '''
+    videosets=cfg.get('video_sets') or {}
+    entry=None
+    for key in videosets:
+        if os.path.realpath(str(key))==os.path.realpath(video):
+            entry=videosets[key]
+            break
+    if entry is None: # e.g. the videos were moved; the file name alone is not unique across sessions/rigs (e.g. cam1.avi)
+        matches=[key for key in videosets if os.path.basename(str(key))==os.path.basename(video)]
+        if len(matches)>1:
+            raise Exception("%s is not listed under video_sets, but several videos with the same file name are (%s). Please add the full path of %s to video_sets."
+                            %(video,", ".join(map(str,matches)),video))
+        if len(matches)==1:
+            print("Warning: %s is not listed under video_sets; using the crop box of %s, which has the same file name." %(video,matches[0]))
+            entry=videosets[matches[0]]
+    if entry is None or 'crop' not in entry:
+        print("%s is not listed under video_sets in the config.yaml file, using the global cropping parameters." %video)
+        return cfg
+    x1,x2,y1,y2=[int(float(c)) for c in str(entry['crop']).split(',')]
+    cap=OpenVideo(video,cfg.get('video_backend','cv2'))
+    nx,ny=int(cap.get(3)),int(cap.get(4))
+    cap.release()
+    if not (x2>x1 and y2>y1):
+        raise Exception('Please check the order of the cropping parameters of %s under video_sets!' %video)
+    if not (x1>=0 and x2<=nx and y1>=0 and y2<=ny):
+        raise Exception('The crop box %s of %s under video_sets exceeds the video dimensions (%s x %s)!' %(entry['crop'],video,nx,ny))
+    vcfg=dict(cfg)
+    vcfg.update({'cropping':(x1,x2,y1,y2)!=(0,nx,0,ny),'x1':x1,'x2':x2,'y1':y1,'y2':y2})
+    return vcfg
+
+def RescaleUncertainty(uncertainty,nx,ny,size):
+    ''' Maps the spread of the score map statistics (see predict.scoremap_statisticsNP) from frames of size (width, height) back to (cropped) frames of size nx x ny (in place). '''
+    if uncertainty is not None and size!=(nx,ny):
+        uncertainty[:,:,2]*=.5*(nx*1./size[0]+ny*1./size[1])
+    return uncertainty
+
+def GetPoseF(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes,batchsize,timer=None,uncertainty=None):
+    ''' Batchwise prediction of pose. The time of each stage is recorded with timer (an auxiliaryfunctions.StageTimer).
+    If uncertainty (array of shape nframes x # bodyparts x 3) is given, it is filled with the score map statistics of every frame (see predict.scoremap_statisticsNP). '''
+    if timer is None:
+        timer=auxiliaryfunctions.StageTimer()
     PredicteData = np.zeros((nframes, 3 * len(dlc_cfg['all_joints_names'])))
     batch_ind = 0 # keeps track of which image within a batch should be written to
     batch_num = 0 # keeps track of which batch you are at
-    ny,nx=int(cap.get(4)),int(cap.get(3))
-    if cfg['cropping']:
-        print("Cropping based on the x1 = %s x2 = %s y1 = %s y2 = %s. You can adjust the cropping coordinates in the config.yaml file." %(cfg['x1'], cfg['x2'],cfg['y1'], cfg['y2']))
-        nx=cfg['x2']-cfg['x1']
-        ny=cfg['y2']-cfg['y1']
-        if nx>0 and ny>0:
-            pass
-        else:
-            raise Exception('Please check the order of cropping parameter!')
-        if cfg['x1']>=0 and cfg['x2']<int(cap.get(3)+1) and cfg['y1']>=0 and cfg['y2']<int(cap.get(4)+1):
-            pass #good cropping box
-        else:
-            raise Exception('Please check the boundary of cropping!')
-            
-    frames = np.empty((batchsize, ny, nx, 3), dtype='ubyte') # this keeps all frames in a batch
+    nx,ny=GetCroppedSize(cfg,cap)
+
+    size=GetInferenceSize(nx,ny,dlc_cfg)
+    frames = np.empty((batchsize, size[1], size[0], 3), dtype='ubyte') # this keeps all frames in a batch
+    readinto=BatchFrameReader(cap,size)
     pbar=tqdm(total=nframes)
     counter=0
     step=max(10,int(nframes/100))
     while(cap.isOpened()):
             if counter%step==0:
                 pbar.update(step)
-            ret, frame = cap.read()
+            if counter<nframes:
+                with timer('decode'): #decoding, cropping, color conversion (and resizing) directly into the batch
+                    ret = readinto(frames[batch_ind])
+            else: #all requested frames were read (don't advance cap)
+                ret = False
             if ret:
-                frame=cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                if cfg['cropping']:
-                    frames[batch_ind] = img_as_ubyte(frame[cfg['y1']:cfg['y2'],cfg['x1']:cfg['x2']])
-                else:
-                    frames[batch_ind] = img_as_ubyte(frame)
-                    
                 if batch_ind==batchsize-1:
-                    pose = predict.getposeNP(frames,dlc_cfg, sess, inputs, outputs)
-                    PredicteData[batch_num*batchsize:(batch_num+1)*batchsize, :] = pose
+                    with timer('network'):
+                        outputs_np = predict.run_network(frames,dlc_cfg, sess, inputs, outputs, uncertainty is not None)
+                    with timer('postprocess'):
+                        PredicteData[batch_num*batchsize:(batch_num+1)*batchsize, :] = predict.poseNP_from_outputs(outputs_np, dlc_cfg)
+                        if uncertainty is not None:
+                            uncertainty[batch_num*batchsize:(batch_num+1)*batchsize] = predict.uncertaintyNP_from_outputs(outputs_np, dlc_cfg)
                     batch_ind = 0
                     batch_num += 1
                 else:
@@ -222,29 +515,150 @@ def GetPoseF(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes,batchsize):
                 nframes = counter
                 print("Detected frames: ", nframes)
                 if batch_ind>0:
-                    pose = predict.getposeNP(frames, dlc_cfg, sess, inputs, outputs) #process the whole batch (some frames might be from previous batch!)
-                    PredicteData[batch_num*batchsize:batch_num*batchsize+batch_ind, :] = pose[:batch_ind,:]
+                    with timer('network'):
+                        outputs_np = predict.run_network(frames[:batch_ind], dlc_cfg, sess, inputs, outputs, uncertainty is not None) #process the remaining frames (the batch dimension is dynamic)
+                    with timer('postprocess'):
+                        PredicteData[batch_num*batchsize:batch_num*batchsize+batch_ind, :] = predict.poseNP_from_outputs(outputs_np, dlc_cfg)
+                        if uncertainty is not None:
+                            uncertainty[batch_num*batchsize:batch_num*batchsize+batch_ind] = predict.uncertaintyNP_from_outputs(outputs_np, dlc_cfg)
                 break
             counter+=1
 
+    with timer('postprocess'):
+        PredicteData=RescalePoses(PredicteData,nx,ny,size)
+        RescaleUncertainty(uncertainty,nx,ny,size)
     return PredicteData,nframes
 
-def GetPoseS(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes):
-    ''' Non batch wise pose estimation for video cap.'''
-    if cfg['cropping']:
-        print("Cropping based on the x1 = %s x2 = %s y1 = %s y2 = %s. You can adjust the cropping coordinates in the config.yaml file." %(cfg['x1'], cfg['x2'],cfg['y1'], cfg['y2']))
-        nx=cfg['x2']-cfg['x1']
-        ny=cfg['y2']-cfg['y1']
-        if nx>0 and ny>0:
-            pass
-        else:
-            raise Exception('Please check the order of cropping parameter!')
-        if cfg['x1']>=0 and cfg['x2']<int(cap.get(3)+1) and cfg['y1']>=0 and cfg['y2']<int(cap.get(4)+1):
-            pass #good cropping box
-        else:
-            raise Exception('Please check the boundary of cropping!')
+def GetPosePipelined(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes,batchsize,queuesize=4,timer=None,uncertainty=None):
+    ''' Batchwise prediction of pose, where decoding, inference and post-processing are pipelined.
+
+    A decoder thread reads, converts and crops the frames and puts complete batches in a bounded queue (at most queuesize batches are read ahead),
+    the calling thread runs the network (sess.run) and a third thread extracts the poses from the network output and writes them into PredicteData.
+    The results are identical to GetPoseF (also for uncertainty). The stages are timed with timer (an auxiliaryfunctions.StageTimer) in the thread that runs them,
+    thus their times overlap. '''
+    import threading
+    import queue
+
+    if timer is None:
+        timer=auxiliaryfunctions.StageTimer()
+    PredicteData = np.zeros((nframes, 3 * len(dlc_cfg['all_joints_names'])))
+    nx,ny=GetCroppedSize(cfg,cap)
+    size=GetInferenceSize(nx,ny,dlc_cfg)
+
+    batches = queue.Queue(maxsize=queuesize) # (frames, number of valid frames) or None when the video is exhausted
+    results = queue.Queue(maxsize=queuesize) # (network output, first frame index, number of valid frames) or None
+    errors = []
+    stop = threading.Event()
+
+    def put(q, item):
+        # a put that gives up when another stage has failed (so that no thread blocks forever)
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(q):
+        # a get that returns None when another stage has failed
+        while not stop.is_set():
+            try:
+                return q.get(timeout=.1)
+            except queue.Empty:
+                pass
+        return None
+
+    def decode():
+        try:
+            counter=0
+            readinto=BatchFrameReader(cap,size)
+            while cap.isOpened() and not stop.is_set():
+                frames = np.empty((batchsize, size[1], size[0], 3), dtype='ubyte')
+                batch_ind = 0
+                while batch_ind<batchsize and counter<nframes:
+                    with timer('decode'):
+                        ret=readinto(frames[batch_ind])
+                    if not ret:
+                        break
+                    batch_ind+=1
+                    counter+=1
+                if batch_ind>0:
+                    if not put(batches, (frames, batch_ind)):
+                        return
+                if batch_ind<batchsize: #end of video
+                    break
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            put(batches, None)
+
+    def postprocess():
+        try:
+            while True:
+                item = get(results)
+                if item is None:
+                    break
+                outputs_np, start, nvalid = item
+                with timer('postprocess'):
+                    pose = predict.poseNP_from_outputs(outputs_np, dlc_cfg)
+                    PredicteData[start:start+nvalid, :] = pose[:nvalid,:]
+                    if uncertainty is not None:
+                        uncertainty[start:start+nvalid] = predict.uncertaintyNP_from_outputs(outputs_np, dlc_cfg)[:nvalid]
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    decoder = threading.Thread(target=decode, daemon=True)
+    postprocessor = threading.Thread(target=postprocess, daemon=True)
+    decoder.start()
+    postprocessor.start()
+
+    pbar=tqdm(total=nframes)
+    counter=0
+    try:
+        while not stop.is_set():
+            item = get(batches)
+            if item is None:
+                break
+            frames, nvalid = item
+            with timer('network'):
+                outputs_np = predict.run_network(frames[:nvalid], dlc_cfg, sess, inputs, outputs, uncertainty is not None)
+            if not put(results, (outputs_np, counter, nvalid)):
+                break
+            counter+=nvalid
+            pbar.update(nvalid)
+    except Exception:
+        stop.set()
+        raise
+    finally:
+        put(results, None)
+        postprocessor.join()
+        stop.set() # releases the decoder in case it is still waiting
+        decoder.join()
+        pbar.close()
+
+    if errors:
+        raise errors[0]
+    nframes = counter
+    print("Detected frames: ", nframes)
+    with timer('postprocess'):
+        PredicteData=RescalePoses(PredicteData,nx,ny,size)
+        RescaleUncertainty(uncertainty,nx,ny,size)
+    return PredicteData,nframes
+
+def GetPoseS(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes,timer=None,uncertainty=None):
+    ''' Non batch wise pose estimation for video cap. The time of each stage is recorded with timer (an auxiliaryfunctions.StageTimer).
+    If uncertainty is given, it is filled with the score map statistics of every frame (see GetPoseF). '''
+    if timer is None:
+        timer=auxiliaryfunctions.StageTimer()
+    nx,ny=GetCroppedSize(cfg,cap)
+    size=GetInferenceSize(nx,ny,dlc_cfg)
     
     PredicteData = np.zeros((nframes, 3 * len(dlc_cfg['all_joints_names'])))
+    frame = np.empty((1, size[1], size[0], 3), dtype='ubyte') # reused for all frames
+    readinto=BatchFrameReader(cap,size)
     pbar=tqdm(total=nframes)
     counter=0
     step=max(10,int(nframes/100))
@@ -252,26 +666,495 @@ def GetPoseS(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes):
             if counter%step==0:
                 pbar.update(step)
             
-            ret, frame = cap.read()
+            if counter<nframes:
+                with timer('decode'): #decoding, cropping, color conversion (and resizing) directly into frame
+                    ret = readinto(frame[0])
+            else: #all requested frames were read (don't advance cap)
+                ret = False
             if ret:
-                frame=cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                if cfg['cropping']:
-                    frame= img_as_ubyte(frame[cfg['y1']:cfg['y2'],cfg['x1']:cfg['x2']])
-                else:
-                    frame = img_as_ubyte(frame)
-                pose = predict.getpose(frame, dlc_cfg, sess, inputs, outputs)
-                PredicteData[counter, :] = pose.flatten()  # NOTE: thereby cfg['all_joints_names'] should be same order as bodyparts!
+                with timer('network'):
+                    outputs_np = predict.run_network(frame, dlc_cfg, sess, inputs, outputs, uncertainty is not None)
+                with timer('postprocess'):
+                    pose = predict.pose_from_outputs(outputs_np, dlc_cfg)
+                    PredicteData[counter, :] = pose.flatten()  # NOTE: thereby cfg['all_joints_names'] should be same order as bodyparts!
+                    if uncertainty is not None:
+                        uncertainty[counter] = predict.uncertaintyNP_from_outputs(outputs_np, dlc_cfg)[0]
             else:
                 nframes=counter
                 break
             counter+=1
             
     pbar.close()
+    with timer('postprocess'):
+        PredicteData=RescalePoses(PredicteData,nx,ny,size)
+        RescaleUncertainty(uncertainty,nx,ny,size)
+    return PredicteData,nframes
+
+
+def GetROI(pose,detectiontreshold,margin,nx,ny,quantum=64,align=8):
+    ''' Box (x1,y1,x2,y2) around the body parts of pose (x,y,likelihood,x,y,...) that are detected with likelihood >= detectiontreshold, padded by margin pixels.
+    The box size is rounded up to a multiple of quantum pixels (so that the network sees few different input sizes), the box is moved inside the frame
+    (nx x ny) if necessary and its corner is aligned to multiples of align pixels (the stride of the network, so that the score map grid is the same as for the full frame). Returns None (i.e. use the full frame) if no body part is detected or the box would cover the full frame, and the number of detected body parts. '''
+    detected=pose[2::3]>=detectiontreshold
+    if not np.any(detected):
+        return None,0
+    box=[]
+    for coords,n in ((pose[0::3][detected],nx),(pose[1::3][detected],ny)):
+        low,high=np.min(coords)-margin,np.max(coords)+margin
+        width=min(n,int(np.ceil((high-low)/quantum))*quantum)
+        start=int(np.clip(round((low+high-width)/2.),0,n-width))//align*align
+        box.append((start,start+width))
+    (x1,x2),(y1,y2)=box
+    if x2-x1==nx and y2-y1==ny:
+        return None,0
+    return (x1,y1,x2,y2),int(np.sum(detected))
+
+def PredictFrames(frames,nx,ny,dlc_cfg, sess, inputs, outputs,timer=None):
+    ''' Predicts the poses for a list of (RGB) frames of the same size nx x ny (with dlc_cfg['inference_scale']). The stages are timed with timer (an auxiliaryfunctions.StageTimer). '''
+    if timer is None:
+        timer=auxiliaryfunctions.StageTimer()
+    size=GetInferenceSize(nx,ny,dlc_cfg)
+    with timer('crop_resize'):
+        batch=np.array([img_as_ubyte(ResizeFrame(frame,size)) for frame in frames])
+    with timer('network'):
+        outputs_np=predict.run_network(batch, dlc_cfg, sess, inputs, outputs)
+    with timer('postprocess'):
+        pose=predict.poseNP_from_outputs(outputs_np, dlc_cfg)
+        return RescalePoses(np.array(pose,dtype=float),nx,ny,size)
+
+def GetPoseDynamic(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes,batchsize,detectiontreshold=None,margin=20,timer=None):
+    ''' Batchwise pose estimation for video cap on a region of interest that follows the animal.
+
+    The frames of a batch are cropped to a box around the body parts that were detected (likelihood >= detectiontreshold, by default pcutoff) in the last frame of the previous batch,
+    padded by margin pixels. If the box does not fit into the frame, it is moved inside the frame. Frames in which fewer body parts are detected than in that reference frame
+    are analyzed again on the full frame, as are all frames while no box is defined (at the beginning and after losing the animal). The coordinates are translated back to the (cropped) frame.
+    The time of each stage is recorded with timer (an auxiliaryfunctions.StageTimer). '''
+    if timer is None:
+        timer=auxiliaryfunctions.StageTimer()
+    nx,ny=GetCroppedSize(cfg,cap)
+    if detectiontreshold is None:
+        detectiontreshold=cfg['pcutoff']
+
+    PredicteData = np.zeros((nframes, 3 * len(dlc_cfg['all_joints_names'])))
+    pbar=tqdm(total=nframes)
+    box,ndetected=None,0
+    counter=0
+    nfull=0 # number of frames analyzed on the full frame
+    while(cap.isOpened()):
+        batch=[]
+        while len(batch)<batchsize and counter+len(batch)<nframes:
+            with timer('decode'):
+                ret, frame = cap.read()
+            if not ret:
+                break
+            batch.append(frame)
+        if len(batch)==0:
+            break
+
+        if box is None:
+            full=np.ones(len(batch),dtype=bool)
+            pose=np.zeros((len(batch),PredicteData.shape[1]))
+        else:
+            x1,y1,x2,y2=box
+            pose=PredictFrames([frame[y1:y2,x1:x2] for frame in batch],x2-x1,y2-y1,dlc_cfg, sess, inputs, outputs,timer)
+            pose[:,0::3]+=x1
+            pose[:,1::3]+=y1
+            full=np.sum(pose[:,2::3]>=detectiontreshold,axis=1)<ndetected
+        if np.any(full):
+            indices=np.flatnonzero(full)
+            pose[indices]=PredictFrames([batch[i] for i in indices],nx,ny,dlc_cfg, sess, inputs, outputs,timer)
+            nfull+=len(indices)
+
+        PredicteData[counter:counter+len(batch), :] = pose
+        counter+=len(batch)
+        pbar.update(len(batch))
+        box,ndetected=GetROI(pose[-1],detectiontreshold,margin,nx,ny,align=int(dlc_cfg['stride']))
+        if len(batch)<batchsize:
+            break
+
+    pbar.close()
+    nframes=counter
+    print("Detected frames: ", nframes, "(analyzed on the full frame: %s)" %nfull)
+    return PredicteData,nframes
+
+def TileOrigins(length,tilesize,overlap,align):
+    ''' Origins of overlapping tiles of size tilesize that cover [0, length); the origins are multiples of align and neighboring tiles overlap by
+    at least overlap pixels. The last tile may extend beyond length by less than align pixels (this part is zero-padded, see GetPoseTiled). '''
+    if length<=tilesize:
+        return [0]
+    step=max(align,((tilesize-overlap)//align)*align)
+    last=int(np.ceil((length-tilesize)*1./align))*align
+    return sorted(set(list(range(0,last,step))+[last]))
+
+def TileCores(origins,tilesize,stride,mapsize):
+    ''' Score map rows (or columns) [start, stop) that are taken from each tile when stitching: the overlap of neighboring tiles is split in the middle. '''
+    bounds=[0]+[int(round((origins[i]+tilesize+origins[i+1])/2./stride)) for i in range(len(origins)-1)]+[mapsize]
+    return [(bounds[i],bounds[i+1]) for i in range(len(origins))]
+
+def GetPoseTiled(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes,batchsize,tilesize=512,overlap=128,timer=None,uncertainty=None):
+    ''' Pose estimation for very large frames by tiling: every frame is split into overlapping tiles of tilesize x tilesize pixels, which are evaluated
+    in batches of (at most) batchsize tiles. The score maps and location refinement fields of the tiles are stitched (the overlap is split in the middle,
+    so that every score map cell comes from the tile where it is farthest from the border) and the pose is extracted from the stitched maps as for a full frame.
+    The tile origins are multiples of twice the stride, so that the score map grids of all tiles coincide with the grid of the full frame. If overlap covers
+    the context the network uses, the poses equal those of full frame inference; the memory only depends on batchsize and tilesize.
+    The stitched maps are cropped to the cells whose centers lie in the frame, so that no body part is detected in the zero-padded part of the last tiles.
+    uncertainty (see GetPoseF) is computed from the stitched score maps. '''
+    if timer is None:
+        timer=auxiliaryfunctions.StageTimer()
+    nx,ny=GetCroppedSize(cfg,cap)
+    size=GetInferenceSize(nx,ny,dlc_cfg)
+    stride=int(dlc_cfg['stride'])
+    align=2*stride # the backbone has twice the stride of the (upsampled) score maps
+    tilesize=max(align,int(tilesize)//align*align)
+    overlap=min(int(overlap),tilesize-align)
+    tw,th=min(tilesize,size[0]),min(tilesize,size[1])
+    xorigins,yorigins=TileOrigins(size[0],tilesize,overlap,align),TileOrigins(size[1],tilesize,overlap,align)
+    tiles=[(ox,oy) for oy in yorigins for ox in xorigins]
+    framerows,framecols=int(np.ceil(size[1]*1./stride-.5)),int(np.ceil(size[0]*1./stride-.5)) # score map cells whose centers lie in the frame
+    print("Tiled inference with %s tiles of %s x %s pixels per frame." %(len(tiles),tw,th))
+
+    PredicteData = np.zeros((nframes, 3 * len(dlc_cfg['all_joints_names'])))
+    frame = np.empty((size[1], size[0], 3), dtype='ubyte')
+    batch = np.zeros((min(batchsize,len(tiles)), th, tw, 3), dtype='ubyte')
+    readinto=BatchFrameReader(cap,size)
+    pbar=tqdm(total=nframes)
+    counter=0
+    scmap=locref=None
+    while counter<nframes:
+        with timer('decode'):
+            ret = readinto(frame)
+        if not ret:
+            break
+        for start in range(0,len(tiles),len(batch)):
+            chunk=tiles[start:start+len(batch)]
+            with timer('crop_resize'):
+                for k,(ox,oy) in enumerate(chunk):
+                    tile=frame[oy:oy+th,ox:ox+tw]
+                    batch[k,:tile.shape[0],:tile.shape[1]]=tile
+                    batch[k,tile.shape[0]:]=0 # the last tiles may extend beyond the frame
+                    batch[k,:,tile.shape[1]:]=0
+            with timer('network'):
+                outputs_np = predict.run_network(batch[:len(chunk)], dlc_cfg, sess, inputs, outputs, True)
+            with timer('postprocess'):
+                tilescmap, tilelocref = predict.extract_cnn_outputmulti(outputs_np[:2] if dlc_cfg.location_refinement else outputs_np[:1], dlc_cfg)
+                if scmap is None: # stitched maps (the grid of the full frame)
+                    mh,mw=tilescmap.shape[1],tilescmap.shape[2]
+                    mapsize=(yorigins[-1]//stride+mh,xorigins[-1]//stride+mw)
+                    scmap=np.zeros((1,)+mapsize+tilescmap.shape[3:],dtype=tilescmap.dtype)
+                    locref=np.zeros(scmap.shape+(2,),dtype=np.float32)
+                    xcores=dict(zip(xorigins,TileCores(xorigins,tw,stride,mapsize[1])))
+                    ycores=dict(zip(yorigins,TileCores(yorigins,th,stride,mapsize[0])))
+                for k,(ox,oy) in enumerate(chunk):
+                    (r1,r2),(c1,c2)=ycores[oy],xcores[ox]
+                    mr,mc=oy//stride,ox//stride
+                    scmap[0,r1:r2,c1:c2]=tilescmap[k,r1-mr:r2-mr,c1-mc:c2-mc]
+                    if tilelocref is not None:
+                        locref[0,r1:r2,c1:c2]=tilelocref[k,r1-mr:r2-mr,c1-mc:c2-mc]
+        with timer('postprocess'):
+            framescmap,framelocref=scmap[:,:framerows,:framecols],locref[:,:framerows,:framecols]
+            PredicteData[counter, :] = predict.argmax_pose_predictmulti(framescmap, framelocref, dlc_cfg.stride)[0]
+            if uncertainty is not None:
+                uncertainty[counter] = predict.scoremap_statisticsNP(framescmap, dlc_cfg.stride)[0]
+        counter+=1
+        pbar.update(1)
+
+    pbar.close()
+    nframes=counter
+    print("Detected frames: ", nframes)
+    with timer('postprocess'):
+        PredicteData=RescalePoses(PredicteData,nx,ny,size)
+        RescaleUncertainty(uncertainty,nx,ny,size)
     return PredicteData,nframes
 
+def GetPoseSparse(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes,batchsize,interval=5,motionthreshold=4.,maxdisplacement=10.,timer=None):
+    ''' Pose estimation for video cap, where the network only runs on keyframes: every interval-th frame and every frame that differs from the last keyframe
+    by more than motionthreshold (mean absolute difference of the downsampled gray scale frames, in intensity units 0-255).
+
+    The poses of the frames between two keyframes are linearly interpolated, unless the poses of the two keyframes disagree, i.e. a body part moves by more than
+    maxdisplacement pixels or its likelihood crosses pcutoff; then the network is run on these frames, too. The frames between keyframes are kept in memory until
+    the next batch of keyframes is analyzed (at most batchsize * interval frames).
+
+    Returns the poses, the number of frames and a boolean array that indicates which frames were interpolated. The time of each stage is recorded with timer
+    (an auxiliaryfunctions.StageTimer; 'motion' is the comparison with the last keyframe, 'interpolate' the interpolation between keyframes). '''
+    if timer is None:
+        timer=auxiliaryfunctions.StageTimer()
+    nx,ny=GetCroppedSize(cfg,cap)
+    size=GetInferenceSize(nx,ny,dlc_cfg)
+    maxdisplacement=maxdisplacement*size[0]/nx #the poses are compared on the resized frames
+    pcutoff=cfg['pcutoff']
+
+    PredicteData = np.zeros((nframes, 3 * len(dlc_cfg['all_joints_names'])))
+    interpolated = np.zeros(nframes, dtype=bool)
+
+    def predictframes(frames):
+        poses=[]
+        for i in range(0,len(frames),batchsize):
+            with timer('network'):
+                outputs_np=predict.run_network(np.array(frames[i:i+batchsize]), dlc_cfg, sess, inputs, outputs)
+            with timer('postprocess'):
+                poses.append(predict.poseNP_from_outputs(outputs_np, dlc_cfg))
+        return np.concatenate(poses,axis=0)
+
+    def disagree(pose1,pose2):
+        detected1,detected2=pose1[2::3]>=pcutoff,pose2[2::3]>=pcutoff
+        both=detected1 & detected2
+        displacement=np.sqrt((pose1[0::3]-pose2[0::3])**2+(pose1[1::3]-pose2[1::3])**2)
+        return np.any(detected1!=detected2) or np.any(displacement[both]>maxdisplacement)
+
+    lastkey=[None,None] # index and pose of the last analyzed keyframe
+    def processkeyframes(keyframes):
+        # keyframes: list of (index, frame, frames since the previous keyframe as list of (index, frame))
+        poses=predictframes([frame for _,frame,_ in keyframes])
+        for (index,_,between),pose in zip(keyframes,poses):
+            PredicteData[index]=pose
+            if len(between)>0:
+                first,last=between[0][0],between[-1][0]
+                if disagree(lastkey[1],pose):
+                    PredicteData[first:last+1]=predictframes([frame for _,frame in between])
+                else:
+                    with timer('interpolate'):
+                        weights=(np.arange(first,last+1)-lastkey[0])/float(index-lastkey[0])
+                        PredicteData[first:last+1]=(1-weights[:,None])*lastkey[1]+weights[:,None]*pose
+                        interpolated[first:last+1]=True
+            lastkey[:]=[index,pose]
+
+    def downsample(frame):
+        return cv2.resize(cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY),(64,max(1,int(round(64.*frame.shape[0]/frame.shape[1])))),interpolation=cv2.INTER_AREA).astype(float)
+
+    pbar=tqdm(total=nframes)
+    keyframes=[]
+    between=[]
+    lastsmall,lastkeyindex=None,0
+    counter=0
+    while cap.isOpened() and counter<nframes:
+        with timer('decode'):
+            ret, frame = cap.read()
+        if not ret:
+            break
+        with timer('crop_resize'):
+            frame=img_as_ubyte(ResizeFrame(frame,size))
+        with timer('motion'):
+            small=downsample(frame)
+            keyframe=lastsmall is None or counter-lastkeyindex>=interval or np.mean(np.abs(small-lastsmall))>motionthreshold
+        if keyframe:
+            keyframes.append((counter,frame,between))
+            between=[]
+            lastsmall,lastkeyindex=small,counter
+            if len(keyframes)==batchsize:
+                processkeyframes(keyframes)
+                keyframes=[]
+        else:
+            between.append((counter,frame))
+        counter+=1
+        pbar.update(1)
+    if len(between)>0: #the last frame becomes a keyframe, so that all frames have two keyframes around them
+        index,frame=between.pop()
+        keyframes.append((index,frame,between))
+    if len(keyframes)>0:
+        processkeyframes(keyframes)
+    pbar.close()
+
+    nframes=counter
+    print("Detected frames: ", nframes, "(interpolated: %s)" %np.sum(interpolated[:nframes]))
+    with timer('postprocess'):
+        PredicteData=RescalePoses(PredicteData,nx,ny,size)
+    return PredicteData,nframes,interpolated[:nframes]
+
+def GetPose(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes,pipelined=False,timer=None,uncertainty=None):
+    ''' Picks the pose estimation routine for video cap (a reader that delivers RGB, cropped frames, see GetVideoReader) based on the batch size and dlc_cfg['dynamic'].
+    The stages are timed with timer (an auxiliaryfunctions.StageTimer). uncertainty (see GetPoseF) is not filled by GetPoseDynamic. '''
+    dynamic=dlc_cfg.get('dynamic',(False,None,20))
+    tiled=dlc_cfg.get('tiled',(False,512,128))
+    if tiled[0]:
+        return GetPoseTiled(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes,int(dlc_cfg["batch_size"]),tiled[1],tiled[2],timer,uncertainty)
+    elif dynamic[0]:
+        return GetPoseDynamic(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes,int(dlc_cfg["batch_size"]),dynamic[1],dynamic[2],timer)
+    elif int(dlc_cfg["batch_size"])>1 and pipelined:
+        return GetPosePipelined(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes,int(dlc_cfg["batch_size"]),timer=timer,uncertainty=uncertainty)
+    elif int(dlc_cfg["batch_size"])>1:
+        return GetPoseF(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes,int(dlc_cfg["batch_size"]),timer,uncertainty)
+    else:
+        return GetPoseS(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes,timer,uncertainty)
+
+def ReadFrameRanges(rangefile):
+    ''' Reads the windows to analyze from a csv file with the columns video, start and stop. Returns a dictionary video -> list of (start, stop). '''
+    if not os.path.isfile(rangefile):
+        raise FileNotFoundError("Could not find the file with the frame ranges: %s" %rangefile)
+    table=pd.read_csv(rangefile)
+    table.columns=[str(column).strip().lower() for column in table.columns]
+    if not set(['video','start','stop']).issubset(table.columns):
+        raise Exception("%s must have the columns video, start and stop." %rangefile)
+    frameranges={}
+    for video,start,stop in zip(table['video'],table['start'],table['stop']):
+        frameranges.setdefault(str(video).strip(),[]).append((start,stop))
+    return frameranges
+
+def FrameRangesOfVideo(frameranges,video):
+    ''' Returns the windows of video from frameranges (a list for all videos or a dictionary keyed by full path, file name or name without extension). '''
+    if frameranges is None or not isinstance(frameranges,dict):
+        return frameranges
+    ranges=[]
+    for key in set([video,os.path.abspath(video),os.path.basename(video),Path(video).stem]):
+        ranges.extend(frameranges.get(key,[]))
+    return ranges if len(ranges)>0 else None
+
+def GetFrameRanges(frameranges,nframes,fps,rangeunit='frames'):
+    ''' Converts frameranges (list of (start, stop), stop exclusive, in frames or seconds) into sorted, merged frame ranges within [0, nframes). '''
+    if rangeunit not in ('frames','seconds'):
+        raise ValueError("rangeunit must be 'frames' or 'seconds'.")
+    ranges=[]
+    for start,stop in frameranges:
+        if rangeunit=='seconds':
+            start,stop=int(np.floor(start*fps)),int(np.ceil(stop*fps))
+        start,stop=max(0,int(start)),min(nframes,int(stop))
+        if stop>start:
+            ranges.append([start,stop])
+    merged=[]
+    for start,stop in sorted(ranges):
+        if len(merged)>0 and start<=merged[-1][1]:
+            merged[-1][1]=max(merged[-1][1],stop)
+        else:
+            merged.append([start,stop])
+    return [(start,stop) for start,stop in merged]
+
+def GetPoseRanges(cfg,dlc_cfg, sess, inputs, outputs,cap,ranges,pipelined=False,timer=None,uncertainty=None):
+    ''' Pose estimation for the frame ranges (list of (start, stop)) of video cap: seeks to every range and analyzes its frames (see GetPose).
+    Returns the poses and the frame numbers of the analyzed frames. uncertainty (see GetPoseF) has one row per frame of the ranges (in order). '''
+    poses=[]
+    frameindex=[]
+    for start,stop in ranges:
+        print("Analyzing frames %s to %s" %(start,stop-1))
+        cap.set(cv2.CAP_PROP_POS_FRAMES,start)
+        offset=len(frameindex)
+        PredicteData,nread=GetPose(cfg,dlc_cfg, sess, inputs, outputs,cap,stop-start,pipelined,timer,
+                                   None if uncertainty is None else uncertainty[offset:offset+stop-start])
+        poses.append(PredicteData[:nread,:])
+        frameindex.extend(range(start,start+nread))
+        if nread<stop-start:
+            print("Only %s frames could be read from frame %s on." %(nread,start))
+    if len(poses)==0:
+        return np.zeros((0, 3 * len(dlc_cfg['all_joints_names']))),frameindex
+    return np.concatenate(poses,axis=0),frameindex
+
+def AnalyzeVideoSegment(video,cfg,dlc_cfg,startframe,nframes,partfile,nthreads=None,pipelined=False):
+    ''' Worker for GetPoseParallel: analyzes nframes frames of the video starting at startframe with its own session
+    and stores the poses in partfile (.npy). Returns the number of analyzed frames and the auxiliaryfunctions.StageTimer with the times of the stages. '''
+    session_config=predict.session_config_from_cfg(dlc_cfg)
+    if nthreads is not None: # the worker's share of the cores (the other session options, e.g. xla, are kept)
+        session_config.intra_op_parallelism_threads=nthreads
+        session_config.inter_op_parallelism_threads=min(2,nthreads)
+    sess, inputs, outputs = predict.setup_pose_prediction(dlc_cfg,session_config)
+    cap=GetVideoReader(video,cfg)
+    if startframe>0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES,startframe)
+    timer=auxiliaryfunctions.StageTimer()
+    PredicteData,nframes=GetPose(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes,pipelined,timer)
+    cap.release()
+    sess.close()
+    np.save(partfile,PredicteData[:nframes,:])
+    return nframes,timer
+
+def AnalyzeVideoSegmentWorker(index,results,*args):
+    ''' Process target of GetPoseParallel: runs AnalyzeVideoSegment(*args) and puts (index, number of frames, StageTimer, error message or None) in results. '''
+    import traceback
+    try:
+        results.put((index,)+AnalyzeVideoSegment(*args)+(None,))
+    except Exception:
+        results.put((index,0,None,traceback.format_exc()))
+
+def GetPoseParallel(video,cfg,dlc_cfg,nframes,partprefix,n_workers,pipelined=False,timer=None):
+    ''' Splits the video into n_workers contiguous frame ranges, which are analyzed by separate processes (each with its own session and
+    a share of the CPU cores). The partial results are stored as partprefix + '_part<i>.npy' and stitched together in order.
+    The stage times of all workers are added to timer (an auxiliaryfunctions.StageTimer), thus the totals are summed over the workers.
+
+    The workers are started with the 'spawn' method and import the main module of the caller again, thus a script that calls
+    analyze_videos with n_workers>1 has to protect the call by if __name__ == '__main__':. '''
+    import multiprocessing
+    import queue
+    nworkers=max(1,min(n_workers,nframes))
+    bounds=np.linspace(0,nframes,nworkers+1).astype(int)
+    nthreads=max(1,multiprocessing.cpu_count()//nworkers)
+    partfiles=[partprefix+'_part%s.npy' %i for i in range(nworkers)]
+    print("Analyzing the video with %s worker processes (%s threads each)." %(nworkers,nthreads))
+
+    # tensorflow is not fork-safe, thus the workers are started from scratch. A worker that dies without reporting (e.g. while importing the
+    # unguarded main module of the caller) is detected here, a multiprocessing.Pool would silently replace it and hang.
+    context=multiprocessing.get_context('spawn')
+    results=context.Queue()
+    workers=[context.Process(target=AnalyzeVideoSegmentWorker,args=(i,results,video,dict(cfg),dlc_cfg,bounds[i],bounds[i+1]-bounds[i],partfiles[i],nthreads,pipelined))
+             for i in range(nworkers)]
+    framecounts=[None]*nworkers
+    try:
+        try:
+            for worker in workers:
+                worker.start()
+            while None in framecounts:
+                try:
+                    i,count,workertimer,error=results.get(timeout=1)
+                except queue.Empty:
+                    for i,worker in enumerate(workers):
+                        if framecounts[i] is None and worker.exitcode is not None and results.empty(): # (a worker flushes its result before it exits)
+                            raise RuntimeError("Worker process %s terminated unexpectedly (exit code %s). If analyze_videos is called from a script with n_workers>1, "
+                                               "the call has to be protected by if __name__ == '__main__': (the workers import the script again). Otherwise use n_workers=1." %(i,worker.exitcode))
+                    continue
+                if error is not None:
+                    raise Exception("Worker process %s failed:\n%s" %(i,error))
+                framecounts[i]=count
+                if timer is not None:
+                    timer.merge(workertimer)
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+                if worker.pid is not None:
+                    worker.join()
 
-def AnalyzeVideo(video,DLCscorer,trainFraction,cfg,dlc_cfg,sess,inputs, outputs,pdindex,save_as_csv, destfolder=None):
-    ''' Helper function for analyzing a video '''
+        for i,count in enumerate(framecounts[:-1]):
+            if count<bounds[i+1]-bounds[i]:
+                raise Exception("Worker %s only read %s of %s frames starting from frame %s. Seeking does not seem to work reliably for this video, please use n_workers=1." %(i,count,bounds[i+1]-bounds[i],bounds[i]))
+        PredicteData=np.concatenate([np.load(partfile) for partfile in partfiles],axis=0)
+    finally:
+        for partfile in partfiles:
+            if os.path.isfile(partfile):
+                os.remove(partfile)
+    return PredicteData,len(PredicteData)
+
+def GetPoseChunked(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes,partialname,chunksize,pdindex,pipelined=False,timer=None):
+    ''' Pose estimation for video cap in chunks of chunksize frames. After every chunk the poses are appended to the HDF file partialname
+    together with the number of completed frames (progress marker). If partialname already exists (e.g. from an analysis that crashed),
+    the analysis continues at the first missing frame. Returns the poses of all frames. '''
+    done=0
+    if os.path.isfile(partialname):
+        with pd.HDFStore(partialname) as store:
+            if 'progress' in store:
+                done=int(store['progress'].iloc[0])
+                if store.get_storer('df_with_missing').nrows>done: #the last chunk was not completely written
+                    store.remove('df_with_missing',where='index>=%s' %done)
+            elif 'df_with_missing' in store: #crashed while writing the first chunk (before its progress marker)
+                store.remove('df_with_missing')
+        print("Found partial results for %s frames in %s, continuing from there." %(done,partialname))
+        if done>0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES,done)
+
+    while done<nframes:
+        nchunk=min(chunksize,nframes-done)
+        PredicteData,nread=GetPose(cfg,dlc_cfg, sess, inputs, outputs,cap,nchunk,pipelined,timer)
+        if nread>0:
+            with pd.HDFStore(partialname) as store:
+                store.append('df_with_missing',pd.DataFrame(PredicteData[:nread,:], columns=pdindex, index=range(done,done+nread)),format='table')
+                store.put('progress',pd.Series([done+nread]))
+            done+=nread
+        if nread<nchunk: #end of video
+            break
+
+    if done==0:
+        return np.zeros((0, 3 * len(dlc_cfg['all_joints_names']))),0
+    PredicteData=pd.read_hdf(partialname,'df_with_missing').values
+    return PredicteData,len(PredicteData)
+
+def AnalyzeVideo(video,DLCscorer,trainFraction,cfg,dlc_cfg,sess,inputs, outputs,pdindex,save_as_csv, destfolder=None,pipelined=False,n_workers=1,chunksize=None,use_cache=False,frameranges=None,rangeunit='frames'):
+    ''' Helper function for analyzing a video. Returns the name of the .h5 file with the results. If use_cache is True, the results are taken from / stored in the analysis cache.
+    If frameranges (list of (start, stop) in rangeunit) is given, only these frames are analyzed (see GetPoseRanges). '''
     print("Starting to analyze % ", video)
     vname = Path(video).stem
     if destfolder is None:
@@ -282,8 +1165,13 @@ def AnalyzeVideo(video,DLCscorer,trainFraction,cfg,dlc_cfg,sess,inputs, outputs,
         pd.read_hdf(dataname)
         print("Video already analyzed!", dataname)
     except FileNotFoundError:
+        if use_cache:
+            cachekey=cache.CacheKey(video,dlc_cfg,cfg,DLCscorer,None if frameranges is None else (list(frameranges),rangeunit))
+            if cache.LoadFromCache(cfg,cachekey,dataname,save_as_csv):
+                print("Found the results for a video with the same content in the analysis cache:", dataname)
+                return dataname
         print("Loading ", video)
-        cap=cv2.VideoCapture(video)
+        cap=GetVideoReader(video,cfg)
         
         fps = cap.get(5) #https://docs.opencv.org/2.4/modules/highgui/doc/reading_and_writing_images_and_video.html#videocapture-get
         nframes = int(cap.get(7))
@@ -294,12 +1182,37 @@ def AnalyzeVideo(video,DLCscorer,trainFraction,cfg,dlc_cfg,sess,inputs, outputs,
         print("Duration of video [s]: ", round(duration,2), ", recorded with ", round(fps,2),"fps!")
         print("Overall # of frames: ", nframes," found with (before cropping) frame dimensions: ", nx,ny)
         start = time.time()
+        timer = auxiliaryfunctions.StageTimer()
 
         print("Starting to extract posture")
-        if int(dlc_cfg["batch_size"])>1:
-            PredicteData,nframes=GetPoseF(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes,int(dlc_cfg["batch_size"]))
+        partialname = os.path.join(destfolder,vname + DLCscorer + '_partial.h5')
+        if chunksize is None and os.path.isfile(partialname):
+            chunksize=10000 #resume an analysis that was interrupted
+        interpolated=[]
+        ranges=None
+        frameindex=None
+        sparse=dlc_cfg['sparse']
+        uncertainty=None
+        if dlc_cfg.get('uncertainty',False):
+            if (dlc_cfg['dynamic'][0] and not dlc_cfg.get('tiled',(False,))[0]) or (frameranges is None and (sparse[0] or chunksize is not None or n_workers>1)):
+                print("The score map statistics are not computed with dynamic, sparse, chunksize or n_workers.")
+            else:
+                uncertainty=np.zeros((nframes,len(dlc_cfg['all_joints_names']),3))
+        if frameranges is not None:
+            ranges=GetFrameRanges(frameranges,nframes,fps,rangeunit)
+            print("Analyzing %s of %s frames in %s windows." %(sum(stop-start for start,stop in ranges),nframes,len(ranges)))
+            PredicteData,frameindex=GetPoseRanges(cfg,dlc_cfg, sess, inputs, outputs,cap,ranges,pipelined,timer,uncertainty)
+            nframes=len(frameindex)
+        elif sparse[0]:
+            PredicteData,nframes,interpolated=GetPoseSparse(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes,int(dlc_cfg["batch_size"]),sparse[1],sparse[2],sparse[3],timer)
+            interpolated=np.flatnonzero(interpolated)
+        elif chunksize is not None:
+            PredicteData,nframes=GetPoseChunked(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes,partialname,chunksize,pdindex,pipelined,timer)
+        elif n_workers>1:
+            cap.release()
+            PredicteData,nframes=GetPoseParallel(video,cfg,dlc_cfg,nframes,os.path.join(destfolder,vname + DLCscorer),n_workers,pipelined,timer)
         else:
-            PredicteData,nframes=GetPoseS(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes)
+            PredicteData,nframes=GetPose(cfg,dlc_cfg, sess, inputs, outputs,cap,nframes,pipelined,timer,uncertainty)
 
         stop = time.time()
         
@@ -312,12 +1225,24 @@ def AnalyzeVideo(video,DLCscorer,trainFraction,cfg,dlc_cfg,sess,inputs, outputs,
             "start": start,
             "stop": stop,
             "run_duration": stop - start,
+            "analysis_fps": nframes/(stop-start) if stop>start else None,
+            "peak_rss_MB": PeakMemoryMB(),
             "Scorer": DLCscorer,
             "DLC-model-config file": dlc_cfg,
             "fps": fps,
             "batch_size": dlc_cfg["batch_size"],
+            "inference_scale": dlc_cfg["inference_scale"],
+            "dynamic": dlc_cfg["dynamic"],
+            "sparse": dlc_cfg["sparse"],
+            "tiled": dlc_cfg.get("tiled",(False,512,128)),
+            "interpolated_frames": interpolated,
+            "pipelined": pipelined,
+            "n_workers": n_workers,
+            "chunksize": chunksize,
             "frame_dimensions": (ny, nx),
             "nframes": nframes,
+            "frame_ranges": ranges,
+            "uncertainty_file": None if uncertainty is None else os.path.basename(auxiliaryfunctions.GetUncertaintyFilename(dataname)),
             "iteration (active-learning)": cfg["iteration"],
             "training set fraction": trainFraction,
             "cropping": cfg['cropping'],
@@ -326,78 +1251,314 @@ def AnalyzeVideo(video,DLCscorer,trainFraction,cfg,dlc_cfg,sess,inputs, outputs,
         metadata = {'data': dictionary}
 
         print("Saving results in %s..." %(Path(video).parents[0]))
-        auxiliaryfunctions.SaveData(PredicteData[:nframes,:], metadata, dataname, pdindex, range(nframes),save_as_csv)
+        auxiliaryfunctions.SaveData(PredicteData[:nframes,:], metadata, dataname, pdindex, range(nframes) if frameindex is None else frameindex,save_as_csv,timer)
+        if uncertainty is not None:
+            auxiliaryfunctions.SaveUncertainty(uncertainty[:nframes], dataname, DLCscorer, dlc_cfg['all_joints_names'], range(nframes) if frameindex is None else frameindex)
+        if os.path.isfile(partialname):
+            os.remove(partialname)
+        if use_cache:
+            cache.StoreInCache(cfg,cachekey,dataname,video,DLCscorer)
+    return dataname
+
+def GetPoseMulti(cfg,Models,cap,nframes,batchsize,timer=None):
+    ''' Batchwise prediction of pose with several networks (see LoadModels): every frame of video cap is decoded once and fed to all networks.
+    The decoding stages are timed with timer, the network and post-processing stages with model['timer'] (auxiliaryfunctions.StageTimer).
+    Returns the poses of every network and the number of frames. '''
+    if timer is None:
+        timer=auxiliaryfunctions.StageTimer()
+    nx,ny=GetCroppedSize(cfg,cap)
+
+    size=GetInferenceSize(nx,ny,Models[0]['dlc_cfg']) # all networks use the same inference_scale
+    frames = np.empty((batchsize, size[1], size[0], 3), dtype='ubyte') # this keeps all frames in a batch
+    PredicteData = [np.zeros((nframes, 3 * len(model['dlc_cfg']['all_joints_names']))) for model in Models]
+
+    def processbatch(nbatch,offset):
+        for model,data in zip(Models,PredicteData):
+            with model['timer']('network'):
+                outputs_np = predict.run_network(frames[:nbatch],model['dlc_cfg'],model['sess'],model['inputs'],model['outputs'])
+            with model['timer']('postprocess'):
+                data[offset:offset+nbatch, :] = predict.poseNP_from_outputs(outputs_np,model['dlc_cfg'])
+
+    readinto=BatchFrameReader(cap,size)
+    pbar=tqdm(total=nframes)
+    counter=0
+    batch_ind=0
+    while counter<nframes:
+        with timer('decode'): #decoding, cropping, color conversion (and resizing) directly into the batch
+            ret = readinto(frames[batch_ind])
+        if not ret:
+            print("Detected frames: ", counter)
+            break
+        batch_ind+=1
+        counter+=1
+        if batch_ind==batchsize:
+            processbatch(batch_ind,counter-batch_ind)
+            batch_ind=0
+        pbar.update(1)
+    if batch_ind>0: #process the remaining frames (the batch dimension is dynamic)
+        processbatch(batch_ind,counter-batch_ind)
+    pbar.close()
+    return [RescalePoses(data,nx,ny,size) for data in PredicteData],counter
+
+def AnalyzeVideoMulti(video,trainFraction,cfg,Models,save_as_csv,destfolder=None):
+    ''' Helper function for analyzing a video with several networks in one pass (see LoadModels). Returns the names of the .h5 files with the results. '''
+    print("Starting to analyze % ", video)
+    vname = Path(video).stem
+    if destfolder is None:
+        destfolder = str(Path(video).parents[0])
+    datanames = [os.path.join(destfolder,vname + model['scorer'] + '.h5') for model in Models]
+    todo = [(model,dataname) for model,dataname in zip(Models,datanames) if not os.path.isfile(dataname)]
+    for model,dataname in zip(Models,datanames):
+        if os.path.isfile(dataname):
+            print("Video already analyzed!", dataname)
+    if len(todo)==0:
+        return datanames
+
+    print("Loading ", video)
+    cap=GetVideoReader(video,cfg)
+    fps = cap.get(5)
+    nframes = int(cap.get(7))
+    duration=nframes*1./fps
+    ny,nx=int(cap.get(4)),int(cap.get(3))
+    print("Duration of video [s]: ", round(duration,2), ", recorded with ", round(fps,2),"fps!")
+    print("Overall # of frames: ", nframes," found with (before cropping) frame dimensions: ", nx,ny)
+    start = time.time()
+    timer = auxiliaryfunctions.StageTimer()
+    for model,_ in todo:
+        model['timer'] = auxiliaryfunctions.StageTimer()
+
+    print("Starting to extract posture with %s networks" %len(todo))
+    PredicteData,nframes=GetPoseMulti(cfg,[model for model,_ in todo],cap,nframes,int(cfg['batch_size']),timer)
+    cap.release()
+    stop = time.time()
+
+    if cfg['cropping']==True:
+        coords=[cfg['x1'],cfg['x2'],cfg['y1'],cfg['y2']]
+    else:
+        coords=[0, nx, 0, ny]
+
+    print("Saving results in %s..." %(destfolder))
+    for (model,dataname),data in zip(todo,PredicteData):
+        dictionary = {
+            "start": start,
+            "stop": stop,
+            "run_duration": stop - start,
+            "analysis_fps": nframes/(stop-start) if stop>start else None,
+            "peak_rss_MB": PeakMemoryMB(),
+            "Scorer": model['scorer'],
+            "DLC-model-config file": model['dlc_cfg'],
+            "fps": fps,
+            "batch_size": model['dlc_cfg']["batch_size"],
+            "inference_scale": model['dlc_cfg']["inference_scale"],
+            "analyzed_together_with": [other['scorer'] for other,_ in todo if other is not model],
+            "frame_dimensions": (ny, nx),
+            "nframes": nframes,
+            "iteration (active-learning)": cfg["iteration"],
+            "training set fraction": trainFraction,
+            "cropping": cfg['cropping'],
+            "cropping_parameters": coords
+        }
+        metadata = {'data': dictionary}
+        modeltimer = auxiliaryfunctions.StageTimer() # shared decoding stages + the stages of this network
+        modeltimer.merge(timer)
+        modeltimer.merge(model.pop('timer'))
+        auxiliaryfunctions.SaveData(data[:nframes,:], metadata, dataname, model['pdindex'], range(nframes),save_as_csv,modeltimer)
+    return datanames
+
+def AnalyzeVideosBatched(Videos,DLCscorer,trainFraction,cfg,dlc_cfg,sess,inputs, outputs,pdindex,save_as_csv, destfolder=None,writequeuesize=16,use_video_sets_crop=False):
+    ''' Analyzes (short) videos with shared batches: the frames of consecutive videos with the same (cropped) dimensions fill the same batches. The results
+    (one .h5 file per video) are saved by a background thread (at most writequeuesize videos wait to be saved). Returns the names of the .h5 files.
+    If use_video_sets_crop is True, every video is cropped to its box in video_sets (see VideoCropConfig). '''
+    import queue
+    import threading
+    from collections import OrderedDict
+    batchsize=int(dlc_cfg['batch_size'])
+
+    datanames=[]
+    groups=OrderedDict() # videos grouped by (cropped) frame dimensions
+    for video in Videos:
+        folder = destfolder if destfolder is not None else str(Path(video).parents[0])
+        dataname = os.path.join(folder,Path(video).stem + DLCscorer + '.h5')
+        datanames.append(dataname)
+        if os.path.isfile(dataname):
+            print("Video already analyzed!", dataname)
+            continue
+        vcfg=VideoCropConfig(cfg,video) if use_video_sets_crop else cfg
+        cap=GetVideoReader(video,vcfg)
+        job={'video':video,'dataname':dataname,'cfg':vcfg,'fps':cap.get(5),'nx':int(cap.get(3)),'ny':int(cap.get(4))}
+        groups.setdefault(GetCroppedSize(vcfg,cap,verbose=False),[]).append(job)
+        cap.release()
+    njobs=sum(len(group) for group in groups.values())
+    if njobs==0:
+        return datanames
+    print("Analyzing %s videos (%s different frame dimensions) with batches across videos." %(njobs,len(groups)))
 
-def GetPosesofFrames(cfg,dlc_cfg, sess, inputs, outputs,directory,framelist,nframes,batchsize):
-    ''' Batchwise prediction of pose  for framelist in directory'''
+    writequeue=queue.Queue(maxsize=writequeuesize)
+    writeerrors=[]
+    def write():
+        while True:
+            item=writequeue.get()
+            if item is None:
+                break
+            try:
+                auxiliaryfunctions.SaveData(*item)
+            except Exception as e:
+                writeerrors.append(e)
+    writer=threading.Thread(target=write,daemon=True)
+    writer.start()
+
+    def save(job):
+        PredicteData=np.array(job['poses']).reshape(-1,3 * len(dlc_cfg['all_joints_names']))
+        nframes=len(PredicteData)
+        stop=time.time()
+        dictionary = {
+            "start": job['start'],
+            "stop": stop,
+            "run_duration": stop - job['start'],
+            "analysis_fps": nframes/(stop-job['start']) if stop>job['start'] else None,
+            "peak_rss_MB": PeakMemoryMB(),
+            "Scorer": DLCscorer,
+            "DLC-model-config file": dlc_cfg,
+            "fps": job['fps'],
+            "batch_size": dlc_cfg["batch_size"],
+            "inference_scale": dlc_cfg["inference_scale"],
+            "batch_across_videos": True,
+            "frame_dimensions": (job['ny'], job['nx']),
+            "nframes": nframes,
+            "iteration (active-learning)": cfg["iteration"],
+            "training set fraction": trainFraction,
+            "cropping": job['cfg']['cropping'],
+            "cropping_parameters": [job['cfg']['x1'],job['cfg']['x2'],job['cfg']['y1'],job['cfg']['y2']] if job['cfg']['cropping']==True else [0, job['nx'], 0, job['ny']]
+        }
+        metadata = {'data': dictionary}
+        writequeue.put((PredicteData, metadata, job['dataname'], pdindex, range(nframes), save_as_csv, job['timer']))
+
+    pbar=tqdm(total=njobs)
+    try:
+        for (nx,ny),group in groups.items(): # the cropping boxes were checked above
+            size=GetInferenceSize(nx,ny,dlc_cfg)
+            frames = np.empty((batchsize, size[1], size[0], 3), dtype='ubyte') # this keeps all frames in a batch
+            owners=[] # video (job) of every frame in the batch
+            finished=[] # videos that were read completely, but whose last frames might still be in the batch
+
+            def processbatch():
+                if len(owners)>0:
+                    start=time.perf_counter()
+                    outputs_np = predict.run_network(frames[:len(owners)],dlc_cfg, sess, inputs, outputs)
+                    networktime=time.perf_counter()-start
+                    poses = RescalePoses(predict.poseNP_from_outputs(outputs_np, dlc_cfg),nx,ny,size)
+                    postprocesstime=time.perf_counter()-start-networktime
+                    for job,pose in zip(owners,poses):
+                        job['poses'].append(pose)
+                    for job in {id(job):job for job in owners}.values(): # every video in this batch
+                        job['timer'].add('network',networktime)
+                        job['timer'].add('postprocess',postprocesstime)
+                    owners.clear()
+                for job in finished: # all their frames are analyzed now
+                    save(job)
+                    pbar.update(1)
+                finished.clear()
+
+            for job in group:
+                job.update({'poses':[],'timer':auxiliaryfunctions.StageTimer(),'start':time.time()})
+                cap=GetVideoReader(job['video'],job['cfg'])
+                readinto=BatchFrameReader(cap,size)
+                while True:
+                    with job['timer']('decode'): #decoding, cropping, color conversion (and resizing) directly into the batch
+                        ret = readinto(frames[len(owners)])
+                    if not ret:
+                        break
+                    owners.append(job)
+                    if len(owners)==batchsize:
+                        processbatch()
+                cap.release()
+                finished.append(job)
+            processbatch() #the last (incomplete) batch of this frame size
+    finally:
+        pbar.close()
+        writequeue.put(None)
+        writer.join()
+    if len(writeerrors)>0:
+        raise writeerrors[0]
+    return datanames
+
+def ReadFramesThreaded(directory,framelist,nthreads=4,prefetch=None):
+    ''' Reads the (RGB) images in framelist from directory with a pool of nthreads threads and yields (index, image) in the order of framelist.
+    At most prefetch images (default: 4 * nthreads) are read ahead. '''
+    from concurrent.futures import ThreadPoolExecutor
+    from collections import deque
     from skimage import io
+    if prefetch is None:
+        prefetch=4*nthreads
+    with ThreadPoolExecutor(max_workers=nthreads) as pool:
+        pending=deque()
+        for index,framename in enumerate(framelist):
+            pending.append((index,pool.submit(io.imread,os.path.join(directory,framename),mode='RGB')))
+            if len(pending)>=prefetch:
+                index,future=pending.popleft()
+                yield index,future.result()
+        while pending:
+            index,future=pending.popleft()
+            yield index,future.result()
+
+def GetPosesofFrames(cfg,dlc_cfg, sess, inputs, outputs,directory,framelist,nframes,batchsize,nthreads=4,mixed_sizes=False,timer=None,maxbuffered=None):
+    ''' Batchwise prediction of pose  for framelist in directory. The images are read by nthreads threads (in order, ahead of the network).
+    If mixed_sizes is True, images of the same size are collected into batches; otherwise all images must have the size of the first image.
+    At most maxbuffered images (default: 4 * batchsize) wait in incomplete batches; beyond that the batch with the oldest image is processed.
+    The time of each stage is recorded with timer (an auxiliaryfunctions.StageTimer); 'decode' is the time spent waiting for the reader threads. '''
+    from skimage import io
+    if timer is None:
+        timer=auxiliaryfunctions.StageTimer()
     print("Starting to extract posture")
     im=io.imread(os.path.join(directory,framelist[0]),mode='RGB')
     ny,nx,nc=np.shape(im)
     print("Overall # of frames: ", nframes," found with (before cropping) frame dimensions: ", nx,ny)
 
     PredicteData = np.zeros((nframes, 3 * len(dlc_cfg['all_joints_names'])))
-    batch_ind = 0 # keeps track of which image within a batch should be written to
-    batch_num = 0 # keeps track of which batch you are at
 
-    if cfg['cropping']:
-        print("Cropping based on the x1 = %s x2 = %s y1 = %s y2 = %s. You can adjust the cropping coordinates in the config.yaml file." %(cfg['x1'], cfg['x2'],cfg['y1'], cfg['y2']))
-        nx,ny=cfg['x2']-cfg['x1'],cfg['y2']-cfg['y1']
-        if nx>0 and ny>0:
-            pass
-        else:
-            raise Exception('Please check the order of cropping parameter!')
-        if cfg['x1']>=0 and cfg['x2']<int(np.shape(im)[1]) and cfg['y1']>=0 and cfg['y2']<int(np.shape(im)[0]):
-            pass #good cropping box
-        else:
-            raise Exception('Please check the boundary of cropping!')
-    
+    nx,ny=GetCroppedSize(cfg,None,(nx,ny))
+
+    if maxbuffered is None:
+        maxbuffered=4*batchsize
+    batches={} # (width, height) --> list of (index, frame)
+    def processbatch(framesize):
+        items=batches.pop(framesize)
+        size=GetInferenceSize(framesize[0],framesize[1],dlc_cfg)
+        with timer('crop_resize'):
+            frames=np.array([img_as_ubyte(ResizeFrame(frame,size)) for _,frame in items])
+        with timer('network'):
+            outputs_np=predict.run_network(frames, dlc_cfg, sess, inputs, outputs)
+        with timer('postprocess'):
+            pose=predict.poseNP_from_outputs(outputs_np, dlc_cfg)
+            PredicteData[[index for index,_ in items], :] = RescalePoses(np.array(pose,dtype=float),framesize[0],framesize[1],size)
+
     pbar=tqdm(total=nframes)
-    counter=0
-    step=max(10,int(nframes/100))
-    
-    if batchsize==1:
-        for counter,framename in enumerate(framelist):
-                frame=io.imread(os.path.join(directory,framename),mode='RGB')
-                if counter%step==0:
-                    pbar.update(step)
-
-                if cfg['cropping']:
-                    frame= img_as_ubyte(frame[cfg['y1']:cfg['y2'],cfg['x1']:cfg['x2'],:])
-                else:
-                    frame = img_as_ubyte(frame)
-                    
-                pose = predict.getpose(frame, dlc_cfg, sess, inputs, outputs)
-                PredicteData[counter, :] = pose.flatten()
-    else:
-        frames = np.empty((batchsize, ny, nx, 3), dtype='ubyte') # this keeps all the frames of a batch
-        for counter,framename in enumerate(framelist):
-                frame=io.imread(os.path.join(directory,framename),mode='RGB')
-                if counter%step==0:
-                    pbar.update(step)
-
-                if cfg['cropping']:
-                    frames[batch_ind] = img_as_ubyte(frame[cfg['y1']:cfg['y2'],cfg['x1']:cfg['x2'],:])
-                else:
-                    frames[batch_ind] = img_as_ubyte(frame)
-                    
-                if batch_ind==batchsize-1:
-                    pose = predict.getposeNP(frames,dlc_cfg, sess, inputs, outputs)
-                    PredicteData[batch_num*batchsize:(batch_num+1)*batchsize, :] = pose
-                    batch_ind = 0
-                    batch_num += 1
-                else:
-                   batch_ind+=1
-            
-        if batch_ind>0: #take care of the last frames (the batch that might have been processed)
-            pose = predict.getposeNP(frames, dlc_cfg, sess, inputs, outputs) #process the whole batch (some frames might be from previous batch!)
-            PredicteData[batch_num*batchsize:batch_num*batchsize+batch_ind, :] = pose[:batch_ind,:]
+    reader=ReadFramesThreaded(directory,framelist,nthreads)
+    while True:
+        with timer('decode'):
+            item=next(reader,None)
+        if item is None:
+            break
+        counter,frame=item
+        if cfg['cropping']:
+            frame=frame[cfg['y1']:cfg['y2'],cfg['x1']:cfg['x2'],:]
+        framesize=(frame.shape[1],frame.shape[0])
+        if not mixed_sizes and framesize!=(nx,ny):
+            raise Exception("The image %s has a different size than the first image. Use mixed_sizes=True to analyze folders with images of different sizes." %framelist[counter])
+        batches.setdefault(framesize,[]).append((counter,frame))
+        if len(batches[framesize])==batchsize:
+            processbatch(framesize)
+        elif sum(len(items) for items in batches.values())>maxbuffered: # many different sizes: process the (incomplete) batch that waits longest
+            processbatch(min(batches,key=lambda size: batches[size][0][0]))
+        pbar.update(1)
+    for framesize in list(batches.keys()): #take care of the last frames (incomplete batches)
+        processbatch(framesize)
 
     pbar.close()
     return PredicteData,nframes,nx,ny
 
 
-def analyze_time_lapse_frames(config,directory,frametype='.png',shuffle=1,trainingsetindex=0,gputouse=None,save_as_csv=False):
+def analyze_time_lapse_frames(config,directory,frametype='.png',shuffle=1,trainingsetindex=0,gputouse=None,save_as_csv=False,use_exported_model=False,inference_scale=1,nthreads=4,mixed_sizes=False):
     """
     Analyzed all images (of type = frametype) in a folder and stores the output in one file. 
     
@@ -431,6 +1592,21 @@ def analyze_time_lapse_frames(config,directory,frametype='.png',shuffle=1,traini
     save_as_csv: bool, optional
         Saves the predictions in a .csv file. The default is ``False``; if provided it must be either ``True`` or ``False``
 
+    use_exported_model: bool, optional
+        If True, the frozen inference graph of the snapshot created by ``export_model`` is loaded instead of building the network and restoring the checkpoint.
+        This starts faster and the optimized graph is typically faster per frame. The default is ``False``
+
+    inference_scale: float, optional
+        Factor by which the (cropped) frames are resized before they are fed to the network, e.g. 0.5 for half the resolution (about 4 times fewer computations).
+        The predicted coordinates are mapped back to the original pixel coordinates. Only use it if the network tracks well enough at that resolution. The default is 1.
+
+    nthreads: int, optional
+        Number of threads that read (and decode) the images ahead of the network. More threads help for compressed images on slow (network) storage. The default is 4.
+
+    mixed_sizes: bool, optional
+        If True, the folder may contain images of different sizes; images of the same size are analyzed together in batches. At most 4 * batch_size images wait
+        for their batch to fill up; beyond that the batch with the oldest image is analyzed (incomplete). The default is ``False``
+
     Examples
     --------
     If you want to analyze all frames in /analysis/project/timelapseexperiment1
@@ -451,43 +1627,11 @@ def analyze_time_lapse_frames(config,directory,frametype='.png',shuffle=1,traini
     
     cfg = auxiliaryfunctions.read_config(config)
     trainFraction = cfg['TrainingFraction'][trainingsetindex]
-    modelfolder=os.path.join(cfg["project_path"],str(auxiliaryfunctions.GetModelFolder(trainFraction,shuffle,cfg)))
-    path_test_config = Path(modelfolder) / 'test' / 'pose_cfg.yaml'
-    try:
-        dlc_cfg = load_config(str(path_test_config))
-    except FileNotFoundError:
-        raise FileNotFoundError("It seems the model for shuffle %s and trainFraction %s does not exist."%(shuffle,trainFraction))
-
-    # Check which snapshots are available and sort them by # iterations
-    try:
-      Snapshots = np.array([fn.split('.')[0]for fn in os.listdir(os.path.join(modelfolder , 'train'))if "index" in fn])
-    except FileNotFoundError:
-      raise FileNotFoundError("Snapshots not found! It seems the dataset for shuffle %s has not been trained/does not exist.\n Please train it before using it to analyze videos.\n Use the function 'train_network' to train the network for shuffle %s."%(shuffle,shuffle))
-
-    if cfg['snapshotindex'] == 'all':
-        print("Snapshotindex is set to 'all' in the config.yaml file. Running video analysis with all snapshots is very costly! Use the function 'evaluate_network' to choose the best the snapshot. For now, changing snapshot index to -1!")
-        snapshotindex = -1
-    else:
-        snapshotindex=cfg['snapshotindex']
-        
-    increasing_indices = np.argsort([int(m.split('-')[1]) for m in Snapshots])
-    Snapshots = Snapshots[increasing_indices]
-    
-    print("Using %s" % Snapshots[snapshotindex], "for model", modelfolder)
-
-    ##################################################
-    # Load and setup CNN part detector
-    ##################################################
-
-    # Check if data already was generated:
-    dlc_cfg['init_weights'] = os.path.join(modelfolder , 'train', Snapshots[snapshotindex])
-    trainingsiterations = (dlc_cfg['init_weights'].split(os.sep)[-1]).split('-')[-1]
-    
+    dlc_cfg, DLCscorer = LoadModelConfig(cfg,shuffle,trainFraction,use_exported_model=use_exported_model)
     #update batchsize (based on parameters in config.yaml)
-    dlc_cfg['batch_size']=cfg['batch_size'] 
-    
-    # Name for scorer:
-    DLCscorer = auxiliaryfunctions.GetScorerName(cfg,shuffle,trainFraction,trainingsiterations=trainingsiterations)
+    dlc_cfg['batch_size']=cfg['batch_size']
+    dlc_cfg['inference_scale']=inference_scale
+
     sess, inputs, outputs = predict.setup_pose_prediction(dlc_cfg)
     pdindex = pd.MultiIndex.from_product([[DLCscorer], dlc_cfg['all_joints_names'], ['x', 'y', 'likelihood']],names=['scorer', 'bodyparts', 'coords'])
 
@@ -516,8 +1660,9 @@ def analyze_time_lapse_frames(config,directory,frametype='.png',shuffle=1,traini
             nframes = len(framelist)
             if nframes>1:
                 start = time.time()
+                timer = auxiliaryfunctions.StageTimer()
                 
-                PredicteData,nframes,nx,ny=GetPosesofFrames(cfg,dlc_cfg, sess, inputs, outputs,directory,framelist,nframes,dlc_cfg['batch_size'])
+                PredicteData,nframes,nx,ny=GetPosesofFrames(cfg,dlc_cfg, sess, inputs, outputs,directory,framelist,nframes,dlc_cfg['batch_size'],nthreads,mixed_sizes,timer)
                 stop = time.time()
                 
                 if cfg['cropping']==True:
@@ -529,9 +1674,13 @@ def analyze_time_lapse_frames(config,directory,frametype='.png',shuffle=1,traini
                     "start": start,
                     "stop": stop,
                     "run_duration": stop - start,
+                    "analysis_fps": nframes/(stop-start) if stop>start else None,
+                    "peak_rss_MB": PeakMemoryMB(),
                     "Scorer": DLCscorer,
                     "config file": dlc_cfg,
                     "batch_size": dlc_cfg["batch_size"],
+                    "inference_scale": dlc_cfg["inference_scale"],
+                    "mixed_sizes": mixed_sizes,
                     "frame_dimensions": (ny, nx),
                     "nframes": nframes,
                     "cropping": cfg['cropping'],
@@ -541,7 +1690,7 @@ def analyze_time_lapse_frames(config,directory,frametype='.png',shuffle=1,traini
         
                 print("Saving results in %s..." %(directory))
                 
-                auxiliaryfunctions.SaveData(PredicteData[:nframes,:], metadata, dataname, pdindex, framelist,save_as_csv)
+                auxiliaryfunctions.SaveData(PredicteData[:nframes,:], metadata, dataname, pdindex, framelist,save_as_csv,timer)
                 print("The folder was analyzed. Now your research can truly start!")
                 print("If the tracking is not satisfactory for some frome, consider expanding the training set.")
             else:
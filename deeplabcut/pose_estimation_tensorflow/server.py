@@ -0,0 +1,360 @@
+"""
+DeepLabCut2.0 Toolbox
+https://github.com/AlexEMG/DeepLabCut
+A Mathis, alexander.mathis@bethgelab.org
+T Nath, nath@rowland.harvard.edu
+M Mathis, mackenzie@post.harvard.edu
+
+A persistent inference server: the networks are loaded once and then analyze videos or frame batches submitted by clients over a
+local HTTP port (see deeplabcut.serve and deeplabcut.analyze_videos_remote).
+"""
+
+import os
+import io
+import json
+import time
+import queue
+import threading
+from collections import deque
+import numpy as np
+import pandas as pd
+
+from deeplabcut.utils import auxiliaryfunctions
+
+
+class PoseServer(object):
+    ''' Holds the loaded networks and the worker threads that process the queued requests.
+
+    Video requests are processed one after the other by a video worker. Frame requests (batches of frames) of concurrent clients are collected
+    by a frame worker into batches of up to maxbatchsize frames (waiting at most maxwait seconds for further requests), so that the network runs on
+    full batches. '''
+
+    def __init__(self,config,shuffles=[1],trainingsetindex=0,snapshotindex=None,use_exported_model=False,maxbatchsize=None,maxwait=0.01):
+        from deeplabcut.pose_estimation_tensorflow.nnet import predict
+        from deeplabcut.pose_estimation_tensorflow.predict_videos import LoadModelConfig
+
+        if 'TF_CUDNN_USE_AUTOTUNE' in os.environ:
+            del os.environ['TF_CUDNN_USE_AUTOTUNE'] #was potentially set during training
+
+        self.config=config
+        self.cfg=auxiliaryfunctions.read_config(config)
+        self.trainFraction=self.cfg['TrainingFraction'][trainingsetindex]
+        self.maxbatchsize=maxbatchsize if maxbatchsize is not None else self.cfg['batch_size']
+        self.maxwait=maxwait
+
+        self.models={}
+        for shuffle in shuffles:
+            dlc_cfg, DLCscorer = LoadModelConfig(self.cfg,shuffle,self.trainFraction,snapshotindex,use_exported_model=use_exported_model)
+            dlc_cfg['batch_size']=self.cfg['batch_size']
+            dlc_cfg['inference_scale']=1
+            dlc_cfg['dynamic']=(False,None,20)
+            dlc_cfg['sparse']=(False,5,4.,10.)
+            # every call builds a new (default) graph; the session keeps its own graph alive
+            sess, inputs, outputs = predict.setup_pose_prediction(dlc_cfg)
+            pdindex = pd.MultiIndex.from_product([[DLCscorer], dlc_cfg['all_joints_names'], ['x', 'y', 'likelihood']],names=['scorer', 'bodyparts', 'coords'])
+            self.models[int(shuffle)]={'dlc_cfg':dlc_cfg,'scorer':DLCscorer,'sess':sess,'inputs':inputs,'outputs':outputs,'pdindex':pdindex}
+
+        self.videojobs=queue.Queue()
+        self.framerequests=queue.Queue()
+        self.stopping=False
+        self.lock=threading.Lock()
+        self.workers=[threading.Thread(target=self.videoworker,daemon=True),threading.Thread(target=self.frameworker,daemon=True)]
+        for worker in self.workers:
+            worker.start()
+
+    def getmodel(self,shuffle):
+        try:
+            return self.models[int(shuffle)]
+        except KeyError:
+            raise ValueError("The server has not loaded a model for shuffle %s (loaded: %s)." %(shuffle,sorted(self.models.keys())))
+
+    def submit(self,requests,request):
+        ''' Queues a request and waits until it is processed. '''
+        with self.lock:
+            if self.stopping:
+                raise RuntimeError("The server is shutting down.")
+            request['done']=threading.Event()
+            requests.put(request)
+        request['done'].wait()
+        if request.get('error') is not None:
+            raise request['error']
+        return request['result']
+
+    def analyze_videos(self,videos,shuffle=1,videotype='avi',save_as_csv=False,destfolder=None):
+        ''' Analyzes the videos (or all videos of videotype in a directory) and returns the names of the .h5 files with the results. '''
+        self.getmodel(shuffle)
+        return self.submit(self.videojobs,{'videos':videos,'shuffle':shuffle,'videotype':videotype,'save_as_csv':save_as_csv,'destfolder':destfolder})
+
+    def predict_frames(self,frames,shuffle=1):
+        ''' Predicts the poses of a batch of frames (array of shape (nframes, height, width, 3), RGB, uint8) and returns an array of shape (nframes, 3 * #bodyparts). '''
+        self.getmodel(shuffle)
+        frames=np.asarray(frames)
+        if frames.ndim==3:
+            frames=frames[np.newaxis]
+        if frames.ndim!=4 or frames.shape[3]!=3:
+            raise ValueError("Expected a batch of RGB frames (nframes x height x width x 3), got an array of shape %s." %(frames.shape,))
+        return self.submit(self.framerequests,{'frames':frames,'shuffle':int(shuffle)})
+
+    def videoworker(self):
+        from deeplabcut.pose_estimation_tensorflow.predict_videos import AnalyzeVideo
+        while True:
+            job=self.videojobs.get()
+            if job is None:
+                break
+            try:
+                model=self.getmodel(job['shuffle'])
+                videos=job['videos']
+                if isinstance(videos,str):
+                    videos=[videos]
+                if len(videos)==1 and os.path.isdir(videos[0]):
+                    videos=[os.path.join(videos[0],fn) for fn in sorted(os.listdir(videos[0])) if (job['videotype'] in fn) and ('_labeled.mp4' not in fn)]
+                missing=[v for v in videos if not os.path.isfile(v)]
+                if len(missing)>0:
+                    raise FileNotFoundError("Videos not found: %s" %missing)
+                job['result']=[AnalyzeVideo(video,model['scorer'],self.trainFraction,self.cfg,model['dlc_cfg'],model['sess'],model['inputs'],model['outputs'],model['pdindex'],job['save_as_csv'],job['destfolder']) for video in videos]
+            except Exception as e:
+                job['error']=e
+            job['done'].set()
+
+    def frameworker(self):
+        from deeplabcut.pose_estimation_tensorflow.nnet import predict
+        deferred=deque() # requests that did not fit into the current batch (other model or frame size)
+        while True:
+            request=deferred.popleft() if len(deferred)>0 else self.framerequests.get()
+            if request is None:
+                break
+            key=(request['shuffle'],request['frames'].shape[1:])
+            batch=[request]
+            nframes=len(request['frames'])
+            deadline=time.time()+self.maxwait
+            while nframes<self.maxbatchsize:
+                timeout=deadline-time.time()
+                if timeout<=0:
+                    break
+                try:
+                    other=self.framerequests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if other is not None and (other['shuffle'],other['frames'].shape[1:])==key:
+                    batch.append(other)
+                    nframes+=len(other['frames'])
+                else:
+                    deferred.append(other)
+                    if other is None:
+                        break
+            try:
+                model=self.getmodel(key[0])
+                frames=np.concatenate([r['frames'] for r in batch]) if len(batch)>1 else request['frames']
+                poses=[]
+                for i in range(0,len(frames),self.maxbatchsize):
+                    poses.append(predict.getposeNP(frames[i:i+self.maxbatchsize],model['dlc_cfg'],model['sess'],model['inputs'],model['outputs']))
+                poses=np.concatenate(poses)
+                start=0
+                for r in batch:
+                    r['result']=poses[start:start+len(r['frames'])]
+                    start+=len(r['frames'])
+            except Exception as e:
+                for r in batch:
+                    r['error']=e
+            for r in batch:
+                r['done'].set()
+
+    def status(self):
+        return {'config':self.config,
+                'models':{str(shuffle):{'scorer':model['scorer'],'bodyparts':list(model['dlc_cfg']['all_joints_names'])} for shuffle,model in self.models.items()},
+                'queued_video_requests':self.videojobs.qsize(),
+                'queued_frame_requests':self.framerequests.qsize(),
+                'max_batch_size':self.maxbatchsize}
+
+    def close(self):
+        ''' Stops accepting requests, finishes the queued requests and closes the sessions. '''
+        with self.lock:
+            self.stopping=True
+            self.videojobs.put(None)
+            self.framerequests.put(None)
+        for worker in self.workers:
+            worker.join()
+        for model in self.models.values():
+            model['sess'].close()
+
+def MakeRequestHandler(poseserver,httpd):
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import urlparse, parse_qs
+
+    class PoseRequestHandler(BaseHTTPRequestHandler):
+        def reply(self,code,body,contenttype='application/json'):
+            if contenttype=='application/json':
+                body=json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header('Content-Type',contenttype)
+            self.send_header('Content-Length',str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self,format,*args):
+            pass
+
+        def do_GET(self):
+            if urlparse(self.path).path=='/status':
+                self.reply(200,poseserver.status())
+            else:
+                self.reply(404,{'error':'Unknown path %s' %self.path})
+
+        def do_POST(self):
+            url=urlparse(self.path)
+            body=self.rfile.read(int(self.headers.get('Content-Length',0)))
+            try:
+                if url.path=='/analyze_videos':
+                    request=json.loads(body.decode())
+                    self.reply(200,{'results':poseserver.analyze_videos(**request)})
+                elif url.path=='/predict_frames':
+                    shuffle=int(parse_qs(url.query).get('shuffle',[1])[0])
+                    poses=poseserver.predict_frames(np.load(io.BytesIO(body)),shuffle)
+                    buffer=io.BytesIO()
+                    np.save(buffer,poses)
+                    self.reply(200,buffer.getvalue(),'application/octet-stream')
+                elif url.path=='/shutdown':
+                    self.reply(200,{'result':'shutting down'})
+                    threading.Thread(target=httpd.shutdown,daemon=True).start()
+                else:
+                    self.reply(404,{'error':'Unknown path %s' %url.path})
+            except Exception as e:
+                self.reply(500,{'error':'%s: %s' %(type(e).__name__,e)})
+
+    return PoseRequestHandler
+
+def serve(config,shuffles=[1],trainingsetindex=0,snapshotindex=None,gputouse=None,use_exported_model=False,host='127.0.0.1',port=8765,maxbatchsize=None,maxwait=0.01):
+    """
+    Starts a local pose inference server. The networks are loaded once and the server then analyzes videos and frame batches submitted by clients,
+    so that jobs do not pay for importing tensorflow and restoring the weights. Requests are queued; frame batches of concurrent clients are
+    combined into (up to) batch size frames. The server runs until it receives a shutdown request (see ``shutdown_server``) or Ctrl+C; queued requests are finished before it stops.
+
+    Endpoints (JSON unless noted): GET /status, POST /analyze_videos, POST /predict_frames?shuffle=1 (a numpy array in .npy format as request and reply body) and POST /shutdown.
+    Use ``analyze_videos_remote``, ``predict_frames_remote``, ``server_status`` and ``shutdown_server`` as clients.
+
+    Parameters
+    ----------
+    config : string
+        Full path of the config.yaml file as a string.
+
+    shuffles: list of int, optional
+        The shuffles whose networks are loaded. The default is [1].
+
+    trainingsetindex: int, optional
+        Integer specifying which TrainingsetFraction to use. By default the first (note that TrainingFraction is a list in config.yaml).
+
+    snapshotindex: int, optional
+        Index of the snapshot (sorted by training iterations). The default is ``None``, i.e. the snapshotindex in the config.yaml file is used.
+
+    gputouse: int, optional. Natural number indicating the number of your GPU (see number in nvidia-smi). If you do not have a GPU put None.
+
+    use_exported_model: bool, optional
+        If True, the frozen graphs created by ``export_model`` are loaded. The default is ``False``
+
+    host: string, optional
+        The address the server listens on. The default is '127.0.0.1', i.e. only local clients can connect.
+
+    port: int, optional
+        The port the server listens on. The default is 8765.
+
+    maxbatchsize: int, optional
+        Maximal number of frames per network evaluation. The default is ``None``, i.e. the batch_size in the config.yaml file.
+
+    maxwait: float, optional
+        How long (in seconds) the server waits for further frame requests to fill a batch. The default is 0.01.
+
+    Examples
+    --------
+    >>> deeplabcut.serve('/analysis/project/reaching-task/config.yaml',shuffles=[1,2])
+    --------
+
+    """
+    from http.server import HTTPServer
+    from socketserver import ThreadingMixIn
+
+    if gputouse is not None: #gpu selectinon
+        os.environ['CUDA_VISIBLE_DEVICES'] = str(gputouse)
+
+    class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    poseserver=PoseServer(config,shuffles,trainingsetindex,snapshotindex,use_exported_model,maxbatchsize,maxwait)
+    httpd=ThreadingHTTPServer((host,port),None)
+    httpd.RequestHandlerClass=MakeRequestHandler(poseserver,httpd)
+    print("Serving the models for shuffle(s) %s on http://%s:%s (stop with Ctrl+C or deeplabcut.shutdown_server)" %(sorted(poseserver.models.keys()),host,port))
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Shutting down the server after the queued requests are processed...")
+        poseserver.close()
+        httpd.server_close()
+
+def PostRequest(host,port,path,body,contenttype='application/json',timeout=None):
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError
+    request=Request('http://%s:%s%s' %(host,port,path),data=body,headers={'Content-Type':contenttype})
+    try:
+        with urlopen(request,timeout=timeout) as response:
+            return response.read()
+    except HTTPError as e:
+        try:
+            message=json.loads(e.read().decode())['error']
+        except Exception:
+            message=str(e)
+        raise RuntimeError("The pose server returned an error: %s" %message)
+
+def analyze_videos_remote(videos,shuffle=1,videotype='avi',save_as_csv=False,destfolder=None,host='127.0.0.1',port=8765):
+    """
+    Analyzes videos with a running pose server (see ``deeplabcut.serve``), i.e. like ``analyze_videos`` but without loading the network.
+    Returns the names of the .h5 files with the results.
+
+    Parameters
+    ----------
+    videos : list
+        A list of strings containing the full paths to videos for analysis or a path to the directory, where all the videos with same extension are stored.
+
+    shuffle: int, optional
+        The shuffle of the network (it must be loaded by the server). The default is 1.
+
+    videotype: string, optional
+        Checks for the extension of the video in case the input to the video is a directory.\n Only videos with this extension are analyzed. The default is ``.avi``
+
+    save_as_csv: bool, optional
+        Saves the predictions in a .csv file. The default is ``False``
+
+    destfolder: string, optional
+        Specifies the destination folder for analysis data (default is the path of the video).
+
+    host, port: optional
+        Address of the server. The defaults are '127.0.0.1' and 8765.
+
+    Examples
+    --------
+    >>> deeplabcut.analyze_videos_remote(['/analysis/project/videos/reachingvideo1.avi'])
+    --------
+
+    """
+    if isinstance(videos,str):
+        videos=[videos]
+    request={'videos':[os.path.abspath(v) for v in videos],'shuffle':shuffle,'videotype':videotype,'save_as_csv':save_as_csv,
+             'destfolder':os.path.abspath(destfolder) if destfolder is not None else None}
+    return json.loads(PostRequest(host,port,'/analyze_videos',json.dumps(request).encode()).decode())['results']
+
+def predict_frames_remote(frames,shuffle=1,host='127.0.0.1',port=8765):
+    ''' Predicts the poses of a batch of RGB frames (uint8 array of shape (nframes, height, width, 3)) with a running pose server.
+    Returns an array of shape (nframes, 3 * #bodyparts) with x, y and likelihood of each bodypart. '''
+    buffer=io.BytesIO()
+    np.save(buffer,np.asarray(frames,dtype=np.uint8))
+    return np.load(io.BytesIO(PostRequest(host,port,'/predict_frames?shuffle=%s' %int(shuffle),buffer.getvalue(),'application/octet-stream')))
+
+def server_status(host='127.0.0.1',port=8765):
+    ''' Returns the loaded models and the number of queued requests of a running pose server. '''
+    from urllib.request import urlopen
+    with urlopen('http://%s:%s/status' %(host,port)) as response:
+        return json.loads(response.read().decode())
+
+def shutdown_server(host='127.0.0.1',port=8765):
+    ''' Stops a running pose server (queued requests are finished first). '''
+    PostRequest(host,port,'/shutdown',b'{}')
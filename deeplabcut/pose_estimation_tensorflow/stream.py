@@ -0,0 +1,260 @@
+"""
+DeepLabCut2.0 Toolbox
+https://github.com/AlexEMG/DeepLabCut
+A Mathis, alexander.mathis@bethgelab.org
+T Nath, nath@rowland.harvard.edu
+M Mathis, mackenzie@post.harvard.edu
+
+Low-latency pose estimation for live frames (e.g. from a camera in a closed-loop experiment).
+"""
+
+import os
+import time
+import queue
+import threading
+import numpy as np
+
+from deeplabcut.utils import auxiliaryfunctions
+
+
+class PoseStream(object):
+    """
+    Estimates the poses of frames that arrive one at a time (or in small batches), e.g. from a camera.
+
+    The frames are queued with ``push`` and processed by a background thread; the poses are returned by ``get`` (in the order of the frames),
+    passed to the callback or yielded by ``process``. The trade-off between latency and throughput is set by maxbatchsize and maxwait: the network
+    evaluates up to maxbatchsize frames at once and waits at most maxwait seconds (after the arrival of the first frame of a batch) for further frames.
+    With the defaults (maxbatchsize=1, maxwait=0) every frame is processed as soon as the network is free; frames that queued up in the meantime are
+    processed together (up to maxbatchsize frames).
+
+    The latency of a frame is the time from its arrival (push) until its pose is available, see ``latency``.
+
+    Parameters
+    ----------
+    config : string
+        Full path of the config.yaml file as a string.
+
+    shuffle: int, optional
+        An integer specifying the shuffle index of the training dataset used for training the network. The default is 1.
+
+    trainingsetindex: int, optional
+        Integer specifying which TrainingsetFraction to use. By default the first (note that TrainingFraction is a list in config.yaml).
+
+    snapshotindex: int, optional
+        Index of the snapshot (sorted by training iterations). The default is ``None``, i.e. the snapshotindex in the config.yaml file is used.
+
+    gputouse: int, optional. Natural number indicating the number of your GPU (see number in nvidia-smi). If you do not have a GPU put None.
+
+    use_exported_model: bool, optional
+        If True, the frozen graph created by ``export_model`` is loaded. The default is ``False``
+
+    maxbatchsize: int, optional
+        Maximal number of frames evaluated at once. The default is 1.
+
+    maxwait: float, optional
+        Maximal time (in seconds) to wait for further frames to fill a batch. The default is 0.
+
+    callback: function, optional
+        Called as callback(index, pose) from the processing thread as soon as the pose of a frame is available. The default is ``None``
+
+    Examples
+    --------
+    >>> stream = deeplabcut.PoseStream('/analysis/project/reaching-task/config.yaml')
+    >>> for pose in stream.process(camera_frames): # pose: x, y and likelihood of each bodypart
+    >>>     ...
+    >>> stream.close()
+    --------
+
+    """
+
+    def __init__(self,config,shuffle=1,trainingsetindex=0,snapshotindex=None,gputouse=None,use_exported_model=False,maxbatchsize=1,maxwait=0.,callback=None):
+        from deeplabcut.pose_estimation_tensorflow.nnet import predict
+        from deeplabcut.pose_estimation_tensorflow.predict_videos import LoadModelConfig
+
+        if gputouse is not None: #gpu selectinon
+            os.environ['CUDA_VISIBLE_DEVICES'] = str(gputouse)
+        if 'TF_CUDNN_USE_AUTOTUNE' in os.environ:
+            del os.environ['TF_CUDNN_USE_AUTOTUNE'] #was potentially set during training
+
+        self.cfg = auxiliaryfunctions.read_config(config)
+        trainFraction = self.cfg['TrainingFraction'][trainingsetindex]
+        self.dlc_cfg, self.DLCscorer = LoadModelConfig(self.cfg,shuffle,trainFraction,snapshotindex,use_exported_model=use_exported_model)
+        self.sess, self.inputs, self.outputs = predict.setup_pose_prediction(self.dlc_cfg)
+        self.bodyparts = list(self.dlc_cfg['all_joints_names'])
+
+        self.maxbatchsize=max(1,int(maxbatchsize))
+        self.maxwait=maxwait
+        self.callback=callback
+        self.frames=queue.Queue()
+        self.results=queue.Queue()
+        self.latencies=[]
+        self.npushed=0
+        self.error=None
+        self.worker=threading.Thread(target=self.run,daemon=True)
+        self.worker.start()
+
+    def predictbatch(self,frames):
+        from deeplabcut.pose_estimation_tensorflow.nnet import predict
+        return predict.getposeNP(np.asarray(frames),self.dlc_cfg,self.sess,self.inputs,self.outputs)
+
+    def predict(self,frame):
+        ''' Synchronously predicts the pose of a single (RGB) frame, bypassing the queue. Returns an array with x, y and likelihood of each bodypart. '''
+        return self.predictbatch([frame])[0]
+
+    def push(self,frame,arrival=None):
+        ''' Queues a (RGB) frame and returns its index. arrival is the time (time.time()) the frame was acquired, by default now. '''
+        if not self.worker.is_alive():
+            raise RuntimeError("The stream is closed.")
+        index=self.npushed
+        self.npushed+=1
+        self.frames.put((index,frame,time.time() if arrival is None else arrival))
+        return index
+
+    def get(self,timeout=None):
+        ''' Returns (index, pose) of the next processed frame; blocks at most timeout seconds (raises queue.Empty afterwards). '''
+        result=self.results.get(timeout=timeout)
+        if result is None:
+            raise self.error
+        return result
+
+    def process(self,frames):
+        ''' Generator that pushes the frames of an iterable (e.g. a camera) and yields their poses in order, as soon as they are available. '''
+        pending=0
+        for frame in frames:
+            self.push(frame)
+            pending+=1
+            while True: # yield everything that is ready, without blocking the acquisition
+                try:
+                    index,pose=self.get(timeout=0)
+                except queue.Empty:
+                    break
+                pending-=1
+                yield pose
+        while pending>0:
+            index,pose=self.get()
+            pending-=1
+            yield pose
+
+    def run(self):
+        carry=None # frame that did not fit into the previous batch (other frame size)
+        while True:
+            item=carry if carry is not None else self.frames.get()
+            carry=None
+            if item is None:
+                break
+            batch=[item]
+            deadline=item[2]+self.maxwait
+            while len(batch)<self.maxbatchsize:
+                timeout=deadline-time.time()
+                try:
+                    other=self.frames.get(timeout=timeout) if timeout>0 else self.frames.get_nowait()
+                except queue.Empty:
+                    break
+                if other is None: # stop after this batch
+                    self.frames.put(None)
+                    break
+                if np.shape(other[1])!=np.shape(item[1]):
+                    carry=other
+                    break
+                batch.append(other)
+            try:
+                poses=self.predictbatch([frame for _,frame,_ in batch])
+            except Exception as e:
+                self.error=e
+                self.results.put(None)
+                break
+            done=time.time()
+            for (index,_,arrival),pose in zip(batch,poses):
+                self.latencies.append(done-arrival)
+                if self.callback is not None:
+                    self.callback(index,pose)
+                self.results.put((index,pose))
+
+    def latency(self,percentiles=[50,90,99]):
+        ''' Returns a dictionary with the percentiles, mean and maximum of the per-frame latencies (in milliseconds) and the number of frames. '''
+        latencies=np.array(self.latencies)*1000.
+        if len(latencies)==0:
+            return {'nframes':0}
+        stats={'p%s' %p:np.percentile(latencies,p) for p in percentiles}
+        stats.update({'mean':np.mean(latencies),'max':np.max(latencies),'nframes':len(latencies)})
+        return stats
+
+    def resetlatency(self):
+        self.latencies=[]
+
+    def close(self):
+        ''' Processes the queued frames and closes the session. '''
+        if self.worker.is_alive():
+            self.frames.put(None)
+            self.worker.join()
+        self.sess.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+def stream_video(config,video,shuffle=1,trainingsetindex=0,gputouse=None,use_exported_model=False,maxbatchsize=1,maxwait=0.,realtime=True,nframes=None):
+    """
+    Replays a video through a ``PoseStream`` (at the frame rate of the video if realtime is True) to measure the latency of closed-loop pose estimation.
+    The frames are cropped according to the config.yaml file (like in analyze_videos).
+
+    Parameters
+    ----------
+    config : string
+        Full path of the config.yaml file as a string.
+
+    video : string
+        Full path of the video.
+
+    shuffle, trainingsetindex, gputouse, use_exported_model, maxbatchsize, maxwait: optional
+        See ``PoseStream``.
+
+    realtime: bool, optional
+        If True, the frames are pushed at the frame rate of the video, otherwise as fast as they can be read. The default is ``True``
+
+    nframes: int, optional
+        Number of frames to replay. The default is ``None``, i.e. the whole video.
+
+    Returns the poses (array of shape (nframes, 3 * #bodyparts)) and the latency statistics (see ``PoseStream.latency``).
+
+    Examples
+    --------
+    >>> poses, latency = deeplabcut.stream_video('/analysis/project/reaching-task/config.yaml','/analysis/project/videos/reachingvideo1.avi',nframes=1000)
+    --------
+
+    """
+    from deeplabcut.pose_estimation_tensorflow.predict_videos import GetVideoReader
+    if not os.path.isfile(video):
+        raise FileNotFoundError("Could not open the video %s" %video)
+    stream=PoseStream(config,shuffle,trainingsetindex,None,gputouse,use_exported_model,maxbatchsize,maxwait)
+    cap=GetVideoReader(video,stream.cfg) # RGB, cropped frames
+    fps=cap.get(5)
+    total=int(cap.get(7))
+    nframes=total if nframes is None else min(nframes,total)
+
+    def frames():
+        start=time.time()
+        for index in range(nframes):
+            ret,frame=cap.read()
+            if not ret:
+                break
+            if realtime: # the frame "arrives" at index / fps
+                delay=start+index/fps-time.time()
+                if delay>0:
+                    time.sleep(delay)
+            yield frame
+
+    ret,frame=cap.read() # warm up (the first evaluation is much slower, e.g. due to cuDNN autotuning)
+    if ret:
+        stream.predict(frame)
+    cap.set(1,0) # CAP_PROP_POS_FRAMES
+
+    print("Replaying %s frames of %s %s" %(nframes,video,"at %.1f fps" %fps if realtime else "as fast as possible"))
+    poses=np.array(list(stream.process(frames())))
+    cap.release()
+    stream.close()
+    latency=stream.latency()
+    print("Latency [ms]: "+", ".join("%s: %.1f" %(key,value) for key,value in latency.items() if key!='nframes'))
+    return poses,latency
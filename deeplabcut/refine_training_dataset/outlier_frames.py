@@ -14,12 +14,13 @@ import pandas as pd
 import statsmodels.api as sm
 from deeplabcut.utils import auxiliaryfunctions, visualization
 from deeplabcut.utils import frameselectiontools
+from deeplabcut.utils.videoreader import OpenVideo
 import argparse
 from tqdm import tqdm
 import matplotlib.pyplot as plt
 from skimage.util import img_as_ubyte
 
-def extract_outlier_frames(config,videos,shuffle=1,trainingsetindex=0,outlieralgorithm='jump',comparisonbodyparts='all',epsilon=20,p_bound=.01,ARdegree=3,MAdegree=1,alpha=.01,extractionalgorithm='kmeans',automatic=False,cluster_resizewidth=30,cluster_color=False,opencv=True):
+def extract_outlier_frames(config,videos,shuffle=1,trainingsetindex=0,outlieralgorithm='jump',comparisonbodyparts='all',epsilon=20,p_bound=.01,ARdegree=3,MAdegree=1,alpha=.01,extractionalgorithm='kmeans',automatic=False,cluster_resizewidth=30,cluster_color=False,opencv=True,uncertaintymeasure='second_peak_ratio'):
     """
     Extracts the outlier frames in case, the predictions are not correct for a certain video from the cropped video running from
     start to stop as defined in config.yaml.
@@ -41,11 +42,12 @@ def extract_outlier_frames(config,videos,shuffle=1,trainingsetindex=0,outlieralg
     trainingsetindex: int, optional
         Integer specifying which TrainingsetFraction to use. By default the first (note that TrainingFraction is a list in config.yaml).
 
-    outlieralgorithm: 'fitting', 'jump', or 'uncertain', optional
-        String specifying the algorithm used to detect the outliers. Currently, deeplabcut supports three methods. 'Fitting'
+    outlieralgorithm: 'fitting', 'jump', 'uncertain' or 'heatmap', optional
+        String specifying the algorithm used to detect the outliers. Currently, deeplabcut supports four methods. 'Fitting'
         fits a Auto Regressive Integrated Moving Average model to the data and computes the distance to the estimated data. Larger distances than
         epsilon are then potentially identified as outliers. The methods 'jump' identifies larger jumps than 'epsilon' in any body part; and 'uncertain'
-        looks for frames with confidence below p_bound. The default is set to ``jump``.
+        looks for frames with confidence below p_bound. 'heatmap' ranks the frames by the score map statistics saved by analyze_videos with save_uncertainty=True
+        (see uncertaintymeasure) and picks the most uncertain ones, without running the network again. The default is set to ``jump``.
 
     comparisonbodyparts: list of strings, optional
         This select the body parts for which the comparisons with the outliers are carried out. Either ``all``, then all body parts
@@ -88,6 +90,10 @@ def extract_outlier_frames(config,videos,shuffle=1,trainingsetindex=0,outlieralg
 
     opencv: bool, default: True
         Uses openCV for loading & extractiong (otherwise moviepy (legacy))
+
+    uncertaintymeasure: string, default: 'second_peak_ratio'
+        For outlieralgorithm 'heatmap': the score map statistic by which the frames are ranked, 'second_peak_ratio' (a second location with a similar score, e.g.
+        confusion with another body part or animal), 'entropy' or 'spread' (diffuse score map). The most uncertain body part of a frame determines its rank.
         
     Example
     --------
@@ -110,11 +116,13 @@ def extract_outlier_frames(config,videos,shuffle=1,trainingsetindex=0,outlieralg
       dataname = str(Path(video).stem)+scorer
       try:
           Dataframe = pd.read_hdf(os.path.join(videofolder,dataname+'.h5'))
-          nframes=np.size(Dataframe.index)
+          #the rows are indexed by frame number (if only some windows were analyzed, see frame_ranges in the metadata, the frames in between are missing)
+          framenumbers=np.asarray(Dataframe.index,dtype=int)
+          nframes=framenumbers[-1]+1 if len(framenumbers)>0 else 0
           #extract min and max index based on start stop interval.
           startindex=max([int(np.floor(nframes*cfg['start'])),0])
           stopindex=min([int(np.ceil(nframes*cfg['stop'])),nframes])
-          Index=np.arange(stopindex-startindex)+startindex
+          Index=np.flatnonzero((framenumbers>=startindex)&(framenumbers<stopindex)) # rows of the frames between start and stop
 
           #figure out body part list:
           bodyparts=auxiliaryfunctions.IntersectionofBodyPartsandOnesGivenbyUser(cfg,comparisonbodyparts)
@@ -124,15 +132,28 @@ def extract_outlier_frames(config,videos,shuffle=1,trainingsetindex=0,outlieralg
               for bpindex,bp in enumerate(bodyparts):
                   if bp in cfg['bodyparts']: #filter [who knows what users put in...]
                       p=Dataframe[scorer][bp]['likelihood'].values[Index]
-                      Indices.extend(np.where(p<p_bound)[0]+startindex) # all indices between start and stop that are below p_bound.
+                      Indices.extend(Index[p<p_bound]) # all rows between start and stop that are below p_bound.
 
           elif outlieralgorithm=='jump':
               for bpindex,bp in enumerate(bodyparts):
                   if bp in cfg['bodyparts']: #filter [who knows what users put in...]
                       dx=np.diff(Dataframe[scorer][bp]['x'].values[Index])
                       dy=np.diff(Dataframe[scorer][bp]['y'].values[Index])
-                      # all indices between start and stop with jump larger than epsilon (leading up to this point!)
-                      Indices.extend(np.where((dx**2+dy**2)>epsilon**2)[0]+startindex+1)
+                      consecutive=np.diff(framenumbers[Index])==1 # no jumps across the gaps between analyzed windows
+                      # all rows between start and stop with jump larger than epsilon (leading up to this point!)
+                      Indices.extend(Index[1:][((dx**2+dy**2)>epsilon**2) & consecutive])
+
+          elif outlieralgorithm=='heatmap':
+              if uncertaintymeasure not in auxiliaryfunctions.UNCERTAINTY_MEASURES:
+                  raise ValueError("uncertaintymeasure must be one of %s." %auxiliaryfunctions.UNCERTAINTY_MEASURES)
+              try:
+                  Uncertainty=auxiliaryfunctions.LoadUncertainty(os.path.join(videofolder,dataname+'.h5'))
+              except FileNotFoundError:
+                  print("No score map statistics found for %s. Please analyze the video with save_uncertainty=True first." %video)
+                  continue
+              bps=[bp for bp in bodyparts if bp in cfg['bodyparts']] #filter [who knows what users put in...]
+              scores=Uncertainty[scorer].xs(uncertaintymeasure,axis=1,level='measures')[bps].values.max(axis=1)[Index] # most uncertain body part per frame
+              Indices=Index[np.argsort(scores)[::-1][:cfg['numframes2pick']*2]] # the most uncertain frames between start and stop
 
           elif outlieralgorithm=='fitting':
               #deviation_dataname = str(Path(videofolder)/Path(dataname))
@@ -144,11 +165,13 @@ def extract_outlier_frames(config,videos,shuffle=1,trainingsetindex=0,outlieralg
               if len(Index)<cfg['numframes2pick']*2 and len(d)>cfg['numframes2pick']*2: # if too few points qualify, extract the most distant ones.
                   Indices=np.argsort(d)[::-1][:cfg['numframes2pick']*2]
 
-          Indices=np.sort(list(set(Indices))) #remove repetitions.
+          Indices=framenumbers[np.sort(list(set(Indices))).astype(int)] #remove repetitions and turn the rows into frame numbers.
           print("Method ", outlieralgorithm, " found ", len(Indices)," putative outlier frames.")
           print("Do you want to proceed with extracting ", cfg['numframes2pick'], " of those?")
           if outlieralgorithm=='uncertain':
               print("If this list is very large, perhaps consider changing the paramters (start, stop, p_bound, comparisonbodyparts) or use a different method.")
+          elif outlieralgorithm=='heatmap':
+              print("These are the %s most uncertain frames according to the %s of the score maps." %(len(Indices),uncertaintymeasure))
           elif outlieralgorithm=='jump':
               print("If this list is very large, perhaps consider changing the paramters (start, stop, epsilon, comparisonbodyparts) or use a different method.")
           elif outlieralgorithm=='fitting':
@@ -355,11 +378,11 @@ def ExtractFramesbasedonPreselection(Index,extractionalgorithm,Dataframe,datanam
     else:
         auxiliaryfunctions.attempttomakefolder(tmpfolder)
     
-    nframes = np.size(Dataframe.index)
+    nframes = int(Dataframe.index[-1])+1 if len(Dataframe.index)>0 else 0 # the rows are indexed by frame number (there are gaps if only some windows were analyzed)
     print("Loading video...")
     if opencv:
         import cv2
-        cap=cv2.VideoCapture(video)
+        cap=OpenVideo(video,cfg.get('video_backend','cv2'))
         fps = cap.get(5)
         duration=nframes*1./fps
         size=(int(cap.get(4)),int(cap.get(3)))
@@ -370,8 +393,15 @@ def ExtractFramesbasedonPreselection(Index,extractionalgorithm,Dataframe,datanam
         duration=clip.duration
         size=clip.size
         
-    if  cfg['cropping']:  # one might want to adjust
-        coords = (cfg['x1'],cfg['x2'],cfg['y1'], cfg['y2'])
+    try: # crop as during the analysis (e.g. per-video boxes from video_sets), so that the frames match the coordinates
+        metadata=auxiliaryfunctions.LoadVideoMetadata(os.path.join(videofolder,dataname+'.h5'))
+        cropping=metadata['data']['cropping']
+        [x1,x2,y1,y2]=metadata['data']['cropping_parameters']
+    except (FileNotFoundError,KeyError):
+        cropping=cfg['cropping']
+        x1,x2,y1,y2=cfg['x1'],cfg['x2'],cfg['y1'],cfg['y2']
+    if  cropping:  # one might want to adjust
+        coords = (x1,x2,y1,y2)
     else:
         coords = None
     
@@ -384,10 +414,10 @@ def ExtractFramesbasedonPreselection(Index,extractionalgorithm,Dataframe,datanam
             frames2pick=frameselectiontools.UniformFrames(clip,numframes2extract,start,stop,Index)
     elif extractionalgorithm=='kmeans':
         if opencv:
-            frames2pick=frameselectiontools.KmeansbasedFrameselectioncv2(cap,numframes2extract,start,stop,cfg['cropping'],coords,Index,resizewidth=cluster_resizewidth,color=cluster_color)
+            frames2pick=frameselectiontools.KmeansbasedFrameselectioncv2(cap,numframes2extract,start,stop,cropping,coords,Index,resizewidth=cluster_resizewidth,color=cluster_color)
         else:
-            if  cfg['cropping']:
-                clip = clip.crop(y1=cfg['y1'], y2=cfg['x2'], x1=cfg['x1'], x2=cfg['x2'])
+            if  cropping:
+                clip = clip.crop(y1=y1, y2=y2, x1=x1, x2=x2)
             frames2pick=frameselectiontools.KmeansbasedFrameselection(clip,numframes2extract,start,stop,Index,resizewidth=cluster_resizewidth,color=cluster_color)
     else:
         print("Please implement this method yourself!")
@@ -399,7 +429,7 @@ def ExtractFramesbasedonPreselection(Index,extractionalgorithm,Dataframe,datanam
     strwidth = int(np.ceil(np.log10(nframes))) #width for strings
     for index in frames2pick: ##tqdm(range(0,nframes,10)):
         if opencv:
-            PlottingSingleFramecv2(cap,cv2,cfg['cropping'],coords,Dataframe,bodyparts,tmpfolder,index,scorer,cfg['dotsize'],cfg['pcutoff'],cfg['alphavalue'],colors,strwidth)
+            PlottingSingleFramecv2(cap,cv2,cropping,coords,Dataframe,bodyparts,tmpfolder,index,scorer,cfg['dotsize'],cfg['pcutoff'],cfg['alphavalue'],colors,strwidth)
         else:
             PlottingSingleFrame(clip,Dataframe,bodyparts,tmpfolder,index,scorer,cfg['dotsize'],cfg['pcutoff'],cfg['alphavalue'],colors,strwidth)
         plt.close("all")
@@ -463,10 +493,10 @@ def PlottingSingleFrame(clip,Dataframe,bodyparts2plot,tmpfolder,index,scorer,dot
             plt.subplots_adjust(left=0, bottom=0, right=1, top=1, wspace=0, hspace=0)
             plt.imshow(image)
             for bpindex, bp in enumerate(bodyparts2plot):
-                if Dataframe[scorer][bp]['likelihood'].values[index] > pcutoff:
+                if Dataframe[scorer][bp]['likelihood'][index] > pcutoff:
                     plt.plot(
-                        Dataframe[scorer][bp]['x'].values[index],
-                        Dataframe[scorer][bp]['y'].values[index],'.',
+                        Dataframe[scorer][bp]['x'][index],
+                        Dataframe[scorer][bp]['y'][index],'.',
                         color=colors(bpindex),
                         ms=dotsize,
                         alpha=alphavalue)
@@ -508,10 +538,10 @@ def PlottingSingleFramecv2(cap,cv2,crop,coords,Dataframe,bodyparts2plot,tmpfolde
             plt.subplots_adjust(left=0, bottom=0, right=1, top=1, wspace=0, hspace=0)
             plt.imshow(image)
             for bpindex, bp in enumerate(bodyparts2plot):
-                if Dataframe[scorer][bp]['likelihood'].values[index] > pcutoff:
+                if Dataframe[scorer][bp]['likelihood'][index] > pcutoff:
                     plt.plot(
-                        Dataframe[scorer][bp]['x'].values[index],
-                        Dataframe[scorer][bp]['y'].values[index],'.',
+                        Dataframe[scorer][bp]['x'][index],
+                        Dataframe[scorer][bp]['y'][index],'.',
                         color=colors(bpindex),
                         ms=dotsize,
                         alpha=alphavalue)
@@ -6,7 +6,9 @@ M Mathis, mackenzie@post.harvard.edu
 
 """
 
-import os, pickle, yaml
+import os, pickle, yaml, time, math
+from collections import OrderedDict
+from contextlib import contextmanager
 import pandas as pd
 from pathlib import Path
 import numpy as np
@@ -46,6 +48,8 @@ def create_config_template():
     resnet:
     snapshotindex:
     batch_size:
+    video_backend:
+    analysis_cache_size_GB:
     \n
 # Cropping Parameters (for analysis and outlier frame detection)
     cropping:
@@ -113,23 +117,127 @@ def attempttomakefolder(foldername,recursive=False):
         else:
             os.mkdir(foldername)
 
-def SaveData(PredicteData, metadata, dataname, pdindex, imagenames,save_as_csv):
-    ''' Save predicted data as h5 file and metadata as pickle file; created by predict_videos.py '''
+def SaveData(PredicteData, metadata, dataname, pdindex, imagenames,save_as_csv,timer=None):
+    ''' Save predicted data as h5 file and metadata as pickle file; created by predict_videos.py
+    If a StageTimer is passed, the writing time is recorded (stage 'write') and the timing summary is stored in the metadata (key 'timing'). '''
+    start=time.perf_counter()
     DataMachine = pd.DataFrame(PredicteData, columns=pdindex, index=imagenames)
     DataMachine.to_hdf(dataname, 'df_with_missing', format='table', mode='w')
     if save_as_csv:
         print("Saving csv poses!")
         DataMachine.to_csv(dataname.split('.h5')[0]+'.csv')
+    if timer is not None:
+        timer.add('write',time.perf_counter()-start)
+        metadata['data']['timing']=timer.summary()
     with open(dataname.split('.h5')[0] + 'includingmetadata.pickle', 'wb') as f:
         # Pickle the 'data' dictionary using the highest protocol available.
         pickle.dump(metadata, f, pickle.HIGHEST_PROTOCOL)
 
+class StageTimer(object):
+    ''' Lightweight timer for the stages of an analysis (decoding, network evaluation, ...):
+
+    >>> timer=StageTimer()
+    >>> with timer('decode'):
+    >>>     ret, frame = cap.read()
+    >>> timer.summary()
+
+    Per stage only the number of calls, the total, minimum and maximum duration and a histogram of the durations with logarithmic bins
+    (BINS_PER_DECADE bins per decade from MIN_DURATION to MAX_DURATION seconds) are kept, so the memory does not grow with the number of calls.
+    The percentiles are interpolated within the histogram bins (relative error below 5%). A stage must only be timed by one thread at a time. '''
+    BINS_PER_DECADE=50
+    MIN_DURATION=1e-6
+    MAX_DURATION=1e4
+
+    def __init__(self):
+        self.stages=OrderedDict()
+        self.nbins=int(round(np.log10(self.MAX_DURATION/self.MIN_DURATION)*self.BINS_PER_DECADE))+2 # + underflow and overflow bin
+
+    @contextmanager
+    def __call__(self,stage):
+        start=time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage,time.perf_counter()-start)
+
+    def add(self,stage,duration):
+        stats=self.stages.get(stage)
+        if stats is None:
+            stats=self.stages[stage]={'calls':0,'total':0.,'min':duration,'max':duration,'histogram':[0]*self.nbins}
+        stats['calls']+=1
+        stats['total']+=duration
+        stats['min']=min(stats['min'],duration)
+        stats['max']=max(stats['max'],duration)
+        if duration<=self.MIN_DURATION:
+            index=0
+        else:
+            index=min(self.nbins-1,1+int(math.log10(duration/self.MIN_DURATION)*self.BINS_PER_DECADE))
+        stats['histogram'][index]+=1
+
+    def merge(self,other):
+        ''' Adds the calls of all stages of the StageTimer other (e.g. of a worker process) to this timer. '''
+        for stage,stats in other.stages.items():
+            if stage not in self.stages:
+                self.stages[stage]={key:(list(value) if key=='histogram' else value) for key,value in stats.items()}
+                continue
+            mine=self.stages[stage]
+            mine['calls']+=stats['calls']
+            mine['total']+=stats['total']
+            mine['min']=min(mine['min'],stats['min'])
+            mine['max']=max(mine['max'],stats['max'])
+            mine['histogram']=[a+b for a,b in zip(mine['histogram'],stats['histogram'])]
+
+    def percentile(self,stage,p):
+        ''' Approximate p-th percentile [s] of the durations of stage (from the histogram). '''
+        stats=self.stages[stage]
+        rank=p/100.*stats['calls']
+        cumulative=0
+        for index,count in enumerate(stats['histogram']):
+            if count>0 and cumulative+count>=rank:
+                break
+            cumulative+=count
+        if index==0:
+            value=self.MIN_DURATION
+        elif index==self.nbins-1:
+            value=stats['max']
+        else: # geometric interpolation within the bin
+            fraction=(rank-cumulative)/count
+            value=self.MIN_DURATION*10**((index-1+fraction)/self.BINS_PER_DECADE)
+        return min(max(value,stats['min']),stats['max'])
+
+    def summary(self,percentiles=[50,90,99]):
+        ''' Returns for every stage the total time [s], the number of calls and the mean, percentiles and maximum per call [ms]. '''
+        summary=OrderedDict()
+        for stage,stats in self.stages.items():
+            summary[stage]=OrderedDict([('total_s',stats['total']),('calls',stats['calls']),('mean_ms',stats['total']*1000./stats['calls'])])
+            for p in percentiles:
+                summary[stage]['p%s_ms' %p]=self.percentile(stage,p)*1000.
+            summary[stage]['max_ms']=stats['max']*1000.
+        return summary
+
 def LoadVideoMetadata(dataname):
     ''' Load meta data from analyzed video, created by predict_videos.py '''
     with open(dataname.split('.h5')[0] + 'includingmetadata.pickle', 'rb') as f: #same as in SaveData!
         metadata= pickle.load(f)
         return metadata
 
+UNCERTAINTY_MEASURES = ['second_peak_ratio', 'entropy', 'spread'] # score map statistics, see predict.scoremap_statisticsNP
+
+def GetUncertaintyFilename(dataname):
+    return dataname.split('.h5')[0] + '_uncertainty.h5'
+
+def SaveUncertainty(uncertainty, dataname, scorer, bodyparts, index):
+    ''' Saves the score map statistics (array of shape frames x bodyparts x measures, see UNCERTAINTY_MEASURES) of the analyzed video
+    dataname as float32 in <name>_uncertainty.h5 (key 'uncertainty'). Returns the file name. '''
+    columns = pd.MultiIndex.from_product([[scorer], bodyparts, UNCERTAINTY_MEASURES],names=['scorer', 'bodyparts', 'measures'])
+    uncertaintyname = GetUncertaintyFilename(dataname)
+    pd.DataFrame(uncertainty.reshape(len(uncertainty),-1).astype(np.float32), columns=columns, index=index).to_hdf(uncertaintyname, 'uncertainty', format='table', mode='w')
+    return uncertaintyname
+
+def LoadUncertainty(dataname):
+    ''' Loads the score map statistics of the analyzed video dataname (see SaveUncertainty); raises FileNotFoundError if they were not saved. '''
+    return pd.read_hdf(GetUncertaintyFilename(dataname), 'uncertainty')
+
 def SaveMetadata(metadatafilename, data, trainIndexes, testIndexes, trainFraction):
         with open(metadatafilename, 'wb') as f:
             # Pickle the 'labeled-data' dictionary using the highest protocol available.
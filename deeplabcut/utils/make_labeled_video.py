@@ -44,7 +44,8 @@ def get_cmap(n, name='hsv'):
     return plt.cm.get_cmap(name, n)
 
 def CreateVideo(clip,Dataframe,pcutoff,dotsize,colormap,DLCscorer,bodyparts2plot,cropping,x1,x2,y1,y2):
-        ''' Creating individual frames with labeled body parts and making a video'''
+        ''' Creating individual frames with labeled body parts and making a video. If the video was analyzed cropped, the frames are cropped
+        like in CreateVideoSlow (clip has to save frames of the cropped size). '''
         colorclass=plt.cm.ScalarMappable(cmap=colormap)
         C=colorclass.to_rgba(np.linspace(0,1,len(bodyparts2plot)))
         colors=(C[:,:3]*255).astype(np.uint8)
@@ -270,6 +271,9 @@ def create_labeled_video(config,videos,shuffle=1,trainingsetindex=0,videotype='a
                 cropping=metadata['data']["cropping"]
                 [x1,x2,y1,y2]=metadata['data']["cropping_parameters"]
                 print(cropping,x1,x2,y1,y2)
+                if metadata['data'].get('frame_ranges') is not None and len(Dataframe.index)>0:
+                    #only some windows were analyzed (indexed by frame number), the frames in between are not labeled
+                    Dataframe=Dataframe.reindex(range(Dataframe.index[-1]+1))
                 
                 if save_frames==True:
                     tmpfolder = os.path.join(str(videofolder),'temp-' + vname)
@@ -278,11 +282,11 @@ def create_labeled_video(config,videos,shuffle=1,trainingsetindex=0,videotype='a
                     #CreateVideoSlow(clip,Dataframe,tmpfolder,cfg["dotsize"],cfg["colormap"],cfg["alphavalue"],cfg["pcutoff"],cfg["cropping"],cfg["x1"],cfg["x2"],cfg["y1"],cfg["y2"],delete,DLCscorer,bodyparts)
                     CreateVideoSlow(clip,Dataframe,tmpfolder,cfg["dotsize"],cfg["colormap"],cfg["alphavalue"],cfg["pcutoff"],cropping,x1,x2,y1,y2,delete,DLCscorer,bodyparts)
                 else:
-                    clip = vp(fname = video,sname = os.path.join(vname + DLCscorer+'_labeled.mp4'),codec=codec)
-                    if cropping:
-                        print("Fast video creation has currently not been implemented for cropped videos. Please use 'save_frames=True' to get the video.")
+                    if cropping: #the labeled video has the size of the crop box (like with save_frames=True)
+                        clip = vp(fname = video,sname = os.path.join(vname + DLCscorer+'_labeled.mp4'),codec=codec,sw=x2-x1,sh=y2-y1)
                     else:
-                        CreateVideo(clip,Dataframe,cfg["pcutoff"],cfg["dotsize"],cfg["colormap"],DLCscorer,bodyparts,cropping,x1,x2,y1,y2) #NEED TO ADD CROPPING!
+                        clip = vp(fname = video,sname = os.path.join(vname + DLCscorer+'_labeled.mp4'),codec=codec)
+                    CreateVideo(clip,Dataframe,cfg["pcutoff"],cfg["dotsize"],cfg["colormap"],DLCscorer,bodyparts,cropping,x1,x2,y1,y2)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -17,8 +17,9 @@ class VideoProcessor(object):
     '''
     Base class for a video processing unit, 
     implementation is required for video loading and saving
+    sw, sh: size of the saved video (e.g. for cropped frames), by default the size of the loaded video
     '''
-    def __init__(self,fname='',sname='', nframes = -1, fps = 30,codec='X264'):
+    def __init__(self,fname='',sname='', nframes = -1, fps = 30,codec='X264',sw=None,sh=None):
         self.fname = fname
         self.sname = sname
         self.nframes = nframes
@@ -37,8 +38,8 @@ class VideoProcessor(object):
                 self.vid = self.get_video()
                 self.get_info()
             if self.sname != '':
-                self.sh = self.h
-                self.sw = self.w
+                self.sh = self.h if sh is None else sh
+                self.sw = self.w if sw is None else sw
                 self.svid = self.create_video()
 
         except Exception as ex:
@@ -130,7 +131,7 @@ class VideoProcessorCV(VideoProcessor):
             
     def create_video(self):
         fourcc = cv2.VideoWriter_fourcc(*self.codec)
-        return cv2.VideoWriter(self.sname,fourcc, self.FPS, (self.w,self.h),True)
+        return cv2.VideoWriter(self.sname,fourcc, self.FPS, (self.sw,self.sh),True)
     
     def _read_frame(self): #return RGB (rather than BGR)!
         #return cv2.cvtColor(np.flip(self.vid.read()[1],2), cv2.COLOR_BGR2RGB)
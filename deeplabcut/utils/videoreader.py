@@ -0,0 +1,263 @@
+"""
+DeepLabCut2.0 Toolbox
+https://github.com/AlexEMG/DeepLabCut
+A Mathis, alexander.mathis@bethgelab.org
+T Nath, nath@rowland.harvard.edu
+M Mathis, mackenzie@post.harvard.edu
+
+Video readers with the interface of cv2.VideoCapture (read, get, set, isOpened, release), which can deliver RGB and/or cropped frames.
+Two backends are available (set 'video_backend' in the config.yaml file):
+
+    cv2:    OpenCV (default)
+    ffmpeg: an ffmpeg process that decodes the video (multi-threaded), crops (and resizes, see setoutputsize) it in its filter graph and streams raw RGB (or BGR) frames
+            through a pipe directly into numpy arrays. The number of frames is determined with ffprobe. Requires ffmpeg and ffprobe on the PATH
+            (or set the environment variables DLC_FFMPEG and DLC_FFPROBE to the executables).
+"""
+
+import os
+import json
+import subprocess
+import numpy as np
+
+# property ids of cv2.VideoCapture.get/set
+CAP_PROP_POS_MSEC = 0
+CAP_PROP_POS_FRAMES = 1
+CAP_PROP_POS_AVI_RATIO = 2
+CAP_PROP_FRAME_WIDTH = 3
+CAP_PROP_FRAME_HEIGHT = 4
+CAP_PROP_FPS = 5
+CAP_PROP_FRAME_COUNT = 7
+
+
+class VideoReader(object):
+    ''' Base class of the video readers. Frames are RGB if rgb is True (else BGR, like cv2) and cropped to crop=(x1,x2,y1,y2) if given.
+    get(CAP_PROP_FRAME_WIDTH/HEIGHT) returns the size of the video (before cropping), like cv2.VideoCapture; shape is the shape of the delivered frames. '''
+    def __init__(self,video,rgb=False,crop=None):
+        self.video=video
+        self.rgb=rgb
+        self.crop=crop
+        self.size=None # output size (width, height), see setoutputsize
+
+    @property
+    def shape(self):
+        if self.size is not None:
+            return (self.size[1],self.size[0],3)
+        if self.crop is not None:
+            x1,x2,y1,y2=self.crop
+            return (y2-y1,x2-x1,3)
+        return (int(self.get(CAP_PROP_FRAME_HEIGHT)),int(self.get(CAP_PROP_FRAME_WIDTH)),3)
+
+    def read(self):
+        ''' Returns (ret, frame) like cv2.VideoCapture.read. '''
+        frame=np.empty(self.shape,dtype=np.uint8)
+        if self.readinto(frame):
+            return True,frame
+        return False,None
+
+    def readinto(self,out):
+        ''' Reads the next frame into the (uint8) array out of shape self.shape. Returns False at the end of the video. '''
+        raise NotImplementedError
+
+    def setoutputsize(self,size):
+        ''' Lets the reader resize the (cropped) frames to size (width, height; None: no resizing). Returns False if the reader does not support
+        resizing, then the frames keep their size. '''
+        return size is None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.release()
+
+class CV2VideoReader(VideoReader):
+    ''' Reader based on cv2.VideoCapture. readinto decodes into a reused buffer and crops and converts the frame in one pass into out. '''
+    def __init__(self,video,rgb=False,crop=None,threads=0):
+        import cv2
+        super(CV2VideoReader,self).__init__(video,rgb,crop)
+        self.cv2=cv2
+        self.cap=cv2.VideoCapture(video)
+        self.buffer=None # decoding buffer of readinto
+
+    def get(self,prop):
+        return self.cap.get(prop)
+
+    def set(self,prop,value):
+        return self.cap.set(prop,value)
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        ret,frame=self.cap.read()
+        if not ret:
+            return False,None
+        if self.crop is not None:
+            x1,x2,y1,y2=self.crop
+            frame=frame[y1:y2,x1:x2]
+        if self.rgb:
+            frame=self.cv2.cvtColor(frame,self.cv2.COLOR_BGR2RGB)
+        return True,frame
+
+    def readinto(self,out):
+        ret,buffer=self.cap.read(self.buffer) # cv2 decodes into the given array if it has the right size
+        if not ret:
+            return False
+        self.buffer=buffer
+        if self.crop is not None:
+            x1,x2,y1,y2=self.crop
+            buffer=buffer[y1:y2,x1:x2]
+        if not self.rgb:
+            np.copyto(out,buffer)
+        elif out.flags['C_CONTIGUOUS']:
+            self.cv2.cvtColor(buffer,self.cv2.COLOR_BGR2RGB,dst=out) # cropping and color conversion in one pass, directly into out
+        else:
+            out[...]=self.cv2.cvtColor(buffer,self.cv2.COLOR_BGR2RGB)
+        return True
+
+    def release(self):
+        self.cap.release()
+
+class FFmpegVideoReader(VideoReader):
+    ''' Reader that streams raw frames from an ffmpeg process (threads: number of decoding threads, 0 = automatic).
+    Seeking (set) restarts ffmpeg at the requested frame. Cropping and resizing (setoutputsize) are done in the filter graph of ffmpeg. '''
+    def __init__(self,video,rgb=False,crop=None,threads=0):
+        super(FFmpegVideoReader,self).__init__(video,rgb,crop)
+        self.threads=threads
+        self.ffmpeg=os.environ.get('DLC_FFMPEG','ffmpeg')
+        self.ffprobe=os.environ.get('DLC_FFPROBE','ffprobe')
+        self.proc=None
+        self.position=0
+        self.opened=False
+        if not os.path.isfile(video):
+            return
+        self.width,self.height,self.fps,self.nframes=self.probe()
+        self.opened=True
+
+    def probe(self):
+        ''' Returns width, height, frame rate and number of frames of the first video stream. '''
+        def ffprobe(entries,*args):
+            command=[self.ffprobe,'-v','error','-select_streams','v:0']+list(args)+['-show_entries','stream='+entries,'-of','json',self.video]
+            try:
+                output=subprocess.run(command,stdout=subprocess.PIPE,stderr=subprocess.PIPE,check=True).stdout
+            except FileNotFoundError:
+                raise FileNotFoundError("ffprobe was not found. Please install ffmpeg (or set video_backend: cv2 in the config.yaml file).")
+            except subprocess.CalledProcessError as e:
+                raise IOError("ffprobe could not read %s: %s" %(self.video,e.stderr.decode(errors='ignore').strip()))
+            return json.loads(output.decode())['streams'][0]
+
+        stream=ffprobe('width,height,avg_frame_rate,r_frame_rate,nb_frames')
+        fps=0.
+        for key in ('avg_frame_rate','r_frame_rate'):
+            num,_,den=str(stream.get(key,'0/0')).partition('/')
+            if float(den or 1)>0 and float(num)>0:
+                fps=float(num)/float(den or 1)
+                break
+        try:
+            nframes=int(stream['nb_frames'])
+        except (KeyError,ValueError): # not stored in the container (e.g. some avi/mkv files), count the packets
+            nframes=int(ffprobe('nb_read_packets','-count_packets')['nb_read_packets'])
+        return int(stream['width']),int(stream['height']),fps,nframes
+
+    def start(self):
+        command=[self.ffmpeg,'-v','error','-nostdin','-threads',str(self.threads)]
+        if self.position>0:
+            command+=['-ss','%.6f' %(self.position/self.fps)]
+        command+=['-i',self.video]
+        filters=[]
+        if self.crop is not None:
+            x1,x2,y1,y2=self.crop
+            filters.append('crop=%d:%d:%d:%d' %(x2-x1,y2-y1,x1,y1))
+        if self.size is not None:
+            filters.append('scale=%d:%d:flags=area' %self.size)
+        if len(filters)>0:
+            command+=['-vf',','.join(filters)]
+        command+=['-f','rawvideo','-pix_fmt','rgb24' if self.rgb else 'bgr24','-']
+        try:
+            self.proc=subprocess.Popen(command,stdout=subprocess.PIPE,stderr=subprocess.DEVNULL,bufsize=4*int(np.prod(self.shape)))
+        except FileNotFoundError:
+            raise FileNotFoundError("ffmpeg was not found. Please install ffmpeg (or set video_backend: cv2 in the config.yaml file).")
+
+    def stop(self):
+        if self.proc is not None:
+            self.proc.stdout.close()
+            self.proc.kill()
+            self.proc.wait()
+            self.proc=None
+
+    def setoutputsize(self,size):
+        size=None if size is None else (int(size[0]),int(size[1]))
+        previous,self.size=self.size,None
+        if size==(self.shape[1],self.shape[0]): # size of the cropped frames
+            size=None
+        if size!=previous:
+            self.stop() # restarts at the current position with the new filter graph
+        self.size=size
+        return True
+
+    def get(self,prop):
+        if prop==CAP_PROP_FRAME_WIDTH:
+            return self.width
+        elif prop==CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        elif prop==CAP_PROP_FPS:
+            return self.fps
+        elif prop==CAP_PROP_FRAME_COUNT:
+            return self.nframes
+        elif prop==CAP_PROP_POS_FRAMES:
+            return self.position
+        elif prop==CAP_PROP_POS_MSEC:
+            return 1000.*self.position/self.fps
+        elif prop==CAP_PROP_POS_AVI_RATIO:
+            return self.position*1./max(1,self.nframes)
+        return 0
+
+    def set(self,prop,value):
+        if prop==CAP_PROP_POS_FRAMES:
+            position=int(value)
+        elif prop==CAP_PROP_POS_MSEC:
+            position=int(round(value*self.fps/1000.))
+        elif prop==CAP_PROP_POS_AVI_RATIO:
+            position=int(round(value*self.nframes))
+        else:
+            return False
+        if position!=self.position:
+            self.stop()
+            self.position=max(0,position)
+        return True
+
+    def isOpened(self):
+        return self.opened
+
+    def readinto(self,out):
+        if not self.opened:
+            return False
+        if self.proc is None:
+            self.start()
+        if out.flags['C_CONTIGUOUS']:
+            buffer=out
+        else:
+            buffer=np.empty(self.shape,dtype=np.uint8)
+        view=memoryview(buffer).cast('B')
+        nread=0
+        while nread<len(view):
+            n=self.proc.stdout.readinto(view[nread:])
+            if not n:
+                return False
+            nread+=n
+        if buffer is not out:
+            out[...]=buffer
+        self.position+=1
+        return True
+
+    def release(self):
+        self.stop()
+        self.opened=False
+
+def OpenVideo(video,backend='cv2',rgb=False,crop=None,threads=0):
+    ''' Opens video with the reader backend ('cv2' or 'ffmpeg'). Frames are RGB if rgb is True (else BGR) and cropped to crop=(x1,x2,y1,y2) if given. '''
+    if backend is None or backend in ('cv2','opencv'):
+        return CV2VideoReader(video,rgb,crop,threads)
+    elif backend=='ffmpeg':
+        return FFmpegVideoReader(video,rgb,crop,threads)
+    else:
+        raise ValueError("Unknown video backend %s, please use 'cv2' or 'ffmpeg'." %backend)
@@ -0,0 +1,49 @@
+"""
+Checks that extract_outlier_frames selects frame numbers (not row positions) for results of analyses restricted to frame ranges,
+whose rows are indexed by the (non-contiguous) numbers of the analyzed frames.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('statsmodels')
+from deeplabcut.refine_training_dataset import outlier_frames
+from deeplabcut.utils import auxiliaryfunctions
+
+SCORER = 'DLC_resnet50_testJan1shuffle1_1000'
+BODYPARTS = ['snout', 'tail']
+FRAMES = list(range(100, 120)) + list(range(500, 510)) # two windows of the video
+
+
+@pytest.fixture
+def analyzed(tmp_path, monkeypatch):
+    ''' Results of a windowed analysis of tmp_path/video.avi, with a jump at frame 105, a low likelihood at frame 503 and a position change
+    between the windows (which is not a jump). Returns the video and the frames passed on for extraction. '''
+    x = np.ones(len(FRAMES))*50.
+    x[FRAMES.index(105)] = 80. # jump at 105 (and back at 106)
+    x[FRAMES.index(500):] = 200. # the windows differ by 150 pixels
+    likelihood = np.ones(len(FRAMES))
+    likelihood[FRAMES.index(503)] = 0.
+    columns = pd.MultiIndex.from_product([[SCORER], BODYPARTS, ['x', 'y', 'likelihood']], names=['scorer', 'bodyparts', 'coords'])
+    data = np.stack([x, np.ones(len(FRAMES))*50., likelihood]*len(BODYPARTS), axis=1)
+    video = str(tmp_path / 'video.avi')
+    dataname = str(tmp_path / ('video'+SCORER+'.h5'))
+    pd.DataFrame(data, columns=columns, index=FRAMES).to_hdf(dataname, key='df_with_missing', format='table', mode='w')
+    uncertainty = np.zeros((len(FRAMES), len(BODYPARTS), len(auxiliaryfunctions.UNCERTAINTY_MEASURES)))
+    uncertainty[FRAMES.index(507), 1, 0] = 1.
+    uncertainty[FRAMES.index(110), 0, 0] = .5
+    auxiliaryfunctions.SaveUncertainty(uncertainty, dataname, SCORER, BODYPARTS, FRAMES)
+
+    cfg = {'bodyparts': BODYPARTS, 'start': 0, 'stop': 1, 'numframes2pick': 1, 'TrainingFraction': [.95]}
+    monkeypatch.setattr(auxiliaryfunctions, 'read_config', lambda config: cfg)
+    monkeypatch.setattr(auxiliaryfunctions, 'GetScorerName', lambda cfg, shuffle, trainFraction: SCORER)
+    selected = []
+    monkeypatch.setattr(outlier_frames, 'ExtractFramesbasedonPreselection', lambda Index, *args, **kwargs: selected.append(list(Index)))
+    return video, selected
+
+@pytest.mark.parametrize('algorithm,expected', [('jump', [105, 106]), ('uncertain', [503]), ('heatmap', [507, 110])])
+def test_outlier_frames_of_frame_ranges(analyzed, algorithm, expected):
+    video, selected = analyzed
+    outlier_frames.extract_outlier_frames('config.yaml', [video], outlieralgorithm=algorithm, epsilon=20, p_bound=.01, automatic=True)
+    assert selected == [sorted(expected)]
@@ -0,0 +1,60 @@
+"""
+Checks that the vectorized pose extraction (argmax_pose_predict, argmax_pose_predictmulti) returns the same poses
+as the loops it replaced.
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+from deeplabcut.pose_estimation_tensorflow.nnet import predict
+
+
+def argmax_pose_predict_loop(scmap, offmat, stride):
+    ''' Former implementation of predict.argmax_pose_predict. '''
+    num_joints = scmap.shape[2]
+    pose = []
+    for joint_idx in range(num_joints):
+        maxloc = np.unravel_index(np.argmax(scmap[:, :, joint_idx]), scmap[:, :, joint_idx].shape)
+        offset = np.array(offmat[maxloc][joint_idx])[::-1]
+        pos_f8 = (np.array(maxloc).astype('float') * stride + 0.5 * stride + offset)
+        pose.append(np.hstack((pos_f8[::-1], [scmap[maxloc][joint_idx]])))
+    return np.array(pose)
+
+def argmax_pose_predictmulti_loop(scmap, locref, stride):
+    ''' Former pose extraction of predict.getposeNP. '''
+    batchsize, ny, nx, num_joints = scmap.shape
+    LOCREF = locref.reshape(batchsize, nx*ny, num_joints, 2)
+    MAXLOC = np.argmax(scmap.reshape(batchsize, nx*ny, num_joints), axis=1)
+    Y, X = np.unravel_index(MAXLOC, (ny, nx))
+    DZ = np.zeros((batchsize, num_joints, 3))
+    for l in range(batchsize):
+        for k in range(num_joints):
+            DZ[l, k, :2] = LOCREF[l, MAXLOC[l, k], k, :]
+            DZ[l, k, 2] = scmap[l, Y[l, k], X[l, k], k]
+    pose = np.empty((batchsize, num_joints*3))
+    pose[:, 0::3] = X.astype('float32')*stride+.5*stride+DZ[:, :, 0]
+    pose[:, 1::3] = Y.astype('float32')*stride+.5*stride+DZ[:, :, 1]
+    pose[:, 2::3] = DZ[:, :, 2]
+    return pose
+
+def random_outputs(batchsize, ny, nx, num_joints, seed, ties=False):
+    rng = np.random.RandomState(seed)
+    if ties: # several equal maxima, the first one (in row-major order) has to be picked
+        scmap = rng.randint(0, 3, (batchsize, ny, nx, num_joints)).astype('float32')/2.
+    else:
+        scmap = rng.rand(batchsize, ny, nx, num_joints).astype('float32')
+    locref = (rng.randn(batchsize, ny, nx, num_joints, 2)*5).astype('float32')
+    return scmap, locref
+
+@pytest.mark.parametrize('ny,nx,num_joints,ties', [(12, 16, 4, False), (7, 5, 1, False), (9, 11, 3, True), (1, 1, 2, False)])
+def test_argmax_pose_predict(ny, nx, num_joints, ties):
+    scmap, locref = random_outputs(1, ny, nx, num_joints, seed=ny*nx, ties=ties)
+    expected = argmax_pose_predict_loop(scmap[0], locref[0], 8.)
+    np.testing.assert_allclose(predict.argmax_pose_predict(scmap[0], locref[0], 8.), expected, rtol=0, atol=1e-5)
+
+@pytest.mark.parametrize('batchsize,ny,nx,num_joints,ties', [(4, 12, 16, 4, False), (1, 7, 5, 1, False), (3, 9, 11, 3, True), (8, 6, 6, 20, False)])
+def test_argmax_pose_predictmulti(batchsize, ny, nx, num_joints, ties):
+    scmap, locref = random_outputs(batchsize, ny, nx, num_joints, seed=batchsize+ny*nx, ties=ties)
+    expected = argmax_pose_predictmulti_loop(scmap, locref, 8.)
+    np.testing.assert_allclose(predict.argmax_pose_predictmulti(scmap, locref, 8.), expected, rtol=0, atol=1e-5)
@@ -0,0 +1,62 @@
+"""
+Checks that tiled inference (GetPoseTiled) does not detect body parts in the zero-padded part of the last tiles, when the frame size
+is not a multiple of the tile stride.
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+from easydict import EasyDict as edict
+from deeplabcut.pose_estimation_tensorflow import predict_videos
+
+STRIDE = 8
+WIDTH, HEIGHT = 150, 100 # not multiples of the tile stride (2*STRIDE)
+SPOT = (64, 40) # x, y of the (only) dark spot in the frames (a score map cell)
+
+
+class FrameReader(object):
+    ''' Minimal video reader (see utils.videoreader) that delivers nframes white frames with a gray spot. '''
+    def __init__(self, nframes):
+        self.frame = np.full((HEIGHT, WIDTH, 3), 255, dtype=np.uint8)
+        self.frame[SPOT[1]:SPOT[1]+STRIDE, SPOT[0]:SPOT[0]+STRIDE] = 128
+        self.nframes, self.position = nframes, 0
+        self.shape = self.frame.shape
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        return {3: WIDTH, 4: HEIGHT, 5: 30., 7: self.nframes}[prop]
+
+    def setoutputsize(self, size):
+        return size is None
+
+    def readinto(self, out):
+        if self.position >= self.nframes:
+            return False
+        out[...] = self.frame
+        self.position += 1
+        return True
+
+class DarknessSession(object):
+    ''' Stands in for the network: the score of a cell is its darkness, thus the (black) zero padding of a tile scores higher than the spot. '''
+    def run(self, outputs, feed_dict):
+        images = list(feed_dict.values())[0].astype(np.float32)
+        batchsize, height, width, _ = images.shape
+        rows, cols = -(-height//STRIDE), -(-width//STRIDE) # like the network, the borders are padded with zeros
+        padded = np.zeros((batchsize, rows*STRIDE, cols*STRIDE, 3), dtype=np.float32)
+        padded[:, :height, :width] = images
+        cells = padded.reshape(batchsize, rows, STRIDE, cols, STRIDE, 3).mean(axis=(2, 4, 5))
+        scmap = (1.-cells/255.)[..., None]
+        return [scmap, np.zeros(scmap.shape[:3]+(2,), dtype=np.float32)]
+
+@pytest.mark.parametrize('tilesize,overlap', [(64, 16), (48, 16), (256, 32)])
+def test_tiled_poses_stay_in_frame(tilesize, overlap):
+    cfg = {'cropping': False}
+    dlc_cfg = edict(all_joints_names=['spot'], stride=STRIDE, location_refinement=True, locref_stdev=7.2801, inference_scale=1)
+    poses, nframes = predict_videos.GetPoseTiled(cfg, dlc_cfg, DarknessSession(), None, [None, None], FrameReader(3), 3, 2, tilesize, overlap)
+    assert nframes == 3
+    np.testing.assert_allclose(poses[:, 0], SPOT[0]+STRIDE/2.)
+    np.testing.assert_allclose(poses[:, 1], SPOT[1]+STRIDE/2.)
+    np.testing.assert_allclose(poses[:, 2], 1.-128/255., rtol=1e-6)
@@ -0,0 +1,49 @@
+"""
+Checks that StageTimer keeps a fixed amount of state per stage and that its percentiles match the exact ones within the histogram resolution.
+"""
+
+import pickle
+import numpy as np
+
+from deeplabcut.utils.auxiliaryfunctions import StageTimer
+
+
+def durations(n, seed=0):
+    return np.random.RandomState(seed).lognormal(-5, 1, n)
+
+def test_summary_matches_exact_statistics():
+    d = durations(20000)
+    timer = StageTimer()
+    for duration in d:
+        timer.add('decode', duration)
+    stats = timer.summary()['decode']
+    assert stats['calls'] == len(d)
+    np.testing.assert_allclose(stats['total_s'], d.sum())
+    np.testing.assert_allclose(stats['mean_ms'], d.mean()*1000.)
+    np.testing.assert_allclose(stats['max_ms'], d.max()*1000.)
+    for p in [50, 90, 99]:
+        np.testing.assert_allclose(stats['p%s_ms' % p], np.percentile(d, p)*1000., rtol=.05)
+
+def test_memory_does_not_grow_with_calls():
+    timer = StageTimer()
+    timer.add('network', .01)
+    size = len(pickle.dumps(timer))
+    for duration in durations(50000):
+        timer.add('network', duration)
+    assert len(pickle.dumps(timer)) <= size+4*timer.nbins # (larger counts need up to 4 bytes)
+
+def test_merge():
+    d1, d2 = durations(1000, seed=1), durations(3000, seed=2)
+    merged, timer1, timer2 = StageTimer(), StageTimer(), StageTimer()
+    for duration in d1:
+        timer1.add('decode', duration)
+    for duration in d2:
+        timer2.add('decode', duration)
+    timer2.add('write', 1.)
+    merged.merge(timer1)
+    merged.merge(timer2)
+    stats = merged.summary()
+    assert list(stats) == ['decode', 'write']
+    assert stats['decode']['calls'] == len(d1)+len(d2)
+    np.testing.assert_allclose(stats['decode']['p90_ms'], np.percentile(np.concatenate([d1, d2]), 90)*1000., rtol=.05)
+    assert timer1.summary()['decode']['calls'] == len(d1) # merge does not modify the other timer
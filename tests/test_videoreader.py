@@ -0,0 +1,93 @@
+"""
+Checks that reading frames into a preallocated batch (CV2VideoReader.readinto, BatchFrameReader) decodes into a reused buffer
+and does not allocate a new frame per read, and that it delivers the same frames as cv2.VideoCapture.
+"""
+
+import tracemalloc
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+from deeplabcut.utils.videoreader import CV2VideoReader
+
+NFRAMES = 30
+WIDTH, HEIGHT = 320, 240
+CROP = (16, 272, 8, 200) # x1, x2, y1, y2
+
+
+@pytest.fixture(scope='module')
+def video(tmp_path_factory):
+    ''' Small synthetic MJPG video with blocks of random colors. '''
+    filename = str(tmp_path_factory.mktemp('video') / 'synthetic.avi')
+    writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*'MJPG'), 30, (WIDTH, HEIGHT))
+    rng = np.random.RandomState(0)
+    for _ in range(NFRAMES):
+        writer.write(rng.randint(0, 255, (HEIGHT//8, WIDTH//8, 3)).astype(np.uint8).repeat(8, axis=0).repeat(8, axis=1))
+    writer.release()
+    return filename
+
+def reference_frames(video):
+    ''' Frames of video read with cv2.VideoCapture, cropped and converted to RGB. '''
+    x1, x2, y1, y2 = CROP
+    cap = cv2.VideoCapture(video)
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2RGB))
+    cap.release()
+    return frames
+
+def traced_peak(readinto, out, nreads):
+    ''' Peak memory (bytes) allocated by python/numpy while reading nreads frames into out. '''
+    tracemalloc.start()
+    try:
+        for _ in range(nreads):
+            assert readinto(out)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def test_readinto_matches_capture(video):
+    reader = CV2VideoReader(video, rgb=True, crop=CROP)
+    out = np.empty(reader.shape, dtype=np.uint8)
+    for expected in reference_frames(video):
+        assert reader.readinto(out)
+        np.testing.assert_array_equal(out, expected)
+    assert not reader.readinto(out)
+    reader.release()
+
+def test_readinto_reuses_buffer(video):
+    reader = CV2VideoReader(video, rgb=True, crop=CROP)
+    batch = np.empty((4,)+reader.shape, dtype=np.uint8)
+    assert reader.readinto(batch[0]) # allocates the decoding buffer
+    address = reader.buffer.ctypes.data
+    peak = traced_peak(reader.readinto, batch[1], 20)
+    assert reader.buffer.ctypes.data == address
+    assert peak < batch[1].nbytes//10 # no frame sized allocation per read
+    reader.release()
+
+def test_read_allocates_frames(video):
+    ''' Reference for the measurement: read allocates (at least) one frame per call. '''
+    reader = CV2VideoReader(video, rgb=True, crop=CROP)
+    out = np.empty(reader.shape, dtype=np.uint8)
+    def readcopy(out):
+        ret, frame = reader.read()
+        out[...] = frame
+        return ret
+    assert traced_peak(readcopy, out, 20) >= out.nbytes
+    reader.release()
+
+def test_batchframereader_resize(video):
+    pytest.importorskip('tensorflow')
+    from deeplabcut.pose_estimation_tensorflow.predict_videos import BatchFrameReader
+    reader = CV2VideoReader(video, rgb=True, crop=CROP)
+    size = (128, 96) # half of the cropped size, resized from a reused buffer
+    readinto = BatchFrameReader(reader, size)
+    batch = np.empty((4, size[1], size[0], 3), dtype=np.uint8)
+    assert readinto(batch[0])
+    expected = cv2.resize(reference_frames(video)[0], size, interpolation=cv2.INTER_AREA)
+    np.testing.assert_array_equal(batch[0], expected)
+    assert traced_peak(readinto, batch[1], 20) < batch[1].nbytes//10
+    reader.release()